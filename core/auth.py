@@ -5,7 +5,7 @@ from fastapi import HTTPException, Request
 from tools.settings import settings
 
 
-def require_user(request: Request) -> dict:
+async def require_user(request: Request) -> dict:
     """require a logged-in session; short-circuit if auth is disabled"""
     if settings.DISABLE_AUTH:
         # stub user for local runs / tests
@@ -0,0 +1,90 @@
+# core/bulk_response.py
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Set
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from services.bulk import BulkProgress, run_bounded
+
+logger = logging.getLogger("authentik_helper.app")
+
+# streamed bulk runs, referenced until they finish even if their client has gone away
+_bulk_runs: Set[asyncio.Task] = set()
+
+
+def bulk_summary(results: list[dict[str, Any]]) -> Dict[str, Any]:
+    ok = sum(1 for r in results if r["ok"])
+    return {"count_ok": ok, "count_failed": len(results) - ok, "results": results}
+
+
+def _bulk_stream(
+    action: str,
+    items: list[Any],
+    one: Callable[[Any], Awaitable[dict[str, Any]]],
+    progress: BulkProgress,
+) -> StreamingResponse:
+    """one ndjson line per item as it finishes (completion order), then a summary line"""
+    landed: asyncio.Queue = asyncio.Queue()
+
+    def _landed(item: dict[str, Any]) -> None:
+        progress.item(item)
+        landed.put_nowait(item)
+
+    async def _run() -> Dict[str, Any]:
+        try:
+            return bulk_summary(await run_bounded(items, one, on_result=_landed))
+        finally:
+            progress.finish()
+            landed.put_nowait(None)
+
+    async def lines() -> AsyncIterator[str]:
+        progress.start()
+        task = asyncio.create_task(_run())
+        # a closed connection must not cancel an item halfway; the run finishes regardless
+        _bulk_runs.add(task)
+        task.add_done_callback(_bulk_runs.discard)
+        while (item := await landed.get()) is not None:
+            yield json.dumps(item, separators=(",", ":")) + "\n"
+        try:
+            out = await task
+        except Exception as e:
+            logger.warning(f"bulk_{action}_failed", extra={"error": str(e)})
+            yield json.dumps({"error": str(e)}) + "\n"
+            return
+        logger.info(
+            f"bulk_{action}_finished", extra={"ok": out["count_ok"], "failed": out["count_failed"]}
+        )
+        summary = {"done": True, "count_ok": out["count_ok"], "count_failed": out["count_failed"]}
+        yield json.dumps(summary) + "\n"
+
+    return StreamingResponse(
+        lines(), media_type="application/x-ndjson", headers={"Cache-Control": "no-store"}
+    )
+
+
+async def run_bulk(
+    action: str,
+    items: list[Any],
+    one: Callable[[Any], Awaitable[dict[str, Any]]],
+    fmt: str,
+) -> Any:
+    """run a validated bulk request, answering with the summary or streaming progress"""
+    if fmt not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be json or ndjson")
+    progress = BulkProgress(action, len(items))
+    if fmt == "ndjson":
+        return _bulk_stream(action, items, one, progress)
+    progress.start()
+    try:
+        out = bulk_summary(await run_bounded(items, one, on_result=progress.item))
+    finally:
+        progress.finish()
+    logger.info(
+        f"bulk_{action}_finished", extra={"ok": out["count_ok"], "failed": out["count_failed"]}
+    )
+    return out
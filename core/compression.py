@@ -0,0 +1,298 @@
+# core/compression.py
+from __future__ import annotations
+
+import gzip
+import importlib
+import zlib
+from types import ModuleType
+from typing import Callable, Dict, List, Optional, Tuple
+
+import anyio.to_thread
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# response types worth compressing; images, fonts and archives already are
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/manifest+json",
+    "application/xml",
+    "image/svg+xml",
+)
+# streamed to the browser as it happens; buffering inside a compressor would stall it
+_STREAMING_TYPES = ("text/event-stream",)
+
+# strongest first: when the client rates several equally, the first one here wins
+PREFERENCE = ("zstd", "br", "gzip")
+EXTENSIONS = {"zstd": ".zst", "br": ".br", "gzip": ".gz"}
+
+# bodies above this are compressed at the fastest level, on a worker thread, so one big
+# listing neither hogs a core nor stalls the event loop
+LARGE_BODY = 1 << 20
+
+
+def _optional(name: str) -> Optional[ModuleType]:
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+
+brotli = _optional("brotli")
+zstandard = _optional("zstandard")
+
+
+def compressible(content_type: str) -> bool:
+    ct = (content_type or "").split(";", 1)[0].strip().lower()
+    return bool(ct) and ct.startswith(COMPRESSIBLE_TYPES) and not ct.startswith(_STREAMING_TYPES)
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """{'gzip': 1.0, 'br': 0.5, ...}; unparsable q-values count as 0"""
+    out: Dict[str, float] = {}
+    for item in (header or "").split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        out[coding] = q
+    return out
+
+
+def negotiate(header: str, available: Tuple[str, ...]) -> Optional[str]:
+    """best coding both sides support (highest q, then PREFERENCE order), or None"""
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get("*")
+    best: Optional[str] = None
+    best_q = 0.0
+    for coding in available:
+        q = accepted.get(coding, wildcard if wildcard is not None else 0.0)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class _Stream:
+    """incremental compressor; every chunk is flushed so streamed lines arrive promptly"""
+
+    def __init__(self, chunk: Callable[[bytes], bytes], finish: Callable[[], bytes]) -> None:
+        self.chunk = chunk
+        self.finish = finish
+
+
+class Codec:
+    def __init__(
+        self,
+        name: str,
+        compress: Callable[[bytes, bool], bytes],
+        stream: Callable[[], _Stream],
+    ) -> None:
+        self.name = name
+        self.compress = compress  # (data, large) -> bytes
+        self.stream = stream
+
+
+def _gzip_codec(level: int) -> Codec:
+    def stream() -> _Stream:
+        z = zlib.compressobj(level, zlib.DEFLATED, 31)
+        return _Stream(lambda d: z.compress(d) + z.flush(zlib.Z_SYNC_FLUSH), z.flush)
+
+    return Codec(
+        "gzip",
+        lambda data, large: gzip.compress(data, 1 if large else level, mtime=0),
+        stream,
+    )
+
+
+def _brotli_codec(quality: int) -> Codec:
+    # a local the closures below can see as non-None
+    br = brotli
+    assert br is not None
+
+    def stream() -> _Stream:
+        c = br.Compressor(quality=quality)
+        return _Stream(lambda d: c.process(d) + c.flush(), c.finish)
+
+    return Codec(
+        "br",
+        lambda data, large: br.compress(data, quality=1 if large else quality),
+        stream,
+    )
+
+
+def _zstd_codec(level: int) -> Codec:
+    zs = zstandard
+    assert zs is not None
+    fast, normal = zs.ZstdCompressor(level=1), zs.ZstdCompressor(level=level)
+
+    def stream() -> _Stream:
+        c = normal.compressobj()
+        return _Stream(lambda d: c.compress(d) + c.flush(zs.COMPRESSOBJ_FLUSH_BLOCK), c.flush)
+
+    return Codec("zstd", lambda data, large: (fast if large else normal).compress(data), stream)
+
+
+def available_codecs(
+    gzip_level: int = 5, brotli_quality: int = 4, zstd_level: int = 3
+) -> Dict[str, Codec]:
+    """gzip always; br and zstd when the optional brotli / zstandard packages are installed"""
+    codecs = {"gzip": _gzip_codec(gzip_level)}
+    if brotli is not None:
+        codecs["br"] = _brotli_codec(brotli_quality)
+    if zstandard is not None:
+        codecs["zstd"] = _zstd_codec(zstd_level)
+    return codecs
+
+
+def _vary(headers: MutableHeaders) -> None:
+    vary = headers.get("vary", "")
+    if "accept-encoding" not in vary.lower():
+        headers["vary"] = f"{vary}, Accept-Encoding" if vary else "Accept-Encoding"
+
+
+def _encoded(headers: MutableHeaders, coding: str) -> None:
+    headers["content-encoding"] = coding
+    _vary(headers)
+    # a strong etag names the identity bytes; the encoded body only matches it weakly.
+    # weak tags still revalidate, since conditional checks compare them weakly
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        headers["etag"] = "W/" + etag
+
+
+def _declared(headers: MutableHeaders) -> int:
+    # content-length of a body that arrives in pieces, if the app said; unknown counts as big
+    try:
+        return int(headers.get("content-length", ""))
+    except ValueError:
+        return LARGE_BODY
+
+
+class CompressionMiddleware:
+    """compress responses with the best coding the client accepts.
+
+    bodies under minimum_size, already-encoded responses, non-text types, event
+    streams and no-transform responses pass through untouched. streamed bodies are
+    compressed chunk by chunk.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        codecs: Optional[Dict[str, Codec]] = None,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.codecs = codecs if codecs is not None else available_codecs()
+        self.order = tuple(c for c in PREFERENCE if c in self.codecs)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        coding = negotiate(Headers(scope=scope).get("accept-encoding", ""), self.order)
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _Responder(send, self.codecs[coding], self.minimum_size)
+        await self.app(scope, receive, responder)
+
+
+class _Responder:
+    def __init__(self, send: Send, codec: Codec, minimum_size: int) -> None:
+        self._send = send
+        self._codec = codec
+        self._minimum = minimum_size
+        self._start: Optional[Message] = None
+        self._mode = ""  # "", "pass" or "stream"
+        self._stream: Optional[_Stream] = None
+
+    async def _chunk(self, body: bytes) -> bytes:
+        assert self._stream is not None
+        if len(body) > LARGE_BODY:
+            return await anyio.to_thread.run_sync(self._stream.chunk, body)
+        return self._stream.chunk(body)
+
+    def _eligible(self, headers: MutableHeaders) -> bool:
+        return (
+            compressible(headers.get("content-type", ""))
+            and "content-encoding" not in headers
+            and "no-transform" not in headers.get("cache-control", "").lower()
+        )
+
+    async def __call__(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            self._start = message
+            return
+        if message["type"] != "http.response.body" or self._mode == "pass":
+            await self._send(message)
+            return
+        body: bytes = message.get("body", b"")
+        more = message.get("more_body", False)
+
+        if self._mode == "stream":
+            assert self._stream is not None
+            out = await self._chunk(body)
+            if not more:
+                out += self._stream.finish()
+            await self._send({"type": "http.response.body", "body": out, "more_body": more})
+            return
+
+        # first body message: decide
+        assert self._start is not None
+        headers = MutableHeaders(raw=self._start["headers"])
+        if not self._eligible(headers):
+            self._mode = "pass"
+        elif len(body) < self._minimum and (not more or _declared(headers) < self._minimum):
+            _vary(headers)
+            self._mode = "pass"
+        elif not more:
+            if len(body) > LARGE_BODY:
+                data = await anyio.to_thread.run_sync(self._codec.compress, body, True)
+            else:
+                data = self._codec.compress(body, False)
+            _encoded(headers, self._codec.name)
+            headers["content-length"] = str(len(data))
+            await self._send(self._start)
+            await self._send({"type": "http.response.body", "body": data})
+            return
+        else:
+            self._mode = "stream"
+            self._stream = self._codec.stream()
+            _encoded(headers, self._codec.name)
+            if "content-length" in headers:
+                del headers["content-length"]
+            await self._send(self._start)
+            await self._send(
+                {"type": "http.response.body", "body": await self._chunk(body), "more_body": True}
+            )
+            return
+        await self._send(self._start)
+        await self._send(message)
+
+
+def precompressed_variants() -> List[Tuple[str, str]]:
+    """(coding, file extension) pairs this process can write, strongest first"""
+    codecs = available_codecs()
+    return [(c, EXTENSIONS[c]) for c in PREFERENCE if c in codecs]
+
+
+def compress_file_bytes(coding: str, data: bytes) -> bytes:
+    """maximum-effort compression for build-time assets (cpu is not a concern there)"""
+    if coding == "gzip":
+        return gzip.compress(data, 9, mtime=0)
+    if coding == "br" and brotli is not None:
+        return brotli.compress(data, quality=11)
+    if coding == "zstd" and zstandard is not None:
+        return zstandard.ZstdCompressor(level=19).compress(data)
+    raise ValueError(f"unsupported coding: {coding}")
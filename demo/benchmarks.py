@@ -0,0 +1,508 @@
+# demo/benchmarks.py
+# Rough latency comparisons against the in-process mock Authentik.
+#
+#   python -m demo.benchmarks lookups --latency-ms 5 --concurrency 1 10 25
+#   python -m demo.benchmarks listing
+#   python -m demo.benchmarks bulk --latency-ms 20 --concurrency 1 8 16
+#   python -m demo.benchmarks smtp --rtt-ms 20 --count 200
+#   python -m demo.benchmarks render --count 1000
+#   python -m demo.benchmarks search --users 100000
+#   python -m demo.benchmarks page --users 50000
+#   python -m demo.benchmarks stream --users 50000
+
+from __future__ import annotations
+import argparse
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+import httpx
+
+import demo.mock_authentik as mock
+
+# the transport never leaves the process; settings only need to validate
+for _k, _v in {
+    "AK_BASE_URL": "http://mock-authentik.test",
+    "AK_TOKEN": "bench",
+    "AK_GUESTS_GROUP_UUID": mock.guests_uuid,
+    "AK_MEMBERS_GROUP_UUID": mock.members_uuid,
+    "SESSION_SECRET": "bench",
+    "DISABLE_AUTH": "true",
+    "LOG_LEVEL": "WARNING",
+}.items():
+    os.environ.setdefault(_k, _v)
+
+from services.authentik import AsyncAuthentikClient  # noqa: E402
+from tools.settings import settings  # noqa: E402
+
+
+def _client() -> AsyncAuthentikClient:
+    return AsyncAuthentikClient(transport=httpx.ASGITransport(app=mock.app))
+
+
+async def _timed(fn: Callable[..., Awaitable[Any]], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        await fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+async def bench_lookups(latency_ms: float, levels: List[int], repeat: int) -> List[Dict]:
+    """pk-only group listing: serial get_user vs bounded concurrent fan-out"""
+    mock.LATENCY_MS = latency_ms
+    mock.PK_ONLY_GROUPS = True
+    rows = []
+    for level in levels:
+        settings.AK_LOOKUP_CONCURRENCY = level
+        c = _client()
+        out: Dict = {}
+
+        async def _run() -> None:
+            out.update(await c.list_group_users_embedded(mock.guests_uuid))
+
+        secs = await _timed(_run, repeat)
+        await c.aclose()
+        rows.append(
+            {
+                "label": f"concurrency={level}",
+                "users": len(out.get("users", [])),
+                "failed": len(out.get("failed", [])),
+                "seconds": secs,
+            }
+        )
+    return rows
+
+
+async def bench_listing(latency_ms: float, repeat: int) -> List[Dict]:
+    """group listing: cold fetch vs membership cache hit"""
+    from services.membership_cache import membership_cache
+
+    mock.LATENCY_MS = latency_ms
+    c = _client()
+    rows = []
+    for label, warm in (("cold", False), ("cached", True)):
+
+        async def _run() -> None:
+            if not warm:
+                membership_cache.invalidate()
+            await c.list_group_users(mock.guests_uuid)
+
+        await _run()
+        rows.append({"label": label, "seconds": await _timed(_run, repeat)})
+    await c.aclose()
+    return rows
+
+
+async def bench_bulk(latency_ms: float, levels: List[int], count: int) -> List[Dict]:
+    """POST /promote/bulk through the helper app at different BULK_CONCURRENCY levels"""
+    import services.authentik as svc
+    from web.app_factory import create_app
+
+    mock.LATENCY_MS = latency_ms
+    # route the web client's calls into the mock instead of the network
+    svc.aak._transport = httpx.ASGITransport(app=mock.app)
+    svc.aak._session = None
+    helper = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=create_app("bench")), base_url="http://localhost"
+    )
+    guests = [u.pk for u in mock.users.values() if mock.guests_uuid in u.groups][:count]
+    rows = []
+    for level in levels:
+        settings.BULK_CONCURRENCY = level
+        t0 = time.perf_counter()
+        r = await helper.post("/promote/bulk", json={"pks": guests, "send_mail": False})
+        secs = time.perf_counter() - t0
+        body = r.json()
+        rows.append(
+            {
+                "label": f"concurrency={level}",
+                "ok": body.get("count_ok"),
+                "failed": body.get("count_failed"),
+                "seconds": secs,
+            }
+        )
+        # put everyone back for the next round (not timed)
+        await helper.post("/demote/bulk", json={"pks": guests})
+    await helper.aclose()
+    await svc.aak.aclose()
+    return rows
+
+
+def _grow_directory(count: int) -> List[str]:
+    """replace the mock's users with `count` synthetic ones; returns their names"""
+    import random
+    import uuid
+
+    rnd = random.Random(7)
+    first = list({mock.fake.first_name() for _ in range(3000)})
+    last = list({mock.fake.last_name() for _ in range(3000)})
+    mock.users.clear()
+    names = []
+    for pk in range(1, count + 1):
+        f, l = rnd.choice(first), rnd.choice(last)
+        username = f"{f[0]}{l}{pk}".lower()
+        mock.users[pk] = mock.User(
+            pk=pk,
+            uuid=str(uuid.uuid4()),
+            username=username,
+            name=f"{f} {l}",
+            email=f"{username}@example.test",
+            groups=[mock.guests_uuid],
+            last_updated="2026-01-01T00:00:00Z",
+        )
+        names.append(f"{f} {l}")
+    return names
+
+
+async def bench_search(count: int, queries: int, latency_ms: float) -> List[Dict]:
+    """typeahead: every keystroke to authentik vs the search cache vs the local user index"""
+    import random
+
+    from services.user_index import UserIndex, sync_full
+
+    names = _grow_directory(count)
+    rnd = random.Random(11)
+    # each sampled name is typed one key at a time, starting at 2 characters
+    typed = [
+        n[:i] for n in rnd.sample(names, queries) for i in range(2, len(n) + 1) if n[i - 1] != " "
+    ]
+    mock.LATENCY_MS = latency_ms
+    c = _client()
+    rows = []
+
+    from services.search_cache import search_cache
+
+    upstream = typed[: max(1, len(typed) // 20)]  # a linear scan per call; sample it
+    sent = []
+    real_get = c._get
+
+    async def counting_get(path, _op="search", **params):
+        sent.append(params.get("search"))
+        return await real_get(path, _op, **params)
+
+    c._get = counting_get  # type: ignore[method-assign]
+    for label, cache_size in (("upstream", 0), ("search-cache", 256)):
+        settings.AK_SEARCH_CACHE_SIZE = cache_size
+        search_cache.invalidate()
+        sent.clear()
+        t0 = time.perf_counter()
+        for q in upstream:
+            await c.search_users(q)
+        rows.append(
+            {
+                "label": label,
+                "queries": len(upstream),
+                "upstream": len(sent),
+                "seconds": (time.perf_counter() - t0) / len(upstream),
+            }
+        )
+
+    idx = UserIndex()
+    mock.LATENCY_MS = 0
+    t0 = time.perf_counter()
+    await sync_full(c, idx)
+    build = time.perf_counter() - t0
+    timings = []
+    for q in typed:
+        t1 = time.perf_counter()
+        idx.search(q)
+        timings.append(time.perf_counter() - t1)
+    timings.sort()
+    rows.append(
+        {
+            "label": "index",
+            "queries": len(typed),
+            "p99_ms": round(timings[int(len(timings) * 0.99)] * 1000, 2),
+            "max_ms": round(timings[-1] * 1000, 2),
+            "sync_s": round(build, 1),
+            "seconds": sum(timings) / len(timings),
+        }
+    )
+    await c.aclose()
+    return rows
+
+
+def bench_smtp(rtt_ms: float, count: int) -> List[Dict]:
+    """promotion mail: a fresh smtp session per message vs the pooled session"""
+    import smtplib
+
+    import tools.mailer as mailer
+
+    delay = rtt_ms / 1000.0
+    opened = []
+
+    class SlowSMTP:
+        # connect, ehlo, starttls, ehlo, login each cost a round trip; so does a send
+        def __init__(self, host, port, timeout=30):
+            opened.append(1)
+            time.sleep(delay)
+
+        def ehlo(self):
+            time.sleep(delay)
+
+        def starttls(self):
+            time.sleep(delay * 2)  # tls handshake
+
+        def login(self, user, pwd):
+            time.sleep(delay)
+
+        def noop(self):
+            time.sleep(delay)
+            return (250, b"ok")
+
+        def sendmail(self, from_addr, rcpts, msg):
+            time.sleep(delay * 3)  # MAIL FROM, RCPT TO, DATA (pipelining off)
+
+        def quit(self):
+            pass
+
+    smtplib.SMTP = SlowSMTP  # type: ignore[misc]
+    settings.SMTP_HOST, settings.SMTP_PORT, settings.SMTP_FROM = "smtp.bench", 587, "b@x.test"
+    msgs = [(f"u{i}@example.test", "hi", "<p>hi</p>") for i in range(count)]
+    rows = []
+    for label, per_session in (("fresh-per-msg", 1), ("pooled", 100)):
+        settings.SMTP_SESSION_MAX_MESSAGES = per_session
+        mailer.smtp_pool.close_all()
+        opened.clear()
+        t0 = time.perf_counter()
+        ok = sum(mailer.send_many(msgs))
+        rows.append(
+            {
+                "label": label,
+                "sent": ok,
+                "sessions": len(opened),
+                "seconds": time.perf_counter() - t0,
+            }
+        )
+    return rows
+
+
+def bench_render(count: int) -> List[Dict]:
+    """invitation mail: full jinja render + MIME build per message vs the compiled email"""
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+
+    from tools.email_render import _text_env, _templates, compiled_email
+
+    shared = {"org_name": "Bench", "external_url": None, "footer": "f", "brand_logo": "/l.png"}
+    people = [
+        {
+            "name": f"User {i}",
+            "invite_url": f"https://ak/if/flow?itoken={i}",
+            "expires_friendly": "soon",
+        }
+        for i in range(count)
+    ]
+
+    def per_message() -> int:
+        size = 0
+        for i, p in enumerate(people):
+            html = _templates.env.get_template("invitation_email.html").render(**shared, **p)
+            text = _text_env.get_template("invitation_email.txt").render(**shared, **p)
+            msg = MIMEMultipart("alternative")
+            msg["Subject"], msg["From"], msg["To"] = "hi", "b@x.test", f"u{i}@example.test"
+            msg.attach(MIMEText(text, "plain", "utf-8"))
+            msg.attach(MIMEText(html, "html", "utf-8"))
+            size += len(msg.as_bytes())
+        return size
+
+    def compiled() -> int:
+        c = compiled_email("invitation", shared, "hi")
+        return sum(len(c.render("b@x.test", f"u{i}@example.test", p)) for i, p in enumerate(people))
+
+    rows = []
+    for label, fn in (("per-message", per_message), ("compiled", compiled)):
+        t0 = time.perf_counter()
+        size = fn()
+        rows.append({"label": label, "kb": size // 1024, "seconds": time.perf_counter() - t0})
+    return rows
+
+
+async def bench_page(count: int, repeat: int) -> List[Dict]:
+    """guest table: the whole cached group as json vs one filtered, sorted page"""
+    import json
+
+    mock.LATENCY_MS = 0
+    _grow_directory(count)
+    c = _client()
+
+    async def full() -> str:
+        return json.dumps(await c.list_group_users(mock.guests_uuid))
+
+    async def page() -> str:
+        out = await c.list_group_page(mock.guests_uuid, q="smith", sort="-email", page=3)
+        return json.dumps(out)
+
+    await full()  # fill the membership cache; both rows then run from memory
+    rows = []
+    for label, fn in (("full", full), ("page", page)):
+        body = await fn()
+        rows.append({"label": label, "kb": len(body) // 1024, "seconds": await _timed(fn, repeat)})
+    await c.aclose()
+    return rows
+
+
+async def bench_stream(count: int, latency_ms: float) -> List[Dict]:
+    """whole group: list_group_users vs the ndjson stream; first row, total and peak memory"""
+    import json
+    import tracemalloc
+
+    from services.membership_cache import membership_cache
+
+    mock.LATENCY_MS = latency_ms
+    _grow_directory(count)
+    c = _client()
+
+    async def listing() -> float:
+        out = await c.list_group_users(mock.guests_uuid)
+        json.dumps(out)  # what the route does before the first byte goes out
+        return 0.0
+
+    async def stream() -> float:
+        t0 = time.perf_counter()
+        first = 0.0
+        _, pages = await c.open_group_stream(mock.guests_uuid)
+        async for rows in pages:
+            "".join(json.dumps(u) + "\n" for u in rows)
+            first = first or time.perf_counter() - t0
+        return first
+
+    rows = []
+    for label, fn in (("dict", listing), ("ndjson", stream)):
+        membership_cache.invalidate()
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        first = await fn()
+        total = time.perf_counter() - t0
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        rows.append(
+            {
+                "label": label,
+                "first_ms": round((first or total) * 1000),
+                "peak_mb": round(peak / 2**20, 1),
+                "seconds": total,
+            }
+        )
+    await c.aclose()
+    return rows
+
+
+async def bench_delta(count: int, page_size: int) -> List[Dict]:
+    """refresh after one promote: reload both table pages vs the since/have refresh"""
+    import json
+
+    import routers.users as users_router
+
+    mock.LATENCY_MS = 0
+    _grow_directory(count)
+    c = _client()
+    users_router.aak = c  # the routes' client; this process only runs the benchmark
+    g, m = mock.guests_uuid, mock.members_uuid
+
+    async def table(group: str, **kw: Any) -> Dict:
+        return await users_router._group_users(group, 1, page_size, None, "pk", "json", **kw)
+
+    shown = {grp: await table(grp) for grp in (g, m)}
+    await c.list_group_users(g)
+    await c.switch_group_user_pk(g, m, shown[g]["users"][0]["pk"])
+    for grp in (g, m):
+        await table(grp)  # rebuild the views once; every row then runs from memory
+
+    async def reload() -> str:
+        return json.dumps([await table(g), await table(m)])
+
+    async def refresh() -> str:
+        out = []
+        for grp in (g, m):
+            have = ",".join(str(u["pk"]) for u in shown[grp]["users"])
+            out.append(await table(grp, since=shown[grp]["version"], have=have))
+        return json.dumps(out)
+
+    async def whole() -> str:
+        return json.dumps(await c.list_group_users(g))
+
+    async def since() -> str:
+        return json.dumps(users_router._delta(g, shown[g]["version"]))
+
+    rows = []
+    for label, fn in (
+        ("pages", reload),
+        ("pages+have", refresh),
+        ("group", whole),
+        ("since", since),
+    ):
+        t0 = time.perf_counter()
+        body = await fn()
+        rows.append({"label": label, "bytes": len(body), "seconds": time.perf_counter() - t0})
+    await c.aclose()
+    return rows
+
+
+def _print(rows: List[Dict]) -> None:
+    base = rows[0]["seconds"] or 1e-9
+    for r in rows:
+        extra = " ".join(f"{k}={v}" for k, v in r.items() if k not in ("label", "seconds"))
+        secs = r["seconds"] or 1e-9
+        print(f"{r['label']:<16} {extra:<20} {secs * 1000:10.3f}ms  x{base / secs:.1f}")
+
+
+def main(argv: List[str] | None = None) -> None:
+    p = argparse.ArgumentParser(prog="demo.benchmarks")
+    sub = p.add_subparsers(dest="bench", required=True)
+    lk = sub.add_parser("lookups", help="pk-only group listing fan-out")
+    lk.add_argument("--latency-ms", type=float, default=5.0)
+    lk.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 25])
+    lk.add_argument("--repeat", type=int, default=1)
+    ls = sub.add_parser("listing", help="group listing with and without the membership cache")
+    ls.add_argument("--latency-ms", type=float, default=5.0)
+    ls.add_argument("--repeat", type=int, default=5)
+    bk = sub.add_parser("bulk", help="/promote/bulk at different BULK_CONCURRENCY levels")
+    bk.add_argument("--latency-ms", type=float, default=5.0)
+    bk.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 16])
+    bk.add_argument("--count", type=int, default=200)
+    sm = sub.add_parser("smtp", help="promotion mail with and without session reuse")
+    sm.add_argument("--rtt-ms", type=float, default=20.0)
+    sm.add_argument("--count", type=int, default=200)
+    rd = sub.add_parser("render", help="invitation rendering: per message vs compiled")
+    rd.add_argument("--count", type=int, default=1000)
+    se = sub.add_parser("search", help="typeahead: upstream search vs the local user index")
+    se.add_argument("--users", type=int, default=100_000)
+    se.add_argument("--queries", type=int, default=200, help="names typed key by key")
+    se.add_argument("--latency-ms", type=float, default=5.0)
+    pg = sub.add_parser("page", help="group table: whole listing vs one server-side page")
+    pg.add_argument("--users", type=int, default=50_000)
+    pg.add_argument("--repeat", type=int, default=5)
+    st = sub.add_parser("stream", help="whole group: json listing vs ndjson stream")
+    st.add_argument("--users", type=int, default=50_000)
+    st.add_argument("--latency-ms", type=float, default=5.0)
+    dl = sub.add_parser("delta", help="table refresh after a promote: full pages vs deltas")
+    dl.add_argument("--users", type=int, default=50_000)
+    dl.add_argument("--page-size", type=int, default=50)
+    args = p.parse_args(argv)
+
+    if args.bench == "lookups":
+        _print(asyncio.run(bench_lookups(args.latency_ms, args.concurrency, args.repeat)))
+    elif args.bench == "listing":
+        _print(asyncio.run(bench_listing(args.latency_ms, args.repeat)))
+    elif args.bench == "bulk":
+        _print(asyncio.run(bench_bulk(args.latency_ms, args.concurrency, args.count)))
+    elif args.bench == "smtp":
+        _print(bench_smtp(args.rtt_ms, args.count))
+    elif args.bench == "search":
+        _print(asyncio.run(bench_search(args.users, args.queries, args.latency_ms)))
+    elif args.bench == "render":
+        _print(bench_render(args.count))
+    elif args.bench == "page":
+        _print(asyncio.run(bench_page(args.users, args.repeat)))
+    elif args.bench == "stream":
+        _print(asyncio.run(bench_stream(args.users, args.latency_ms)))
+    elif args.bench == "delta":
+        _print(asyncio.run(bench_delta(args.users, args.page_size)))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,14 @@
 # Minimal fake Authentik-like API for demos/screenshots.
 
 from __future__ import annotations
+import asyncio
+import os
 import random
 import uuid
 from typing import Dict, List, Optional
 from datetime import datetime, timedelta, timezone
 
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request
 from pydantic import BaseModel
 from faker import Faker
 
@@ -24,6 +26,7 @@ class User(BaseModel):
     email: str
     is_active: bool = True
     groups: List[str] = []
+    last_updated: str = ""
 
 
 class Group(BaseModel):
@@ -36,6 +39,10 @@ class Group(BaseModel):
 NUM_USERS = 1200
 START_PK = 1
 
+# knobs for benchmarks: per-request latency, and the older pk-only group shape
+LATENCY_MS = float(os.getenv("MOCK_AK_LATENCY_MS", "0") or 0)
+PK_ONLY_GROUPS = os.getenv("MOCK_AK_PK_ONLY_GROUPS", "").lower() in ("1", "true", "yes")
+
 groups: Dict[str, Group] = {}
 users: Dict[int, User] = {}
 
@@ -52,10 +59,23 @@ for i in range(START_PK, START_PK + NUM_USERS):
     email = f"{username}@example.test"
     g = [members_uuid] if random.random() < 0.30 else [guests_uuid]
     users[i] = User(
-        pk=i, uuid=str(uuid.uuid4()), username=username, name=name, email=email, groups=g
+        pk=i,
+        uuid=str(uuid.uuid4()),
+        username=username,
+        name=name,
+        email=email,
+        groups=g,
+        last_updated=datetime.now(timezone.utc).isoformat(),
     )
 
 
+@app.middleware("http")
+async def simulated_latency(request: Request, call_next):
+    if LATENCY_MS > 0:
+        await asyncio.sleep(LATENCY_MS / 1000.0)
+    return await call_next(request)
+
+
 # helpers
 def find_user_by_pk(pk: int) -> User:
     u = users.get(pk)
@@ -94,7 +114,10 @@ async def group_detail(group_uuid: str, include_users: Optional[bool] = False):
     g = groups[group_uuid].model_dump()
     if include_users:
         members = [u for u in users.values() if group_uuid in u.groups]
-        g["users_obj"] = [u.model_dump() for u in members]
+        if PK_ONLY_GROUPS:
+            g["users"] = [u.pk for u in members]
+        else:
+            g["users_obj"] = [u.model_dump() for u in members]
     return g
 
 
@@ -137,11 +160,51 @@ async def remove_user_from_group(target_group_uuid: str, payload: Dict):
 
 # users
 @app.get("/api/v3/core/users/")
-async def list_users(limit: int = 50, offset: int = 0):
+async def list_users(
+    limit: int = 50,
+    offset: int = 0,
+    page: Optional[int] = None,
+    page_size: int = 100,
+    groups_by_pk: Optional[str] = None,
+    search: Optional[str] = None,
+    ordering: Optional[str] = None,
+    last_updated__gt: Optional[str] = None,
+):
     all_users = list(users.values())
+    if last_updated__gt:
+        all_users = [u for u in all_users if u.last_updated > last_updated__gt]
+    if groups_by_pk:
+        all_users = [u for u in all_users if groups_by_pk in u.groups]
+    if search:
+        ql = search.lower()
+        all_users = [
+            u
+            for u in all_users
+            if ql in u.name.lower() or ql in u.username.lower() or ql in u.email.lower()
+        ]
+    if ordering == "pk":
+        all_users.sort(key=lambda u: u.pk)
+    elif ordering == "-last_updated":
+        all_users.sort(key=lambda u: u.last_updated, reverse=True)
+    if page is None and not groups_by_pk and not search:
+        # legacy limit/offset shape
+        return {
+            "count": len(all_users),
+            "results": [u.model_dump() for u in all_users[offset : offset + limit]],
+        }
+    # authentik-style page pagination
+    page = max(1, page or 1)
+    start = (page - 1) * page_size
+    total_pages = max(1, -(-len(all_users) // page_size))
     return {
-        "count": len(all_users),
-        "results": [u.model_dump() for u in all_users[offset : offset + limit]],
+        "pagination": {
+            "next": page + 1 if page < total_pages else 0,
+            "previous": page - 1 if page > 1 else 0,
+            "count": len(all_users),
+            "current": page,
+            "total_pages": total_pages,
+        },
+        "results": [u.model_dump() for u in all_users[start : start + page_size]],
     }
 
 
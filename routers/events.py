@@ -0,0 +1,61 @@
+# routers/events.py
+from __future__ import annotations
+
+import json
+import logging
+from typing import AsyncIterator, Optional
+
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import StreamingResponse
+
+from tools.settings import settings
+from core.auth import require_user
+from services.events import Subscription, events
+
+logger = logging.getLogger("authentik_helper.app")
+
+router = APIRouter(dependencies=[Depends(require_user)])
+
+# how long the browser waits before reconnecting after the stream ends
+RETRY_MS = 3000
+
+
+async def event_stream(sub: Subscription, resumed: bool) -> AsyncIterator[str]:
+    """frames for one client: a hello, then events as they come and heartbeats between"""
+    hello = {
+        "resumed": resumed,
+        "groups": {
+            "guest": settings.AK_GUESTS_GROUP_UUID,
+            "members": settings.AK_MEMBERS_GROUP_UUID,
+        },
+    }
+    # no id: the hello must not move the client's Last-Event-ID
+    yield f"retry: {RETRY_MS}\nevent: hello\ndata: {json.dumps(hello)}\n\n"
+    try:
+        while True:
+            batch = await sub.next_batch(settings.EVENTS_HEARTBEAT)
+            if batch:
+                yield "".join(events.format(e) for e in batch)
+            elif sub.lagged:
+                # too far behind; the client reconnects and resumes from the buffer
+                logger.info("events_client_lagged", extra={"count": events.subscribers})
+                return
+            else:
+                yield ": ping\n\n"
+    finally:
+        events.unsubscribe(sub)
+
+
+@router.get("/events")
+async def stream_events(request: Request, last_event_id: Optional[str] = None):
+    """server-sent events: membership changes, bulk progress and new invites"""
+    # EventSource sends Last-Event-ID on reconnects; the query form is for a first connect
+    resume_from = request.headers.get("last-event-id") or last_event_id
+    sub, resumed = events.subscribe(resume_from)
+    if resume_from and not resumed:
+        logger.info("events_resume_missed", extra={"count": events.subscribers})
+    return StreamingResponse(
+        event_stream(sub, resumed),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"},
+    )
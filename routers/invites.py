@@ -1,16 +1,19 @@
 # routers/invites.py
 from __future__ import annotations
 
+import json
 import logging
-from typing import Any, Dict
-
-from fastapi import APIRouter, Body, Depends
+from typing import Any, Dict, List, Optional
 
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request
+from tools.mail_queue import mail_queue
 from tools.mailer import send_invitation_email
 from tools.settings import settings
 from core.auth import require_user
-from core.utils import redact_email
-from services.authentik import ak
+from core.bulk_response import run_bulk
+from services.authentik import aak
+from services.events import events
+from services.invite_rows import invite_fields, plan_rows, read_csv
 
 logger = logging.getLogger("authentik_helper.app")
 
@@ -18,12 +21,49 @@ logger = logging.getLogger("authentik_helper.app")
 router = APIRouter(dependencies=[Depends(require_user)])
 
 
+async def _create_invite(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """create the invitation and, when there is an address, queue its email"""
+    inv = await aak.create_invitation(**fields)
+
+    invite_url = inv.get("invite_url") or ""
+    email = fields["email"]
+
+    # mail goes through the delivery queue; its state is at GET /mail/{mail_id}
+    if email and invite_url:
+        inv["mail_id"] = mail_queue.submit(
+            "invitation",
+            send_invitation_email,
+            email,
+            name=fields["name"],
+            invite_url=invite_url,
+            expires_friendly=inv.get("expires_friendly") or "",
+            org_name=settings.ORGANIZATION_NAME,
+            external_url=settings.EXTERNAL_BASE_URL,
+            footer=settings.EMAIL_FOOTER,
+        )
+    return inv
+
+
+def _publish_invite(fields: Dict[str, Any], inv: Dict[str, Any]) -> None:
+    # other admins see who was invited; the invite link itself stays with the creator
+    events.publish(
+        "invite",
+        {
+            "name": fields["name"],
+            "username": fields["username"],
+            "expires": inv.get("expires"),
+            "expires_friendly": inv.get("expires_friendly") or "",
+            "mailed": "mail_id" in inv,
+        },
+    )
+
+
 @router.post("/invites")
-def post_invite(payload: Dict[str, Any] = Body(...)):
+async def post_invite(payload: Dict[str, Any] = Body(...)):
     """
     create an invitation via authentik and optionally send an email.
     - 'name', 'username', and 'email' are optional.
-    - if 'email' is present and an invite url is returned, an email is sent.
+    - if 'email' is present and an invite url is returned, an email is queued.
     """
     logger.info(
         "invites_create_requested",
@@ -34,52 +74,104 @@ def post_invite(payload: Dict[str, Any] = Body(...)):
         },
     )
 
-    raw_name = (payload.get("name") or "").strip()
-    raw_username = (payload.get("username") or "").strip()
-    email = (payload.get("email") or "").strip().lower()
+    fields = invite_fields(payload)
+    inv = await _create_invite(fields)
+    _publish_invite(fields, inv)
+    return inv
 
-    # default username: prefer explicit username, then name, then local part of email
-    username = (
-        raw_username or raw_name or (email.split("@", 1)[0] if email and "@" in email else "")
-    )
-    name = raw_name or username
-
-    flow_override = (payload.get("flow") or "").strip()
-    single_use = bool(payload.get("single_use", True))
-    expires_days = payload.get("expires_days")
-
-    inv = ak.create_invitation(
-        name=name,
-        username=username,
-        email=email,
-        single_use=single_use,
-        expires_days=(int(expires_days) if isinstance(expires_days, (int, float)) else None),
-        flow_slug=flow_override or None,
-    )
 
-    invite_url = inv.get("invite_url") or ""
-    expires_friendly = inv.get("expires_friendly") or ""
+def _csv_rows(text: str) -> List[Dict[str, Any]]:
+    try:
+        return read_csv(text)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    # mail is best-effort: log and continue on failure
+
+async def _bulk_payload(request: Request) -> tuple[List[Any], Dict[str, Any]]:
+    """(rows, defaults) from a json array, a json {"rows": [...]} object or a csv body"""
+    ctype = request.headers.get("content-type", "").split(";", 1)[0].strip().lower()
+    body = await request.body()
+    try:
+        text = body.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="body must be utf-8")
+
+    if ctype in ("text/csv", "application/csv"):
+        return _csv_rows(text), {}
+    if ctype != "application/json":
+        raise HTTPException(status_code=415, detail="send application/json or text/csv")
+    try:
+        data = json.loads(text)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="body is not valid json")
+    if isinstance(data, dict):
+        defaults = {k: data[k] for k in ("single_use", "expires_days", "flow") if k in data}
+        data = data.get("rows")
+    else:
+        defaults = {}
+    if not isinstance(data, list):
+        raise HTTPException(status_code=400, detail="rows must be an array")
+    return data, defaults
+
+
+async def _bulk_invite_item(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """one bulk row; bad rows and failed creations become ok=false instead of aborting"""
+    fields = entry.get("fields") or {}
+    out: Dict[str, Any] = {
+        "row": entry["row"],
+        "ok": False,
+        "name": fields.get("name"),
+        "username": fields.get("username"),
+        "email": fields.get("email"),
+    }
+    if "error" in entry:
+        out["detail"] = entry["error"]
+        return out
     try:
-        if email and invite_url:
-            sent = send_invitation_email(
-                to_email=email,
-                name=name,
-                invite_url=invite_url,
-                expires_friendly=expires_friendly,
-                org_name=settings.ORGANIZATION_NAME,
-                external_url=settings.EXTERNAL_BASE_URL,
-                footer=settings.EMAIL_FOOTER,
-            )
-            if sent:
-                logger.info("invitation_email_sent", extra={"email": redact_email(email)})
-            else:
-                logger.warning("invitation_email_not_sent", extra={"email": redact_email(email)})
+        inv = await _create_invite(fields)
     except Exception as e:
-        logger.warning(
-            "invitation_email_failed",
-            extra={"email": redact_email(email), "error": str(e)},
-        )
+        logger.warning("invites_bulk_row_failed", extra={"row": entry["row"], "error": str(e)})
+        out["detail"] = str(e)
+        return out
+    _publish_invite(fields, inv)
+    out.update(
+        ok=True,
+        invite_url=inv.get("invite_url"),
+        expires=inv.get("expires"),
+        expires_friendly=inv.get("expires_friendly"),
+    )
+    if "mail_id" in inv:
+        out["mail_id"] = inv["mail_id"]
+    return out
 
-    return inv
+
+@router.post("/invites/bulk")
+async def post_invites_bulk(
+    request: Request,
+    fmt: str = Query("json", alias="format"),
+    single_use: Optional[bool] = None,
+    expires_days: Optional[int] = None,
+    flow: Optional[str] = None,
+):
+    """
+    create many invitations from a json array or a csv upload.
+    - rows are validated and deduped by email; skipped rows come back with ok=false.
+    - query parameters are defaults for rows that leave the column blank.
+    - runs BULK_CONCURRENCY at a time; format=ndjson streams each row as it lands.
+    """
+    rows, body_defaults = await _bulk_payload(request)
+    if not rows:
+        raise HTTPException(status_code=400, detail="no rows to invite")
+    limit = settings.INVITES_BULK_MAX_ROWS
+    if len(rows) > limit:
+        raise HTTPException(status_code=413, detail=f"too many rows (>{limit})")
+
+    query_defaults = {"single_use": single_use, "expires_days": expires_days, "flow": flow}
+    defaults = {**{k: v for k, v in query_defaults.items() if v is not None}, **body_defaults}
+    entries = plan_rows(rows, defaults)
+
+    logger.info(
+        "invites_bulk_requested",
+        extra={"count": len(entries), "failed": sum(1 for e in entries if "error" in e)},
+    )
+    return await run_bulk("invite", entries, _bulk_invite_item, fmt)
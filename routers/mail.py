@@ -0,0 +1,25 @@
+# routers/mail.py
+from __future__ import annotations
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from core.auth import require_user
+from tools.mail_queue import mail_queue
+
+# delivery state is internal; same auth as the routes that queue mail
+router = APIRouter(dependencies=[Depends(require_user)])
+
+
+@router.get("/mail")
+async def mail_stats():
+    """queue depth, live workers and message counts by state"""
+    return mail_queue.stats()
+
+
+@router.get("/mail/{message_id}")
+async def mail_status(message_id: str):
+    """delivery state of one queued message"""
+    st = mail_queue.status(message_id)
+    if st is None:
+        raise HTTPException(status_code=404, detail="unknown message id")
+    return st
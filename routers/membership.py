@@ -1,16 +1,20 @@
 # routers/membership.py
 from __future__ import annotations
 
+import json
 import logging
-from typing import Any, Dict
-
-from fastapi import APIRouter, Body, Depends, HTTPException
+from functools import partial
+from typing import Any, AsyncIterator, Dict
 
+from fastapi import APIRouter, Body, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from tools.mail_queue import NoRecipient, mail_queue
 from tools.mailer import send_promotion_email
 from tools.settings import settings
 from core.auth import require_user
-from core.utils import redact_email
-from services.authentik import ak
+from core.bulk_response import run_bulk
+from services.authentik import AuthentikNotFound, SwitchError, aak, ak
+from services.jobs import Job, job_scheduler
 
 logger = logging.getLogger("authentik_helper.app")
 
@@ -18,9 +22,37 @@ logger = logging.getLogger("authentik_helper.app")
 router = APIRouter(dependencies=[Depends(require_user)])
 
 
+def _promotion_recipient(pk: int) -> Dict[str, Any] | None:
+    """runs on a mail worker: the user's address and display name, None without an address"""
+    try:
+        u = ak.get_user(pk, partial_ok=True)
+    except AuthentikNotFound as e:
+        # deleted since the promote; asking again will not bring them back
+        raise NoRecipient("user not found") from e
+    to_email = (u.get("email") or "").strip()
+    if not to_email:
+        return None
+    return {"to_email": to_email, "name": (u.get("name") or u.get("username") or "").strip()}
+
+
+def _queue_promotion_mail(pk: int) -> str:
+    """queue the promotion email by pk; the address is looked up off the request path"""
+    return mail_queue.submit_lookup(
+        "promotion",
+        send_promotion_email,
+        partial(_promotion_recipient, pk),
+        meta={"pk": pk},
+        portal_url=settings.PORTAL_URL,
+        authentik_url=settings.AK_BASE_URL,
+        org_name=settings.ORGANIZATION_NAME,
+        external_url=settings.EXTERNAL_BASE_URL,
+        footer=settings.EMAIL_FOOTER,
+    )
+
+
 @router.post("/promote")
-def promote(payload: Dict[str, Any] = Body(...)):
-    """move a user from guests to members and optionally send a notification email"""
+async def promote(payload: Dict[str, Any] = Body(...)):
+    """move a user from guests to members and optionally queue a notification email"""
     pk = payload.get("pk")
     if pk is None:
         raise HTTPException(status_code=400, detail="pk is required")
@@ -31,46 +63,20 @@ def promote(payload: Dict[str, Any] = Body(...)):
 
     send_mail = bool(payload.get("send_mail", True))
 
-    result = ak.switch_group_user_pk(
+    result = await aak.switch_group_user_pk(
         settings.AK_GUESTS_GROUP_UUID,
         settings.AK_MEMBERS_GROUP_UUID,
         pk_i,
     )
 
+    out: Dict[str, Any] = {"status": "ok", **result}
     if send_mail:
-        # best-effort mail; never fail the promote because of smtp
-        try:
-            u = ak.get_user(pk_i)
-            to_email = (u.get("email") or "").strip()
-            name = (u.get("name") or u.get("username") or "").strip()
-            if to_email:
-                sent = send_promotion_email(
-                    to_email=to_email,
-                    name=name,
-                    portal_url=settings.PORTAL_URL,
-                    authentik_url=settings.AK_BASE_URL,
-                    org_name=settings.ORGANIZATION_NAME,
-                    external_url=settings.EXTERNAL_BASE_URL,
-                    footer=settings.EMAIL_FOOTER,
-                )
-                if sent:
-                    logger.info(
-                        "promotion_email_sent",
-                        extra={"email": redact_email(to_email), "pk": pk_i},
-                    )
-                else:
-                    logger.warning(
-                        "promotion_email_not_sent",
-                        extra={"email": redact_email(to_email), "pk": pk_i},
-                    )
-        except Exception as e:
-            logger.warning("promotion_email_failed", extra={"pk": pk_i, "error": str(e)})
-
-    return {"status": "ok", **result}
+        out["mail_id"] = _queue_promotion_mail(pk_i)
+    return out
 
 
 @router.post("/demote")
-def demote(payload: Dict[str, Any] = Body(...)):
+async def demote(payload: Dict[str, Any] = Body(...)):
     """move a user from members back to guests"""
     pk = payload.get("pk")
     if pk is None:
@@ -80,7 +86,7 @@ def demote(payload: Dict[str, Any] = Body(...)):
     except Exception:
         raise HTTPException(status_code=400, detail="pk must be an integer")
 
-    result = ak.switch_group_user_pk(
+    result = await aak.switch_group_user_pk(
         settings.AK_MEMBERS_GROUP_UUID,
         settings.AK_GUESTS_GROUP_UUID,
         pk_i,
@@ -88,109 +94,159 @@ def demote(payload: Dict[str, Any] = Body(...)):
     return {"status": "ok", **result}
 
 
-@router.post("/promote/bulk")
-def promote_bulk(payload: Dict[str, Any] = Body(...)):
-    """promote many users in one call; duplicates are deduped, capped to a safe limit"""
+def _bulk_pks(payload: Dict[str, Any], max_items: int = 200) -> list[int]:
+    """validate a bulk payload; duplicates are dropped, first-seen order is kept"""
     raw = payload.get("pks")
     if not isinstance(raw, list) or not raw:
         raise HTTPException(status_code=400, detail="pks must be a non-empty array")
 
     try:
-        pks = list({int(x) for x in raw})
+        pks = list(dict.fromkeys(int(x) for x in raw))
     except Exception:
         raise HTTPException(status_code=400, detail="all pks must be integers")
 
-    max_items = 200
     if len(pks) > max_items:
         raise HTTPException(status_code=413, detail=f"too many pks (>{max_items})")
+    return pks
 
-    send_mail = bool(payload.get("send_mail", True))
 
-    results: list[dict[str, Any]] = []
-    ok = 0
-    fail = 0
+async def _switch_item(kind: str, source: str, target: str, pk: int) -> dict[str, Any]:
+    """one bulk entry; failures become ok=false instead of aborting the batch"""
+    try:
+        res = await aak.switch_group_user_pk(source, target, pk)
+    except Exception as e:
+        item: dict[str, Any] = {"pk": pk, "ok": False, "detail": str(e)}
+        if isinstance(e, SwitchError):
+            item["outcome"] = e.outcome
+        logger.debug(f"{kind}_exception", extra={"pk": pk, "error": str(e)})
+        return item
+    success = 200 <= res["add"] < 300 and 200 <= res["remove"] < 300
+    logger.debug(f"{kind}_result", extra={"pk": pk, "ok": success})
+    return {"pk": pk, "ok": success, "detail": res}
+
+
+async def _promote_item(pk: int, send_mail: bool) -> dict[str, Any]:
+    item = await _switch_item(
+        "promote", settings.AK_GUESTS_GROUP_UUID, settings.AK_MEMBERS_GROUP_UUID, pk
+    )
+    if item["ok"] and send_mail:
+        item["mail_id"] = _queue_promotion_mail(pk)
+    return item
 
-    logger.info("bulk_promote_requested", extra={"count": len(pks), "send_mail": send_mail})
 
-    for pk in pks:
-        try:
-            res = ak.switch_group_user_pk(
-                settings.AK_GUESTS_GROUP_UUID,
-                settings.AK_MEMBERS_GROUP_UUID,
-                pk,
-            )
-            success = 200 <= res["add"] < 300 and 200 <= res["remove"] < 300
-            if success and send_mail:
-                # mail is best-effort per user
-                try:
-                    u = ak.get_user(pk)
-                    to_email = (u.get("email") or "").strip()
-                    name = (u.get("name") or u.get("username") or "").strip()
-                    if to_email:
-                        send_promotion_email(
-                            to_email=to_email,
-                            name=name,
-                            portal_url=settings.PORTAL_URL,
-                            authentik_url=settings.AK_BASE_URL,
-                            org_name=settings.ORGANIZATION_NAME,
-                            external_url=settings.EXTERNAL_BASE_URL,
-                            footer=settings.EMAIL_FOOTER,
-                        )
-                except Exception as e:
-                    logger.warning("bulk promotion email failed", extra={"pk": pk, "error": str(e)})
-
-            results.append({"pk": pk, "ok": success, "detail": res})
-            ok += 1 if success else 0
-            fail += 0 if success else 1
-            logger.debug("promote_result", extra={"pk": pk, "ok": success})
-        except Exception as e:
-            results.append({"pk": pk, "ok": False, "detail": str(e)})
-            fail += 1
-            logger.debug("promote_exception", extra={"pk": pk, "error": str(e)})
-
-    logger.info("bulk_promote_finished", extra={"ok": ok, "failed": fail})
-    return {"count_ok": ok, "count_failed": fail, "results": results}
+async def _demote_item(pk: int) -> dict[str, Any]:
+    return await _switch_item(
+        "demote", settings.AK_MEMBERS_GROUP_UUID, settings.AK_GUESTS_GROUP_UUID, pk
+    )
 
 
-@router.post("/demote/bulk")
-def demote_bulk(payload: Dict[str, Any] = Body(...)):
-    """demote many users in one call; duplicates are deduped, capped to a safe limit"""
-    raw = payload.get("pks")
-    if not isinstance(raw, list) or not raw:
-        raise HTTPException(status_code=400, detail="pks must be a non-empty array")
+@router.post("/promote/bulk")
+async def promote_bulk(
+    payload: Dict[str, Any] = Body(...), fmt: str = Query("json", alias="format")
+):
+    """promote many users in one call; deduped, capped, run BULK_CONCURRENCY at a time"""
+    pks = _bulk_pks(payload)
+    send_mail = bool(payload.get("send_mail", True))
 
-    try:
-        pks = list({int(x) for x in raw})
-    except Exception:
-        raise HTTPException(status_code=400, detail="all pks must be integers")
+    logger.info("bulk_promote_requested", extra={"count": len(pks), "send_mail": send_mail})
 
-    max_items = 200
-    if len(pks) > max_items:
-        raise HTTPException(status_code=413, detail=f"too many pks (>{max_items})")
+    return await run_bulk("promote", pks, partial(_promote_item, send_mail=send_mail), fmt)
 
-    results: list[dict[str, Any]] = []
-    ok = 0
-    fail = 0
+
+@router.post("/demote/bulk")
+async def demote_bulk(
+    payload: Dict[str, Any] = Body(...), fmt: str = Query("json", alias="format")
+):
+    """demote many users in one call; deduped, capped, run BULK_CONCURRENCY at a time"""
+    pks = _bulk_pks(payload)
 
     logger.info("bulk_demote_requested", extra={"count": len(pks)})
 
-    for pk in pks:
-        try:
-            res = ak.switch_group_user_pk(
-                settings.AK_MEMBERS_GROUP_UUID,
-                settings.AK_GUESTS_GROUP_UUID,
-                pk,
-            )
-            success = 200 <= res["add"] < 300 and 200 <= res["remove"] < 300
-            results.append({"pk": pk, "ok": success, "detail": res})
-            ok += 1 if success else 0
-            fail += 0 if success else 1
-
-            logger.debug("demote_result", extra={"pk": pk, "ok": success})
-        except Exception as e:
-            results.append({"pk": pk, "ok": False, "detail": str(e)})
-            fail += 1
-            logger.debug("demote_exception", extra={"pk": pk, "error": str(e)})
-
-    logger.info("bulk_demote_finished", extra={"ok": ok, "failed": fail})
-    return {"count_ok": ok, "count_failed": fail, "results": results}
+    return await run_bulk("demote", pks, _demote_item, fmt)
+
+
+def _job(job_id: str) -> Job:
+    job = job_scheduler.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="unknown job id")
+    return job
+
+
+def _job_stream(job: Job) -> StreamingResponse:
+    """every result so far, then each new one as it lands, then a summary line"""
+
+    async def lines() -> AsyncIterator[str]:
+        sent = 0
+        while True:
+            changed = job.changed()
+            active = job.active
+            fresh = job.results[sent:]
+            sent += len(fresh)
+            for _, result in fresh:
+                yield json.dumps(result, separators=(",", ":")) + "\n"
+            if not active:
+                st = job.status()
+                summary = {k: st[k] for k in ("state", "total", "ok", "failed")}
+                yield json.dumps({"done": True, **summary}) + "\n"
+                return
+            await changed.wait()
+
+    return StreamingResponse(
+        lines(), media_type="application/x-ndjson", headers={"Cache-Control": "no-store"}
+    )
+
+
+@router.post("/jobs", status_code=202)
+async def submit_job(payload: Dict[str, Any] = Body(...)):
+    """queue a promote or demote of up to JOBS_MAX_ITEMS users; runs in the background"""
+    action = payload.get("action")
+    if action not in ("promote", "demote"):
+        raise HTTPException(status_code=400, detail="action must be promote or demote")
+    pks = _bulk_pks(payload, max_items=settings.JOBS_MAX_ITEMS)
+    if action == "promote":
+        send_mail = bool(payload.get("send_mail", True))
+        job = job_scheduler.submit(
+            action, pks, partial(_promote_item, send_mail=send_mail), {"send_mail": send_mail}
+        )
+    else:
+        job = job_scheduler.submit(action, pks, _demote_item)
+    return job.status()
+
+
+@router.get("/jobs")
+async def list_jobs():
+    """queued, running and recently finished jobs, newest first"""
+    return {"jobs": [job.status() for job in job_scheduler.list()]}
+
+
+@router.get("/jobs/{job_id}")
+async def job_status(job_id: str, results: bool = False, fmt: str = Query("json", alias="format")):
+    """progress of one job; format=ndjson streams its results until it ends"""
+    job = _job(job_id)
+    if fmt not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be json or ndjson")
+    if fmt == "ndjson":
+        return _job_stream(job)
+    return job.status(results=results)
+
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """stop starting new items; users already being moved finish their move"""
+    job = _job(job_id)
+    if not job.active:
+        raise HTTPException(status_code=409, detail=f"job already {job.state}")
+    job_scheduler.cancel(job_id)
+    return job.status()
+
+
+@router.post("/jobs/{job_id}/retry", status_code=202)
+async def retry_job(job_id: str):
+    """queue a new job with the users that failed or, after a cancel, never ran"""
+    job = _job(job_id)
+    if job.active:
+        raise HTTPException(status_code=409, detail="job is still running")
+    retried = job_scheduler.retry(job_id)
+    if retried is None:
+        raise HTTPException(status_code=409, detail="no failed or skipped users to retry")
+    return retried.status()
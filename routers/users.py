@@ -1,13 +1,19 @@
 # routers/users.py
 from __future__ import annotations
 
+import json
 import logging
+from typing import Any, AsyncIterator, Dict, Optional, Set
+from urllib.parse import quote
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 
 from tools.settings import settings
 from core.auth import require_user
-from services.authentik import ak
+from services.authentik import aak
+from services.group_view import MAX_PAGE_SIZE, parse_sort
+from services.membership_log import membership_log
 
 logger = logging.getLogger("authentik_helper.app")
 
@@ -16,30 +22,147 @@ router = APIRouter(dependencies=[Depends(require_user)])
 
 
 @router.get("/me")
-def me(user: dict = Depends(require_user)):
+async def me(user: dict = Depends(require_user)):
     """return the current session user dict"""
     return user
 
 
+async def _ndjson(group_uuid: str) -> StreamingResponse:
+    # the first page is fetched before the response starts, so a bad group still
+    # gets a proper error status; later failures can only end the stream with a line
+    version = membership_log.version()
+    name, pages = await aak.open_group_stream(group_uuid)
+
+    async def lines() -> AsyncIterator[str]:
+        count = 0
+        try:
+            async for rows in pages:
+                count += len(rows)
+                yield "".join(json.dumps(u, separators=(",", ":")) + "\n" for u in rows)
+        except Exception as e:
+            logger.warning(
+                "group_stream_failed", extra={"group": group_uuid, "count": count, "error": str(e)}
+            )
+            yield json.dumps({"error": str(e)}) + "\n"
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={
+            "X-Group-Name": quote(name, safe=" "),
+            "X-Membership-Version": version,
+            "Cache-Control": "no-store",
+        },
+    )
+
+
+def _parse_have(have: Optional[str]) -> Set[int]:
+    try:
+        pks = {int(x) for x in (have or "").split(",") if x.strip()}
+    except ValueError:
+        raise HTTPException(status_code=400, detail="have must be comma-separated user pks")
+    if len(pks) > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"have takes at most {MAX_PAGE_SIZE} pks")
+    return pks
+
+
+def _delta(group_uuid: str, since: str) -> Dict[str, Any]:
+    # answered from the log alone, even once the cached listing has expired: full listings
+    # and the background reconcile feed it, so a poll never costs an authentik reload.
+    # a group the log has no baseline for comes back as a reset and the client refetches
+    delta, version = membership_log.since(group_uuid, since)
+    if delta is None:
+        return {"version": version, "reset": True}
+    return {"version": version, **delta.as_dict()}
+
+
+async def _group_users(
+    group_uuid: str,
+    page: Optional[int],
+    page_size: Optional[int],
+    q: Optional[str],
+    sort: Optional[str],
+    fmt: str,
+    since: Optional[str] = None,
+    have: Optional[str] = None,
+) -> Any:
+    paged = not (page is None and page_size is None and q is None and sort is None)
+    if fmt not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be json or ndjson")
+    if fmt == "ndjson":
+        if paged or since is not None:
+            raise HTTPException(
+                status_code=400,
+                detail="format=ndjson streams the whole group; drop page/q/sort/since",
+            )
+        return await _ndjson(group_uuid)
+    # no paging parameters: the whole group as before, or only what changed since a token
+    if not paged:
+        if since is not None:
+            return _delta(group_uuid, since)
+        # read the token first: a change landing mid-load is then replayed, never lost
+        version = membership_log.version()
+        return {**await aak.list_group_users(group_uuid), "version": version}
+    try:
+        parse_sort(sort or "pk")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    known = _parse_have(have) if since is not None else set()
+    version = membership_log.version()
+    out = await aak.list_group_page(
+        group_uuid, q=q or "", sort=sort or "pk", page=page or 1, page_size=page_size or 0
+    )
+    out["version"] = version
+    if since is not None:
+        delta, _ = membership_log.since(group_uuid, since)
+        if delta is None:
+            out["reset"] = True
+        else:
+            # rows the client holds that have not changed since its token go back as stubs
+            keep = known - delta.touched
+            out["users"] = [{"pk": u["pk"]} if u.get("pk") in keep else u for u in out["users"]]
+    return out
+
+
 @router.get("/guest-users")
-def guest_users():
-    """list users in the guests group"""
-    return ak.list_group_users(settings.AK_GUESTS_GROUP_UUID)
+async def guest_users(
+    page: Optional[int] = None,
+    page_size: Optional[int] = None,
+    q: Optional[str] = None,
+    sort: Optional[str] = None,
+    fmt: str = Query("json", alias="format"),
+    since: Optional[str] = None,
+    have: Optional[str] = None,
+):
+    """list users in the guests group; paged, filtered, sorted, streamed or as a delta"""
+    return await _group_users(
+        settings.AK_GUESTS_GROUP_UUID, page, page_size, q, sort, fmt, since, have
+    )
 
 
 @router.get("/members-users")
-def member_users():
-    """list users in the members group"""
-    return ak.list_group_users(settings.AK_MEMBERS_GROUP_UUID)
+async def member_users(
+    page: Optional[int] = None,
+    page_size: Optional[int] = None,
+    q: Optional[str] = None,
+    sort: Optional[str] = None,
+    fmt: str = Query("json", alias="format"),
+    since: Optional[str] = None,
+    have: Optional[str] = None,
+):
+    """list users in the members group; paged, filtered, sorted, streamed or as a delta"""
+    return await _group_users(
+        settings.AK_MEMBERS_GROUP_UUID, page, page_size, q, sort, fmt, since, have
+    )
 
 
 @router.get("/search-users")
-def search_users(q: str = "", limit: int = 25):
+async def search_users(q: str = "", limit: int = 25):
     """simple user search proxy with a small guard for empty queries"""
     limit = max(1, min(int(limit or 25), 100))
     q = (q or "").strip()
     if not q:
         return {"query": q, "users": []}
-    result = ak.search_users(q, limit)
+    result = await aak.search_users(q, limit)
     logger.info("user_search", extra={"q": q, "results": len(result.get("users", []))})
     return result
@@ -1,59 +1,176 @@
 # services/authentik.py
 from __future__ import annotations
 
+import asyncio
+import importlib.util
+import logging
+import threading
+import time
 import uuid
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, List, Optional
+from typing import (
+    Any,
+    AsyncIterator,
+    Deque,
+    Dict,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+from urllib.parse import urlsplit
 
 import httpx
 
 from tools.settings import settings
 from core.utils import slugify_name
+from services.group_view import DEFAULT_PAGE_SIZE, GroupView, group_views
+from services.membership_cache import membership_cache
+from services.search_cache import search_cache
+from services.user_cache import user_cache
+from services.resilience import CircuitBreaker, RetryPolicy, breaker_for, counts_as_failure
 
+log = logging.getLogger("authentik_helper.authentik")
 
-class AuthentikClient:
-    """client for authentik api v3"""
+_OK = (200, 201, 202, 204)
+
+T = TypeVar("T")
+
+
+class AuthentikNotFound(RuntimeError):
+    """a GET answered 404; still a RuntimeError so existing handlers keep working"""
+
+
+class SwitchError(RuntimeError):
+    """a group move did not complete; outcome is failed, rolled_back or partial"""
+
+    def __init__(self, message: str, outcome: str) -> None:
+        super().__init__(message)
+        self.outcome = outcome
+
+
+def _http2_enabled() -> bool:
+    """honour AK_HTTP2 only when the optional h2 package is importable"""
+    if not settings.AK_HTTP2:
+        return False
+    if importlib.util.find_spec("h2") is None:
+        log.warning("http2_unavailable_using_http1", extra={"missing": ["h2"]})
+        return False
+    return True
+
+
+# why flows: the retry/breaker loop, paging, listing fallbacks, lookups and switch rollback
+# are identical for the blocking cli client and the async web client, and two hand-kept
+# copies had started to drift. python cannot call the same function both blocking and
+# awaited, so that logic is written once as generators ("flows") that never do i/o
+# themselves. they yield one of the four steps below; each client's driver (_run) performs
+# it, blocking or awaited, and sends back the result or throws in the exception. the steps
+# are deliberately few so a driver stays a screenful, and _Call dispatches through the
+# client's own methods so patching those (tests, subclasses) still reaches the shared code
+Flow = Generator[Any, Any, T]
+
+
+_gather_worker = threading.local()
+
+
+def _mark_gather_worker() -> None:
+    _gather_worker.active = True
+
+
+class _Call(NamedTuple):
+    """call one of the client's own methods (awaited by the async client)"""
+
+    name: str
+    args: Tuple[Any, ...] = ()
+    kwargs: Mapping[str, Any] = {}
+
+
+class _Send(NamedTuple):
+    """one http attempt on the pooled session"""
+
+    method: str
+    url: str
+    kwargs: Mapping[str, Any]
+
+
+class _Sleep(NamedTuple):
+    seconds: float
+
+
+class _Gather(NamedTuple):
+    """run flows concurrently, at most limit at a time; results keep input order"""
+
+    flows: List[Flow[Any]]
+    limit: int
+
+
+class _AuthentikBase:
+    """request building, response shaping and control flow shared by both clients"""
 
     def __init__(self) -> None:
-        self._session: Optional[httpx.Client] = None
         self._base = str(settings.AK_BASE_URL).rstrip("/")
 
-    def _get_session(self) -> httpx.Client:
-        if self._session is None:
-            s = httpx.Client()
-            token = (
-                settings.AK_TOKEN.get_secret_value()
-                if hasattr(settings.AK_TOKEN, "get_secret_value")
-                else str(settings.AK_TOKEN)
-            )
-            s.headers.update(
-                {
-                    "authorization": f"Bearer {token}",
-                    "accept": "application/json",
-                    "content-type": "application/json",
-                    "user-agent": "authentik-helper/1.x",
-                }
-            )
+    def _headers(self) -> Dict[str, str]:
+        token = (
+            settings.AK_TOKEN.get_secret_value()
+            if hasattr(settings.AK_TOKEN, "get_secret_value")
+            else str(settings.AK_TOKEN)
+        )
+        return {
+            "authorization": f"Bearer {token}",
+            "accept": "application/json",
+            "content-type": "application/json",
+            "user-agent": "authentik-helper/1.x",
+        }
 
-            self._session = s
-        return self._session
+    @staticmethod
+    def _timeout(op: str) -> httpx.Timeout:
+        """read timeout by operation class: list, mutation, or search (the default)"""
+        read = {
+            "list": settings.AK_HTTP_LIST_TIMEOUT,
+            "mutation": settings.AK_HTTP_MUTATION_TIMEOUT,
+        }.get(op, settings.AK_HTTP_SEARCH_TIMEOUT)
+        return httpx.Timeout(read, connect=settings.AK_HTTP_CONNECT_TIMEOUT)
+
+    def _session_kwargs(self) -> Dict[str, Any]:
+        """pool limits, protocol and default timeout shared by both session types"""
+        return {
+            "limits": httpx.Limits(
+                max_connections=settings.AK_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.AK_HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=settings.AK_HTTP_KEEPALIVE_EXPIRY,
+            ),
+            "http2": _http2_enabled(),
+            "timeout": self._timeout("search"),
+        }
+
+    def _breaker(self) -> CircuitBreaker:
+        return breaker_for(urlsplit(self._base).netloc or self._base)
+
+    @staticmethod
+    def _log_retry(path: str, attempt: int, wait: float, **why: Any) -> None:
+        log.warning(
+            "authentik_retry",
+            extra={"path": path, "attempt": attempt + 1, "retry_in": round(wait, 3), **why},
+        )
 
     def _url(self, path: str) -> str:
         p = path if path.startswith("/") else f"/{path}"
         return f"{self._base}/api/v3{p}"
 
-    def _get(self, path: str, **params: Any) -> Any:
-        r = self._get_session().get(self._url(path), params=params or {})
-        if r.status_code != 200:
-            try:
-                detail = r.json()
-            except Exception:
-                detail = r.text
-            raise RuntimeError(f"GET {path} -> {r.status_code}: {detail}")
-        return r.json()
-
-    def _post(self, path: str, payload: Dict[str, Any]) -> httpx.Response:
-        return self._get_session().post(self._url(path), json=payload)
+    @staticmethod
+    def _body(r: httpx.Response) -> Any:
+        try:
+            return r.json()
+        except Exception:
+            return r.text
 
     @staticmethod
     def _iso_utc_in(days: int) -> str:
@@ -72,93 +189,227 @@ class AuthentikClient:
         except Exception:
             return s
 
-    def list_group_users(self, group_uuid: str) -> Dict[str, Any]:
-        data = self._get(f"/core/groups/{group_uuid}/", include_users="true")
-        group_name = data.get("name") or ""
-        users: List[Dict[str, Any]] = []
+    @staticmethod
+    def _group_users_obj(data: Any) -> Optional[List[Dict[str, Any]]]:
+        """full user objects when the group payload embeds them, else None"""
         if isinstance(data, dict) and isinstance(data.get("users_obj"), list):
-            users = [u for u in data["users_obj"] if isinstance(u, dict)]
-        elif isinstance(data, dict) and isinstance(data.get("users"), list):
-            for pk in data["users"]:
-                try:
-                    users.append(self.get_user(int(pk)))
-                except Exception:
-                    pass
-        users.sort(key=lambda u: int(u.get("pk") or u.get("id") or 0))
+            return [u for u in data["users_obj"] if isinstance(u, dict)]
+        return None
+
+    @staticmethod
+    def _group_user_pks(data: Any) -> List[int]:
+        """legacy shape: a bare list of member pks"""
+        if isinstance(data, dict) and isinstance(data.get("users"), list):
+            return [int(pk) for pk in data["users"]]
+        return []
+
+    @staticmethod
+    def _raise_for_get(path: str, r: httpx.Response) -> None:
+        if r.status_code == 404:
+            raise AuthentikNotFound(f"GET {path} -> 404: {_AuthentikBase._body(r)}")
+        if r.status_code != 200:
+            raise RuntimeError(f"GET {path} -> {r.status_code}: {_AuthentikBase._body(r)}")
+
+    @staticmethod
+    def _cached_user(pk: int, partial_ok: bool) -> Optional[Dict[str, Any]]:
+        """cached record, None on a miss; raises for users authentik recently 404'd"""
+        hit, record = user_cache.get(pk, partial_ok=partial_ok)
+        if hit and record is None:
+            raise AuthentikNotFound(f"GET /core/users/{int(pk)}/ -> 404: (cached)")
+        return record
+
+    @staticmethod
+    def _slim_user(u: Dict[str, Any]) -> Dict[str, Any]:
+        """the three fields group listings expose"""
         return {
+            "pk": u.get("pk") or u.get("id"),
+            "username": u.get("username") or u.get("name") or "",
+            "email": u.get("email") or "",
+        }
+
+    @staticmethod
+    def _group_listing(
+        data: Any, users: List[Dict[str, Any]], failed: Optional[List[Dict[str, Any]]] = None
+    ) -> Dict[str, Any]:
+        group_name = (data.get("name") if isinstance(data, dict) else "") or ""
+        user_cache.remember(users)
+        users = sorted(users, key=lambda u: int(u.get("pk") or u.get("id") or 0))
+        out: Dict[str, Any] = {
             "group_name": group_name,
-            "users": [
-                {
-                    "pk": u.get("pk") or u.get("id"),
-                    "username": u.get("username") or u.get("name") or "",
-                    "email": u.get("email") or "",
-                }
-                for u in users
-            ],
+            "users": [_AuthentikBase._slim_user(u) for u in users],
         }
+        if failed:
+            # members we know about but could not load; callers decide how loud to be
+            out["failed"] = failed
+        return out
 
-    def get_user(self, pk: int) -> Dict[str, Any]:
-        return self._get(f"/core/users/{int(pk)}/")
+    @staticmethod
+    def _remember_listing(group_uuid: str, listing: Dict[str, Any]) -> None:
+        """a listing fresh from authentik: cache it and log how it differs from the last"""
+        # the change log and its event broker serve the web app; imported on first use so
+        # cli commands that never list a group do not load them
+        from services.membership_log import membership_log
 
-    def switch_group_user_pk(
-        self, source_group_uuid: str, target_group_uuid: str, user_pk: int
-    ) -> Dict[str, int]:
-        add_r = self._post(f"/core/groups/{target_group_uuid}/add_user/", {"pk": int(user_pk)})
-        rm_r = self._post(f"/core/groups/{source_group_uuid}/remove_user/", {"pk": int(user_pk)})
+        membership_cache.put(group_uuid, listing)
+        n = membership_log.observe(group_uuid, listing)
+        if n:
+            log.info("membership_reconciled", extra={"group": group_uuid, "count": n})
 
-        def _code(resp: httpx.Response) -> int:
-            try:
-                _ = resp.json()
-            except Exception:
-                _ = resp.text  # noqa: F841
-            return resp.status_code
+    @staticmethod
+    def _cached_group_view(group_uuid: str) -> Optional[GroupView]:
+        return group_views.lookup(group_uuid, membership_cache.version(group_uuid))
 
-        add_code = _code(add_r)
-        rm_code = _code(rm_r)
+    @staticmethod
+    def _lookup_concurrency(concurrency: Optional[int]) -> int:
+        return max(1, int(concurrency or settings.AK_LOOKUP_CONCURRENCY))
 
-        ok = (200, 201, 202, 204)
-        if add_code not in ok or rm_code not in ok:
-            try:
-                add_body = add_r.json()
-            except Exception:
-                add_body = add_r.text
-            try:
-                rm_body = rm_r.json()
-            except Exception:
-                rm_body = rm_r.text
-            raise RuntimeError(
-                f"switch failed add={add_code}:{add_body} remove={rm_code}:{rm_body}"
+    @staticmethod
+    def _split_lookups(
+        results: Iterable[Tuple[int, Optional[Dict[str, Any]], Optional[str]]],
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        users: List[Dict[str, Any]] = []
+        failed: List[Dict[str, Any]] = []
+        for pk, user, error in results:
+            if user is not None:
+                users.append(user)
+            else:
+                failed.append({"pk": pk, "error": error or ""})
+        if failed:
+            log.warning("user_lookups_failed", extra={"count": len(failed), "ok": len(users)})
+        return users, failed
+
+    @staticmethod
+    def _group_page_params(group_uuid: str, page: int, page_size: int) -> Dict[str, Any]:
+        return {
+            "groups_by_pk": group_uuid,
+            "page": page,
+            "page_size": page_size,
+            "ordering": "pk",
+            "include_groups": "false",
+        }
+
+    @staticmethod
+    def _user_page_params(page: int, page_size: int, extra: Dict[str, Any]) -> Dict[str, Any]:
+        return {"page": page, "page_size": page_size, "include_groups": "false", **extra}
+
+    @staticmethod
+    def _page_size(page_size: Optional[int]) -> int:
+        return max(1, int(page_size or settings.AK_GROUP_PAGE_SIZE))
+
+    @staticmethod
+    def _page_results(data: Any) -> List[Dict[str, Any]]:
+        results = data.get("results") if isinstance(data, dict) else None
+        return [u for u in results or [] if isinstance(u, dict)]
+
+    @staticmethod
+    def _next_page(data: Any, page: int, page_size: int, got: int) -> int:
+        """next page number from authentik's pagination block (0 when done)"""
+        pagination = data.get("pagination") if isinstance(data, dict) else None
+        if isinstance(pagination, dict):
+            nxt = int(pagination.get("next") or 0)
+        else:
+            # no envelope: keep going while pages come back full
+            nxt = page + 1 if got >= page_size else 0
+        return nxt if nxt > page else 0
+
+    @staticmethod
+    def _log_listing_fallback(group_uuid: str, e: Exception) -> None:
+        log.warning(
+            "paged_group_listing_failed_using_include_users",
+            extra={"group": group_uuid, "error": str(e)},
+        )
+
+    @staticmethod
+    def _leg_ok(leg: Any) -> bool:
+        return not isinstance(leg, BaseException) and getattr(leg, "status_code", None) in _OK
+
+    @staticmethod
+    def _leg_text(leg: Any) -> str:
+        if isinstance(leg, BaseException):
+            return f"{type(leg).__name__}:{leg}"
+        return f"{leg.status_code}:{_AuthentikBase._body(leg)}"
+
+    @classmethod
+    def _rollback_path(
+        cls, source_group_uuid: str, target_group_uuid: str, add: Any, rm: Any
+    ) -> Optional[str]:
+        """the call that undoes whichever half landed when the other did not"""
+        if cls._leg_ok(add) and not cls._leg_ok(rm):
+            return f"/core/groups/{target_group_uuid}/remove_user/"
+        if cls._leg_ok(rm) and not cls._leg_ok(add):
+            return f"/core/groups/{source_group_uuid}/add_user/"
+        return None
+
+    @classmethod
+    def _known_member(cls, pk: int) -> Optional[Dict[str, Any]]:
+        """slim record for a pk the log may not have, from the user cache"""
+        hit, record = user_cache.get(pk, partial_ok=True)
+        return cls._slim_user(record) if hit and record else None
+
+    @classmethod
+    def _switch_result(
+        cls,
+        source_group_uuid: str,
+        target_group_uuid: str,
+        user_pk: int,
+        add: Any,
+        rm: Any,
+        rollback: Any = None,
+    ) -> Dict[str, Any]:
+        """shape a finished switch; add/rm/rollback are responses or the exception raised"""
+        from services.membership_log import membership_log
+
+        if cls._leg_ok(add) and cls._leg_ok(rm):
+            membership_cache.move(source_group_uuid, target_group_uuid, user_pk)
+            membership_log.moved(
+                source_group_uuid, target_group_uuid, user_pk, cls._known_member(user_pk)
             )
+            return {"add": add.status_code, "remove": rm.status_code, "outcome": "complete"}
 
-        return {"add": add_code, "remove": rm_code}
+        # something did not land; let the next listing refetch both sides
+        membership_cache.invalidate(source_group_uuid, target_group_uuid)
+        if rollback is None:
+            # neither half applied; surface transport/circuit errors as themselves
+            for leg in (add, rm):
+                if isinstance(leg, BaseException):
+                    raise leg
+            outcome = "failed"
+        else:
+            outcome = "rolled_back" if cls._leg_ok(rollback) else "partial"
+        log.warning("group_switch_failed", extra={"pk": int(user_pk), "outcome": outcome})
+        msg = f"switch failed add={cls._leg_text(add)} remove={cls._leg_text(rm)}"
+        if rollback is not None:
+            msg += f" rollback={cls._leg_text(rollback)}"
+        raise SwitchError(f"{msg} outcome={outcome}", outcome)
 
-    def create_invitation(
+    def _invitation_payload(
         self,
-        name: str | None = None,
-        username: str | None = None,
-        email: str | None = None,
-        single_use: bool = True,
-        expires_days: Optional[int] = None,
-        flow_slug: Optional[str] = None,
+        name: str | None,
+        username: str | None,
+        email: str | None,
+        single_use: bool,
+        expires_days: Optional[int],
     ) -> Dict[str, Any]:
         days = settings.AK_INVITE_EXPIRES_DAYS if expires_days is None else int(expires_days)
-        expires_iso = self._iso_utc_in(days)
         # determine a slug for the Authentik invitation name (resource name)
         slug = slugify_name(name) if name else ""
         if not slug:
             slug = f"invite-{uuid.uuid4().hex[:8]}"
-        payload: Dict[str, Any] = {
+        return {
             "name": slug,
             "single_use": bool(single_use),
-            "expires": expires_iso,
+            "expires": self._iso_utc_in(days),
             "fixed_data": {"name": name, "username": username, "email": email},
         }
-        r = self._post("/stages/invitation/invitations/", payload)
+
+    def _invitation_result(
+        self, r: httpx.Response, expires_iso: str, flow_slug: Optional[str]
+    ) -> Dict[str, Any]:
         try:
             inv = r.json()
         except Exception:
             inv = {"raw": r.text}
-        if r.status_code not in (200, 201, 202, 204):
+        if r.status_code not in _OK:
             raise RuntimeError(f"invite create failed {r.status_code}: {inv}")
         token = inv.get("pk")
         slug = (flow_slug or settings.AK_INVITE_FLOW_SLUG or "").strip()
@@ -168,10 +419,13 @@ class AuthentikClient:
         inv["expires_friendly"] = self._friendly_from_iso(inv.get("expires") or expires_iso)
         return inv
 
-    def search_users(self, q: str, limit: int = 25) -> Dict[str, Any]:
-        limit = max(1, min(int(limit), 100))
-        data = self._get("/core/users/", search=q, page_size=limit)
-        results = data.get("results", data if isinstance(data, list) else [])
+    @staticmethod
+    def _search_limit(limit: int) -> int:
+        return max(1, min(int(limit), 100))
+
+    @staticmethod
+    def _search_result(q: str, data: Any) -> Dict[str, Any]:
+        results = data.get("results", []) if isinstance(data, dict) else data
         users = [
             {
                 "pk": u.get("pk") or u.get("id"),
@@ -179,12 +433,32 @@ class AuthentikClient:
                 "email": u.get("email") or "",
                 "name": u.get("name") or "",
             }
-            for u in results
+            for u in results or []
         ]
+        user_cache.remember(users)
         return {"query": q, "users": users}
 
-    def brand_info(self, brand_uuid: str) -> Dict[str, Any]:
-        data = self._get(f"/core/brands/{brand_uuid}/")
+    @staticmethod
+    def _local_search(q: str, limit: int) -> Optional[Dict[str, Any]]:
+        """answer from the user index, else from the search cache; None means ask authentik"""
+        # the index is filled by the web app's background sync; loaded on first search
+        from services.user_index import user_index
+
+        rows = user_index.search(q, limit)
+        if rows is None:
+            rows = search_cache.get(q, limit)
+        return None if rows is None else {"query": q, "users": rows}
+
+    def _cache_search(self, q: str, data: Any, fetched: int) -> Dict[str, Any]:
+        out = self._search_result(q, data)
+        search_cache.put(q, out["users"], fetched)
+        return out
+
+    @staticmethod
+    def _trim_search(out: Dict[str, Any], limit: int) -> Dict[str, Any]:
+        return {**out, "users": out["users"][:limit]}
+
+    def _brand_result(self, data: Dict[str, Any]) -> Dict[str, Any]:
         title = data.get("branding_title") or data.get("name") or ""
         domain = data.get("domain") or ""
         logo_path = data.get("branding_logo") or ""
@@ -196,5 +470,597 @@ class AuthentikClient:
             "brand_logo": logo,
         }
 
+    # shared flows; the clients below only drive them
+
+    def _call_flow(self, send: _Send, path: str, idempotent: bool = True) -> Flow[httpx.Response]:
+        """send behind the host circuit breaker, retrying transient failures"""
+        policy = RetryPolicy.from_settings()
+        breaker = self._breaker()
+        # checked once per call: retries belong to the call the breaker already let through
+        probe = breaker.before_call()
+        settled = False
+        attempt = 0
+        try:
+            while True:
+                try:
+                    r = yield send
+                except httpx.TransportError as e:
+                    wait = policy.retry_error(e, attempt, idempotent)
+                    if wait is None:
+                        settled = True
+                        breaker.record_failure()
+                        raise
+                    self._log_retry(path, attempt, wait, error=str(e))
+                else:
+                    wait = policy.retry_status(r, attempt, idempotent)
+                    if wait is None:
+                        # the breaker counts calls that gave up, not individual attempts
+                        settled = True
+                        if counts_as_failure(r):
+                            breaker.record_failure()
+                        else:
+                            breaker.record_success()
+                        return r
+                    self._log_retry(path, attempt, wait, status=r.status_code)
+                yield _Sleep(wait)
+                attempt += 1
+        finally:
+            # cancelled or failed some other way: never leave the breaker waiting on this probe
+            if probe and not settled:
+                breaker.release_probe()
+
+    def _get_flow(self, path: str, _op: str = "search", **params: Any) -> Flow[Any]:
+        send = _Send(
+            "get", self._url(path), {"params": params or {}, "timeout": self._timeout(_op)}
+        )
+        r = yield from self._call_flow(send, path)
+        self._raise_for_get(path, r)
+        return r.json()
+
+    def _post_flow(
+        self, path: str, payload: Dict[str, Any], idempotent: bool = True
+    ) -> Flow[httpx.Response]:
+        send = _Send(
+            "post", self._url(path), {"json": payload, "timeout": self._timeout("mutation")}
+        )
+        return (yield from self._call_flow(send, path, idempotent))
+
+    def _group_page_flow(
+        self, group_uuid: str, page: int, size: int
+    ) -> Flow[Tuple[List[Dict[str, Any]], int]]:
+        """slim members on one page, in pk order, and the next page number (0 when done)"""
+        data = yield _Call(
+            "_get",
+            ("/core/users/",),
+            {"_op": "list", **self._group_page_params(group_uuid, page, size)},
+        )
+        results = self._page_results(data)
+        user_cache.remember(results)
+        return [self._slim_user(u) for u in results], self._next_page(
+            data, page, size, len(results)
+        )
+
+    def _user_page_flow(
+        self, page: int, size: int, params: Dict[str, Any]
+    ) -> Flow[Tuple[List[Dict[str, Any]], int]]:
+        """raw user records on one page and the next page number (0 when done)"""
+        data = yield _Call(
+            "_get", ("/core/users/",), {"_op": "list", **self._user_page_params(page, size, params)}
+        )
+        results = self._page_results(data)
+        return results, self._next_page(data, page, size, len(results))
+
+    def _list_group_users_flow(self, group_uuid: str) -> Flow[Dict[str, Any]]:
+        cached = membership_cache.get(group_uuid)
+        if cached is not None:
+            return cached
+        return (yield _Call("load_group_users", (group_uuid,)))
+
+    def _load_group_users_flow(self, group_uuid: str) -> Flow[Dict[str, Any]]:
+        out = yield _Call("_load_group_users", (group_uuid,))
+        self._remember_listing(group_uuid, out)
+        return out
+
+    def _fetch_group_users_flow(self, group_uuid: str) -> Flow[Dict[str, Any]]:
+        if settings.AK_GROUP_LISTING == "include_users":
+            return (yield _Call("list_group_users_embedded", (group_uuid,)))
+        try:
+            group = yield _Call(
+                "_get", (f"/core/groups/{group_uuid}/",), {"include_users": "false"}
+            )
+            users: List[Dict[str, Any]] = []
+            size, page = self._page_size(None), 1
+            while page:
+                rows, page = yield from self._group_page_flow(group_uuid, page, size)
+                users.extend(rows)
+        except RuntimeError as e:
+            self._log_listing_fallback(group_uuid, e)
+            return (yield _Call("list_group_users_embedded", (group_uuid,)))
+        return self._group_listing(group, users)
+
+    def _embedded_flow(self, group_uuid: str) -> Flow[Dict[str, Any]]:
+        data = yield _Call(
+            "_get", (f"/core/groups/{group_uuid}/",), {"_op": "list", "include_users": "true"}
+        )
+        users = self._group_users_obj(data)
+        if users is not None:
+            return self._group_listing(data, users)
+        users, failed = yield _Call("get_users", (self._group_user_pks(data),))
+        return self._group_listing(data, users, failed)
+
+    def _get_user_flow(self, pk: int, partial_ok: bool) -> Flow[Dict[str, Any]]:
+        cached = self._cached_user(pk, partial_ok)
+        if cached is not None:
+            return cached
+        try:
+            data = yield _Call("_get", (f"/core/users/{int(pk)}/",))
+        except AuthentikNotFound:
+            user_cache.put_missing(pk)
+            raise
+        user_cache.put(pk, data)
+        return data
+
+    def _lookup_flow(self, pk: int) -> Flow[Tuple[int, Optional[Dict[str, Any]], Optional[str]]]:
+        try:
+            return pk, (yield _Call("get_user", (pk,))), None
+        except Exception as e:
+            return pk, None, str(e)
+
+    def _get_users_flow(
+        self, pks: Iterable[int], concurrency: Optional[int]
+    ) -> Flow[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]]:
+        flows = [self._lookup_flow(int(pk)) for pk in pks]
+        results = yield _Gather(flows, self._lookup_concurrency(concurrency))
+        return self._split_lookups(results)
+
+    def _leg_flow(self, path: str, body: Dict[str, Any]) -> Flow[Any]:
+        """one half of a switch: the response, or the exception it raised"""
+        try:
+            return (yield _Call("_post", (path, body)))
+        except Exception as e:
+            return e
+
+    def _switch_flow(
+        self, source_group_uuid: str, target_group_uuid: str, user_pk: int
+    ) -> Flow[Dict[str, Any]]:
+        body = {"pk": int(user_pk)}
+        add, rm = yield _Gather(
+            [
+                self._leg_flow(f"/core/groups/{target_group_uuid}/add_user/", body),
+                self._leg_flow(f"/core/groups/{source_group_uuid}/remove_user/", body),
+            ],
+            2,
+        )
+        undo = self._rollback_path(source_group_uuid, target_group_uuid, add, rm)
+        rollback = (yield from self._leg_flow(undo, body)) if undo else None
+        return self._switch_result(source_group_uuid, target_group_uuid, user_pk, add, rm, rollback)
+
+    def _create_invitation_flow(
+        self,
+        name: str | None,
+        username: str | None,
+        email: str | None,
+        single_use: bool,
+        expires_days: Optional[int],
+        flow_slug: Optional[str],
+    ) -> Flow[Dict[str, Any]]:
+        payload = self._invitation_payload(name, username, email, single_use, expires_days)
+        # creating an invitation is not idempotent; only resend when it provably did not run
+        r = yield _Call(
+            "_post", ("/stages/invitation/invitations/", payload), {"idempotent": False}
+        )
+        return self._invitation_result(r, payload["expires"], flow_slug)
+
+    def _search_flow(self, q: str, limit: int) -> Flow[Dict[str, Any]]:
+        """upstream search, remembered in the search cache (untrimmed)"""
+        fetch = search_cache.fetch_size(limit)
+        data = yield _Call("_get", ("/core/users/",), {"search": q, "page_size": fetch})
+        return self._cache_search(q, data, fetch)
+
+    def _brand_flow(self, brand_uuid: str) -> Flow[Dict[str, Any]]:
+        return self._brand_result((yield _Call("_get", (f"/core/brands/{brand_uuid}/",))))
+
+
+class AuthentikClient(_AuthentikBase):
+    """blocking client for authentik api v3 (cli and other sync callers)"""
+
+    def __init__(self, transport: Optional[httpx.BaseTransport] = None) -> None:
+        super().__init__()
+        self._session: Optional[httpx.Client] = None
+        self._transport = transport
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+
+    def _get_session(self) -> httpx.Client:
+        if self._session is None:
+            s = httpx.Client(transport=self._transport, **self._session_kwargs())
+            s.headers.update(self._headers())
+            self._session = s
+        return self._session
+
+    def close(self) -> None:
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        # one pool per client for every gather; no more threads than pooled connections
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=settings.AK_HTTP_MAX_CONNECTIONS,
+                    thread_name_prefix="authentik",
+                    initializer=_mark_gather_worker,
+                )
+            return self._pool
+
+    def _run(self, flow: Flow[T]) -> T:
+        """drive a shared flow to its result on this thread"""
+        value: Any = None
+        error: Optional[BaseException] = None
+        while True:
+            try:
+                step = flow.throw(error) if error is not None else flow.send(value)
+            except StopIteration as stop:
+                return stop.value
+            value, error = None, None
+            try:
+                value = self._perform(step)
+            except BaseException as e:
+                error = e
+
+    def _perform(self, step: Any) -> Any:
+        if isinstance(step, _Call):
+            return getattr(self, step.name)(*step.args, **step.kwargs)
+        if isinstance(step, _Send):
+            return getattr(self._get_session(), step.method)(step.url, **step.kwargs)
+        if isinstance(step, _Sleep):
+            time.sleep(step.seconds)
+            return None
+        if isinstance(step, _Gather):
+            return self._gather(step.flows, step.limit)
+        raise TypeError(f"unknown flow step: {step!r}")
+
+    def _gather(self, flows: List[Flow[Any]], limit: int) -> List[Any]:
+        """flows on the client's pool, at most limit in flight, results in input order"""
+        if len(flows) < 2 or getattr(_gather_worker, "active", False):
+            # a pool thread waiting on its own pool could starve it; nest inline instead
+            return [self._run(f) for f in flows]
+        pool = self._get_pool()
+        running: Deque[Future[Any]] = deque()
+        out: List[Any] = []
+        for flow in flows:
+            if len(running) >= limit:
+                out.append(running.popleft().result())
+            running.append(pool.submit(self._run, flow))
+        out.extend(f.result() for f in running)
+        return out
+
+    def _get(self, path: str, _op: str = "search", **params: Any) -> Any:
+        return self._run(self._get_flow(path, _op, **params))
+
+    def _post(self, path: str, payload: Dict[str, Any], idempotent: bool = True) -> httpx.Response:
+        return self._run(self._post_flow(path, payload, idempotent))
+
+    def iter_group_users(
+        self, group_uuid: str, page_size: Optional[int] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """yield slim member records page by page, in pk order"""
+        size, page = self._page_size(page_size), 1
+        while page:
+            rows, page = self._run(self._group_page_flow(group_uuid, page, size))
+            yield from rows
+
+    def iter_users(
+        self, page_size: Optional[int] = None, **params: Any
+    ) -> Iterator[Dict[str, Any]]:
+        """yield raw user records across every page (directory sync)"""
+        size, page = self._page_size(page_size), 1
+        while page:
+            rows, page = self._run(self._user_page_flow(page, size, params))
+            yield from rows
+
+    def list_group_users(self, group_uuid: str) -> Dict[str, Any]:
+        return self._run(self._list_group_users_flow(group_uuid))
+
+    def load_group_users(self, group_uuid: str) -> Dict[str, Any]:
+        """fetch a group from authentik, bypassing and then refreshing the cache"""
+        return self._run(self._load_group_users_flow(group_uuid))
+
+    def list_group_page(
+        self,
+        group_uuid: str,
+        q: str = "",
+        sort: str = "pk",
+        page: int = 1,
+        page_size: int = DEFAULT_PAGE_SIZE,
+    ) -> Dict[str, Any]:
+        """one filtered, sorted page of a group with total counts"""
+        view = self._cached_group_view(group_uuid)
+        if view is None:
+            listing = self.list_group_users(group_uuid)
+            view = group_views.build(group_uuid, membership_cache.version(group_uuid), listing)
+        return view.page(q=q, sort=sort, page=page, page_size=page_size)
+
+    def _load_group_users(self, group_uuid: str) -> Dict[str, Any]:
+        return self._run(self._fetch_group_users_flow(group_uuid))
+
+    def list_group_users_embedded(self, group_uuid: str) -> Dict[str, Any]:
+        """one-shot listing via include_users=true (full user objects in one response)"""
+        return self._run(self._embedded_flow(group_uuid))
+
+    def get_user(self, pk: int, partial_ok: bool = False) -> Dict[str, Any]:
+        """user by pk; partial_ok accepts the contact-only rows remembered from listings"""
+        return self._run(self._get_user_flow(pk, partial_ok))
+
+    def get_users(
+        self, pks: Iterable[int], concurrency: Optional[int] = None
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """fetch many users over a bounded thread pool; returns (users, failures)"""
+        return self._run(self._get_users_flow(pks, concurrency))
+
+    def switch_group_user_pk(
+        self, source_group_uuid: str, target_group_uuid: str, user_pk: int
+    ) -> Dict[str, Any]:
+        """add to target and remove from source concurrently; undo a lone half on failure"""
+        return self._run(self._switch_flow(source_group_uuid, target_group_uuid, user_pk))
+
+    def create_invitation(
+        self,
+        name: str | None = None,
+        username: str | None = None,
+        email: str | None = None,
+        single_use: bool = True,
+        expires_days: Optional[int] = None,
+        flow_slug: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        return self._run(
+            self._create_invitation_flow(name, username, email, single_use, expires_days, flow_slug)
+        )
+
+    def search_users(self, q: str, limit: int = 25) -> Dict[str, Any]:
+        limit = self._search_limit(limit)
+        local = self._local_search(q, limit)
+        if local is not None:
+            return local
+        return self._trim_search(self._run(self._search_flow(q, limit)), limit)
+
+    def brand_info(self, brand_uuid: str) -> Dict[str, Any]:
+        return self._run(self._brand_flow(brand_uuid))
+
+
+class AsyncAuthentikClient(_AuthentikBase):
+    """non-blocking client for authentik api v3 (web routes)"""
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None) -> None:
+        super().__init__()
+        self._session: Optional[httpx.AsyncClient] = None
+        self._transport = transport
+        self._searches: Dict[str, "asyncio.Future[Dict[str, Any]]"] = {}
+
+    def _get_session(self) -> httpx.AsyncClient:
+        if self._session is None:
+            s = httpx.AsyncClient(transport=self._transport, **self._session_kwargs())
+            s.headers.update(self._headers())
+            self._session = s
+        return self._session
+
+    async def warm_up(self, connections: Optional[int] = None) -> int:
+        """open pooled connections before the first real request; returns how many succeeded"""
+        n = settings.AK_HTTP_WARMUP_CONNECTIONS if connections is None else int(connections)
+        if n <= 0:
+            return 0
+        session = self._get_session()
+
+        async def _one() -> bool:
+            try:
+                await session.get(self._url("/root/config/"), timeout=self._timeout("search"))
+                return True
+            except Exception:
+                return False
+
+        ok = sum(await asyncio.gather(*(_one() for _ in range(n))))
+        log.info("authentik_warmup", extra={"count": n, "ok": ok})
+        return ok
+
+    async def aclose(self) -> None:
+        if self._session is not None:
+            await self._session.aclose()
+            self._session = None
+
+    async def _run(self, flow: Flow[T]) -> T:
+        """drive a shared flow to its result on the running loop"""
+        value: Any = None
+        error: Optional[BaseException] = None
+        while True:
+            try:
+                step = flow.throw(error) if error is not None else flow.send(value)
+            except StopIteration as stop:
+                return stop.value
+            value, error = None, None
+            try:
+                value = await self._perform(step)
+            except BaseException as e:
+                # cancellation too, so the flow can tidy up before it propagates
+                error = e
+
+    async def _perform(self, step: Any) -> Any:
+        if isinstance(step, _Call):
+            return await getattr(self, step.name)(*step.args, **step.kwargs)
+        if isinstance(step, _Send):
+            return await getattr(self._get_session(), step.method)(step.url, **step.kwargs)
+        if isinstance(step, _Sleep):
+            await asyncio.sleep(step.seconds)
+            return None
+        if isinstance(step, _Gather):
+            sem = asyncio.Semaphore(step.limit)
+
+            async def _one(flow: Flow[Any]) -> Any:
+                async with sem:
+                    return await self._run(flow)
+
+            return list(await asyncio.gather(*(_one(f) for f in step.flows)))
+        raise TypeError(f"unknown flow step: {step!r}")
+
+    async def _get(self, path: str, _op: str = "search", **params: Any) -> Any:
+        return await self._run(self._get_flow(path, _op, **params))
+
+    async def _post(
+        self, path: str, payload: Dict[str, Any], idempotent: bool = True
+    ) -> httpx.Response:
+        return await self._run(self._post_flow(path, payload, idempotent))
+
+    async def aiter_group_pages(
+        self, group_uuid: str, page_size: Optional[int] = None
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """yield slim member records one authentik page at a time, in pk order"""
+        size, page = self._page_size(page_size), 1
+        while page:
+            rows, page = await self._run(self._group_page_flow(group_uuid, page, size))
+            if rows:
+                yield rows
+
+    async def aiter_group_users(
+        self, group_uuid: str, page_size: Optional[int] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """yield slim member records page by page, in pk order"""
+        async for rows in self.aiter_group_pages(group_uuid, page_size):
+            for u in rows:
+                yield u
+
+    async def aiter_users(
+        self, page_size: Optional[int] = None, **params: Any
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """yield raw user records across every page (directory sync)"""
+        size, page = self._page_size(page_size), 1
+        while page:
+            rows, page = await self._run(self._user_page_flow(page, size, params))
+            for u in rows:
+                yield u
+
+    async def list_group_users(self, group_uuid: str) -> Dict[str, Any]:
+        return await self._run(self._list_group_users_flow(group_uuid))
+
+    async def load_group_users(self, group_uuid: str) -> Dict[str, Any]:
+        """fetch a group from authentik, bypassing and then refreshing the cache"""
+        return await self._run(self._load_group_users_flow(group_uuid))
+
+    async def list_group_page(
+        self,
+        group_uuid: str,
+        q: str = "",
+        sort: str = "pk",
+        page: int = 1,
+        page_size: int = DEFAULT_PAGE_SIZE,
+    ) -> Dict[str, Any]:
+        """one filtered, sorted page of a group with total counts"""
+        view = self._cached_group_view(group_uuid)
+        if view is None:
+            listing = await self.list_group_users(group_uuid)
+            # version before leaving the loop: a patch landing during the build must
+            # make this view look stale, not current
+            version = membership_cache.version(group_uuid)
+            view = await asyncio.to_thread(group_views.build, group_uuid, version, listing)
+        return view.page(q=q, sort=sort, page=page, page_size=page_size)
+
+    async def _load_group_users(self, group_uuid: str) -> Dict[str, Any]:
+        return await self._run(self._fetch_group_users_flow(group_uuid))
+
+    async def open_group_stream(
+        self, group_uuid: str
+    ) -> Tuple[str, AsyncIterator[List[Dict[str, Any]]]]:
+        """(group name, batches of slim members as they arrive) without building the
+        whole listing; the first page is fetched here so a failing group raises before
+        anything is sent. cached listings and include_users dumps come back in batches
+        of the page size; members an include_users dump could not load are rows with
+        an "error" key"""
+        cached = membership_cache.get(group_uuid)
+        if cached is not None:
+            return cached["group_name"], self._batched(cached["users"])
+        if settings.AK_GROUP_LISTING == "paged":
+            try:
+                group = await self._get(f"/core/groups/{group_uuid}/", include_users="false")
+                pages = self.aiter_group_pages(group_uuid)
+                first = await anext(pages, [])
+            except RuntimeError as e:
+                self._log_listing_fallback(group_uuid, e)
+            else:
+                name = (group.get("name") if isinstance(group, dict) else "") or ""
+                return name, self._prepend(first, pages)
+        listing = await self.list_group_users_embedded(group_uuid)
+        return listing["group_name"], self._batched(
+            listing["users"] + list(listing.get("failed") or [])
+        )
+
+    async def _batched(self, rows: List[Dict[str, Any]]) -> AsyncIterator[List[Dict[str, Any]]]:
+        size = self._page_size(None)
+        for i in range(0, len(rows), size):
+            yield rows[i : i + size]
+
+    @staticmethod
+    async def _prepend(
+        first: List[Dict[str, Any]], rest: AsyncIterator[List[Dict[str, Any]]]
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        if first:
+            yield first
+        async for rows in rest:
+            yield rows
+
+    async def list_group_users_embedded(self, group_uuid: str) -> Dict[str, Any]:
+        """one-shot listing via include_users=true (full user objects in one response)"""
+        return await self._run(self._embedded_flow(group_uuid))
+
+    async def get_user(self, pk: int, partial_ok: bool = False) -> Dict[str, Any]:
+        """user by pk; partial_ok accepts the contact-only rows remembered from listings"""
+        return await self._run(self._get_user_flow(pk, partial_ok))
+
+    async def get_users(
+        self, pks: Iterable[int], concurrency: Optional[int] = None
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """fetch many users with at most `concurrency` requests in flight; returns (users, failures)"""
+        return await self._run(self._get_users_flow(pks, concurrency))
+
+    async def switch_group_user_pk(
+        self, source_group_uuid: str, target_group_uuid: str, user_pk: int
+    ) -> Dict[str, Any]:
+        """add to target and remove from source concurrently; undo a lone half on failure"""
+        return await self._run(self._switch_flow(source_group_uuid, target_group_uuid, user_pk))
+
+    async def create_invitation(
+        self,
+        name: str | None = None,
+        username: str | None = None,
+        email: str | None = None,
+        single_use: bool = True,
+        expires_days: Optional[int] = None,
+        flow_slug: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        return await self._run(
+            self._create_invitation_flow(name, username, email, single_use, expires_days, flow_slug)
+        )
+
+    async def search_users(self, q: str, limit: int = 25) -> Dict[str, Any]:
+        limit = self._search_limit(limit)
+        local = self._local_search(q, limit)
+        if local is not None:
+            return local
+        # identical queries in flight share one upstream call
+        key = search_cache.key(q)
+        pending = self._searches.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(self._run(self._search_flow(q, limit)))
+            self._searches[key] = pending
+            pending.add_done_callback(lambda _f: self._searches.pop(key, None))
+        # shielded so one cancelled caller does not cancel the others
+        return self._trim_search(dict(await asyncio.shield(pending), query=q), limit)
+
+    async def brand_info(self, brand_uuid: str) -> Dict[str, Any]:
+        return await self._run(self._brand_flow(brand_uuid))
+
 
 ak = AuthentikClient()
+aak = AsyncAuthentikClient()
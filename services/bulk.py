@@ -0,0 +1,82 @@
+# services/bulk.py
+from __future__ import annotations
+
+import asyncio
+import secrets
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, TypeVar
+
+from services.events import events
+from tools.settings import settings
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def bulk_concurrency(limit: Optional[int] = None) -> int:
+    """per-request worker count for bulk routes (BULK_CONCURRENCY unless overridden)"""
+    return max(1, int(limit or settings.BULK_CONCURRENCY))
+
+
+async def run_bounded(
+    items: Iterable[T],
+    worker: Callable[[T], Awaitable[R]],
+    limit: Optional[int] = None,
+    on_result: Optional[Callable[[R], None]] = None,
+) -> List[R]:
+    """run worker over items with at most `limit` in flight; results keep input order.
+
+    workers should turn their own failures into results; an escaping exception
+    propagates straight away (gather semantics). on_result sees each result as it lands.
+    """
+    sem = asyncio.Semaphore(bulk_concurrency(limit))
+
+    async def _one(item: T) -> R:
+        async with sem:
+            result = await worker(item)
+        if on_result is not None:
+            on_result(result)
+        return result
+
+    return list(await asyncio.gather(*(_one(i) for i in items)))
+
+
+class BulkProgress:
+    """counts of one bulk run, published as "bulk" events while it goes"""
+
+    def __init__(self, action: str, total: int, id: Optional[str] = None) -> None:
+        self.id = id or secrets.token_hex(6)
+        self.action = action
+        self.total = total
+        self.ok = 0
+        self.failed = 0
+
+    @property
+    def done(self) -> int:
+        return self.ok + self.failed
+
+    def snapshot(self, state: str) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "action": self.action,
+            "state": state,
+            "total": self.total,
+            "done": self.done,
+            "ok": self.ok,
+            "failed": self.failed,
+        }
+
+    def start(self) -> None:
+        events.publish("bulk", self.snapshot("running"))
+
+    def item(self, result: Dict[str, Any]) -> None:
+        """on_result hook for run_bounded; results carry an "ok" flag"""
+        if result.get("ok"):
+            self.ok += 1
+        else:
+            self.failed += 1
+        # invite rows have no user yet; they are told apart by their row number
+        mark = {"row": result["row"]} if "row" in result else {"pk": result.get("pk")}
+        events.publish("bulk", dict(self.snapshot("running"), **mark))
+
+    def finish(self, state: str = "finished") -> None:
+        events.publish("bulk", self.snapshot(state))
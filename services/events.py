@@ -0,0 +1,141 @@
+# services/events.py
+from __future__ import annotations
+
+import asyncio
+import json
+import secrets
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+from tools.settings import settings
+
+# (seq, type, data)
+_Event = Tuple[int, str, Dict[str, Any]]
+
+
+class Subscription:
+    """one /events client: a bounded queue the broker fills and the response drains.
+
+    the broker never waits for a client. when the queue is full the subscription is
+    marked lagged and the stream ends; the browser reconnects with Last-Event-ID and
+    resumes from the replay buffer.
+    """
+
+    def __init__(self, limit: int) -> None:
+        self._limit = max(1, limit)
+        self._loop = asyncio.get_running_loop()
+        self._queue: Deque[_Event] = deque()
+        self._ready = asyncio.Event()
+        self.lagged = False
+
+    def _offer(self, event: _Event) -> None:
+        # runs on the subscriber's loop
+        if self.lagged:
+            return
+        if len(self._queue) >= self._limit:
+            self.lagged = True
+        else:
+            self._queue.append(event)
+        self._ready.set()
+
+    def offer(self, event: _Event) -> None:
+        try:
+            same_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            same_loop = False
+        if same_loop:
+            self._offer(event)
+        else:
+            self._loop.call_soon_threadsafe(self._offer, event)
+
+    async def next_batch(self, timeout: float) -> List[_Event]:
+        """events queued so far, waiting up to timeout for the first; [] on timeout"""
+        if not self._queue and not self.lagged:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        out = list(self._queue)
+        self._queue.clear()
+        return out
+
+
+class EventBroker:
+    """in-process fan-out of app events to /events subscribers, with a replay buffer
+    so a reconnecting client picks up where it left off"""
+
+    def __init__(self, buffer: Optional[int] = None) -> None:
+        self._buffer_size = buffer
+        self._lock = threading.Lock()
+        self._epoch = secrets.token_hex(4)
+        self._seq = 0
+        self._recent: Deque[_Event] = deque()
+        self._subs: Set[Subscription] = set()
+
+    @property
+    def buffer_size(self) -> int:
+        n = settings.EVENTS_BUFFER if self._buffer_size is None else self._buffer_size
+        return max(1, int(n))
+
+    def event_id(self, seq: int) -> str:
+        return f"{self._epoch}.{seq}"
+
+    def publish(self, type_: str, data: Dict[str, Any]) -> str:
+        """queue an event for every subscriber and return its id; never blocks, safe from
+        any thread"""
+        with self._lock:
+            self._seq += 1
+            event = (self._seq, type_, data)
+            self._recent.append(event)
+            while len(self._recent) > self.buffer_size:
+                self._recent.popleft()
+            subs = list(self._subs)
+        for sub in subs:
+            sub.offer(event)
+        return self.event_id(event[0])
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> Tuple[Subscription, bool]:
+        """(subscription, resumed); resumed is True when every event after last_event_id
+        is queued for replay. otherwise the client may have missed some and should reload"""
+        sub = Subscription(settings.EVENTS_QUEUE_SIZE)
+        with self._lock:
+            self._subs.add(sub)
+            if not last_event_id:
+                return sub, False
+            epoch, _, seq = last_event_id.partition(".")
+            if epoch != self._epoch or not seq.isdigit() or int(seq) > self._seq:
+                return sub, False
+            after = int(seq)
+            oldest = self._recent[0][0] if self._recent else self._seq + 1
+            if after + 1 < oldest:
+                return sub, False
+            # a replay may exceed the queue limit; only live events count against it
+            sub._queue.extend(e for e in self._recent if e[0] > after)
+        sub._ready.set()
+        return sub, True
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            self._subs.discard(sub)
+
+    @property
+    def subscribers(self) -> int:
+        with self._lock:
+            return len(self._subs)
+
+    def format(self, event: _Event) -> str:
+        """one server-sent event frame"""
+        seq, type_, data = event
+        body = json.dumps(data, separators=(",", ":"))
+        return f"id: {self.event_id(seq)}\nevent: {type_}\ndata: {body}\n\n"
+
+    def clear(self) -> None:
+        with self._lock:
+            self._recent.clear()
+            self._subs.clear()
+            self._epoch = secrets.token_hex(4)
+
+
+events = EventBroker()
@@ -0,0 +1,162 @@
+# services/group_view.py
+from __future__ import annotations
+
+import bisect
+import math
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+# sortable columns; "-username" sorts descending
+SORT_FIELDS = ("pk", "username", "email")
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# separates fields and rows in the filter haystack; a query containing it matches nothing
+_SEP = "\x00"
+
+
+def parse_sort(sort: str) -> Tuple[str, bool]:
+    """'-email' -> ('email', True); raises ValueError for unknown columns"""
+    sort = (sort or "pk").strip()
+    field, desc = (sort[1:], True) if sort.startswith("-") else (sort, False)
+    if field not in SORT_FIELDS:
+        raise ValueError(f"sort must be one of: {', '.join(SORT_FIELDS)} (prefix - to reverse)")
+    return field, desc
+
+
+class GroupView:
+    """one group listing prepared for paging: rows in pk order, one lowercase haystack
+    string for filtering and per-column sort orders built on first use.
+
+    filtering matches the same way the table filter always has: a case-insensitive
+    substring of pk, username or email.
+    """
+
+    def __init__(self, listing: Dict[str, Any]) -> None:
+        self.group_name: str = listing.get("group_name") or ""
+        self.failed: List[Dict[str, Any]] = list(listing.get("failed") or [])
+        self.rows: List[Dict[str, Any]] = sorted(
+            listing.get("users") or [], key=lambda u: int(u.get("pk") or 0)
+        )
+        keys = [
+            _SEP.join(str(u.get(f) if u.get(f) is not None else "") for f in SORT_FIELDS).lower()
+            for u in self.rows
+        ]
+        # row i occupies _hay[_starts[i]:_starts[i + 1] - 1]
+        self._hay = _SEP.join(keys)
+        self._starts: List[int] = []
+        pos = 0
+        for k in keys:
+            self._starts.append(pos)
+            pos += len(k) + 1
+        self._lock = threading.Lock()
+        self._orders: Dict[str, Tuple[List[int], List[int]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _order(self, field: str) -> Tuple[List[int], List[int]]:
+        """(row numbers sorted by field, rank of each row in that order)"""
+        with self._lock:
+            cached = self._orders.get(field)
+            if cached is None:
+                n = len(self.rows)
+                if field == "pk":
+                    order = list(range(n))
+                else:
+                    keys = [str(u.get(field) or "").lower() for u in self.rows]
+                    order = sorted(range(n), key=lambda i: (keys[i], i))
+                rank = [0] * n
+                for r, i in enumerate(order):
+                    rank[i] = r
+                self._orders[field] = cached = (order, rank)
+            return cached
+
+    def matching(self, q: str) -> Optional[List[int]]:
+        """row numbers whose pk, username or email contains q; None means every row"""
+        needle = (q or "").strip().lower()
+        if not needle:
+            return None
+        if _SEP in needle:
+            return []
+        hay, starts, out = self._hay, self._starts, []
+        pos = hay.find(needle)
+        while pos != -1:
+            row = bisect.bisect_right(starts, pos) - 1
+            out.append(row)
+            if row + 1 >= len(starts):
+                break
+            # one hit per row is enough; carry on from the next row
+            pos = hay.find(needle, starts[row + 1])
+        return out
+
+    def page(
+        self,
+        q: str = "",
+        sort: str = "pk",
+        page: int = 1,
+        page_size: int = DEFAULT_PAGE_SIZE,
+    ) -> Dict[str, Any]:
+        """one page of the listing plus the counts the pager needs"""
+        field, desc = parse_sort(sort)
+        size = max(1, min(int(page_size or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+        hits = self.matching(q)
+        matched = len(self.rows) if hits is None else len(hits)
+        pages = max(1, math.ceil(matched / size))
+        page = min(max(1, int(page or 1)), pages)
+        start = (page - 1) * size
+
+        order, rank = self._order(field)
+        if hits is not None:
+            order = sorted(hits, key=rank.__getitem__)
+        if desc:
+            end = len(order) - start
+            chosen = order[max(0, end - size) : end][::-1]
+        else:
+            chosen = order[start : start + size]
+
+        out: Dict[str, Any] = {
+            "group_name": self.group_name,
+            "users": [dict(self.rows[i]) for i in chosen],
+            "total": len(self.rows),
+            "matched": matched,
+            "page": page,
+            "page_size": size,
+            "pages": pages,
+            "q": (q or "").strip(),
+            "sort": f"-{field}" if desc else field,
+        }
+        if self.failed:
+            out["failed"] = self.failed
+        return out
+
+
+class GroupViews:
+    """the prepared view of each cached group listing, rebuilt when the listing changes"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._views: Dict[str, Tuple[int, GroupView]] = {}
+
+    def lookup(self, group_uuid: str, version: Optional[int]) -> Optional[GroupView]:
+        """the view built for this version of the cached listing, if there is one"""
+        if version is None:
+            return None
+        with self._lock:
+            entry = self._views.get(group_uuid)
+        return entry[1] if entry is not None and entry[0] == version else None
+
+    def build(self, group_uuid: str, version: Optional[int], listing: Dict[str, Any]) -> GroupView:
+        """prepare listing; kept for reuse only when it is a cached listing (version set)"""
+        view = GroupView(listing)
+        if version is not None:
+            with self._lock:
+                self._views[group_uuid] = (version, view)
+        return view
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._views.clear()
+
+
+group_views = GroupViews()
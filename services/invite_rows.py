@@ -0,0 +1,105 @@
+# services/invite_rows.py
+from __future__ import annotations
+
+import csv
+import io
+from typing import Any, Dict, List, Optional
+
+# columns a bulk csv may carry; anything else is ignored
+CSV_COLUMNS = ("name", "username", "email", "single_use", "expires_days", "flow")
+
+
+def invite_fields(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """normalize one invite request into create_invitation's arguments"""
+    raw_name = (payload.get("name") or "").strip()
+    raw_username = (payload.get("username") or "").strip()
+    email = (payload.get("email") or "").strip().lower()
+
+    # default username: prefer explicit username, then name, then local part of email
+    username = (
+        raw_username or raw_name or (email.split("@", 1)[0] if email and "@" in email else "")
+    )
+    name = raw_name or username
+
+    flow_override = (payload.get("flow") or "").strip()
+    expires_days = payload.get("expires_days")
+    return {
+        "name": name,
+        "username": username,
+        "email": email,
+        "single_use": bool(payload.get("single_use", True)),
+        "expires_days": (int(expires_days) if isinstance(expires_days, (int, float)) else None),
+        "flow_slug": flow_override or None,
+    }
+
+
+def parse_flag(value: Any) -> Optional[bool]:
+    """a csv cell or json value as a boolean; None when blank"""
+    if value is None or isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if not text:
+        return None
+    if text in ("1", "true", "yes", "y"):
+        return True
+    if text in ("0", "false", "no", "n"):
+        return False
+    raise ValueError(f"not a boolean: {value!r}")
+
+
+def parse_days(value: Any) -> Optional[int]:
+    """a csv cell or json value as a whole number of days; None when blank"""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f"not a number of days: {value!r}")
+    try:
+        days = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"not a number of days: {value!r}")
+    if days < 1 or days != int(days):
+        raise ValueError(f"not a number of days: {value!r}")
+    return int(days)
+
+
+def read_csv(text: str) -> List[Dict[str, Any]]:
+    """rows of a bulk invite csv keyed by lowercased header; ValueError without a usable header"""
+    reader = csv.DictReader(io.StringIO(text))
+    headers = [(h or "").strip().lower() for h in (reader.fieldnames or [])]
+    if not {"name", "username", "email"} & set(headers):
+        raise ValueError("csv needs a header with name, username or email")
+    reader.fieldnames = headers
+    return [{k: v for k, v in raw.items() if k in CSV_COLUMNS} for raw in reader]
+
+
+def plan_rows(rows: List[Any], defaults: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """one entry per input row, numbered from 1, holding its normalized "fields" or, for a
+    row that must be skipped, an "error". emails are deduped case-insensitively"""
+    entries: List[Dict[str, Any]] = []
+    seen: Dict[str, int] = {}
+    for n, row in enumerate(rows, start=1):
+        entry: Dict[str, Any] = {"row": n}
+        entries.append(entry)
+        if not isinstance(row, dict):
+            entry["error"] = "row must be an object"
+            continue
+        merged = {**defaults, **{k: v for k, v in row.items() if v not in (None, "")}}
+        try:
+            single_use = parse_flag(merged.get("single_use"))
+            merged["single_use"] = True if single_use is None else single_use
+            merged["expires_days"] = parse_days(merged.get("expires_days"))
+        except ValueError as e:
+            entry["error"] = str(e)
+            continue
+        fields = invite_fields(merged)
+        entry["fields"] = fields
+        email = fields["email"]
+        if not (fields["name"] or email):
+            entry["error"] = "name, username or email is required"
+        elif email and ("@" not in email or email.startswith("@") or email.endswith("@")):
+            entry["error"] = f"invalid email: {email}"
+        elif email in seen:
+            entry["error"] = f"duplicate of row {seen[email]}"
+        elif email:
+            seen[email] = n
+    return entries
@@ -0,0 +1,245 @@
+# services/jobs.py
+from __future__ import annotations
+
+import asyncio
+import logging
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from services.bulk import BulkProgress, run_bounded
+from tools.settings import settings
+
+logger = logging.getLogger("authentik_helper.jobs")
+
+# terminal states; queued and running jobs are never dropped from the history
+DONE_STATES = frozenset({"finished", "cancelled"})
+
+Worker = Callable[[Any], Awaitable[Dict[str, Any]]]
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class Job:
+    """one submitted bulk run: its items, the worker for one item and what came back.
+
+    worker results carry an "ok" flag, like the bulk routes' results.
+    """
+
+    def __init__(
+        self,
+        action: str,
+        items: Iterable[Any],
+        worker: Worker,
+        options: Optional[Dict[str, Any]] = None,
+        retry_of: Optional[str] = None,
+    ) -> None:
+        self.id = uuid.uuid4().hex
+        self.action = action
+        self.items = list(items)
+        self.worker = worker
+        self.options = dict(options or {})
+        self.retry_of = retry_of
+        self.state = "queued"
+        self.error: Optional[str] = None
+        self.cancel_requested = False
+        self.created_at = self.updated_at = _now()
+        self.started_at: Optional[str] = None
+        self.finished_at: Optional[str] = None
+        # (item, result) in the order they finished
+        self.results: List[Tuple[Any, Dict[str, Any]]] = []
+        self._ok: Set[int] = set()  # positions in items that succeeded
+        self.progress = BulkProgress(action, len(self.items), id=self.id)
+        self._changed = asyncio.Event()
+
+    @property
+    def active(self) -> bool:
+        return self.state not in DONE_STATES
+
+    def changed(self) -> asyncio.Event:
+        """set on the next update; take it before reading the state you wait on"""
+        return self._changed
+
+    def _touch(self) -> None:
+        self.updated_at = _now()
+        old, self._changed = self._changed, asyncio.Event()
+        old.set()
+
+    def unfinished_items(self) -> List[Any]:
+        """items that failed or never ran (cancelled or crashed), in submission order"""
+        return [item for i, item in enumerate(self.items) if i not in self._ok]
+
+    def status(self, results: bool = False) -> Dict[str, Any]:
+        """counts and timestamps; results=True adds every result and the failed ones"""
+        ok = sum(1 for _, r in self.results if r.get("ok"))
+        out: Dict[str, Any] = {
+            "id": self.id,
+            "action": self.action,
+            "state": self.state,
+            "total": len(self.items),
+            "done": len(self.results),
+            "ok": ok,
+            "failed": len(self.results) - ok,
+            "options": self.options,
+            "retry_of": self.retry_of,
+            "cancel_requested": self.cancel_requested,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "updated_at": self.updated_at,
+        }
+        if results:
+            out["results"] = [r for _, r in self.results]
+            out["failures"] = [r for r in out["results"] if not r.get("ok")]
+        return out
+
+
+class JobScheduler:
+    """in-process queue of bulk jobs on the server's event loop.
+
+    jobs run one after another, BULK_CONCURRENCY items at a time, so a few big
+    submissions never add up to more load on authentik than one bulk request. the
+    last JOBS_HISTORY finished jobs stay available for status, streaming and retry.
+    """
+
+    def __init__(self, history: Optional[int] = None) -> None:
+        self._history_n = history
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._queue: Deque[Job] = deque()
+        self._runner: Optional[asyncio.Task] = None
+
+    # public api
+
+    def submit(
+        self,
+        action: str,
+        items: Iterable[Any],
+        worker: Worker,
+        options: Optional[Dict[str, Any]] = None,
+        retry_of: Optional[str] = None,
+    ) -> Job:
+        """queue a job and start the runner if it is idle; call from the event loop"""
+        job = Job(action, items, worker, options, retry_of)
+        self._jobs[job.id] = job
+        self._queue.append(job)
+        self._trim_history()
+        logger.info(
+            "job_queued", extra={"job_id": job.id, "count": len(job.items), "action": action}
+        )
+        runner = self._runner
+        if runner is None or runner.done() or runner.get_loop() is not asyncio.get_running_loop():
+            self._runner = asyncio.create_task(self._run_queue())
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        """newest first"""
+        return list(reversed(self._jobs.values()))
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """stop a job: queued ones never start, running ones start no further items.
+        items already in flight finish, so no user is left halfway through a move"""
+        job = self._jobs.get(job_id)
+        if job is None or not job.active:
+            return job
+        job.cancel_requested = True
+        if job.state == "queued":
+            self._queue.remove(job)
+            self._finish(job, "cancelled")
+        else:
+            job._touch()
+        logger.info("job_cancel_requested", extra={"job_id": job.id})
+        return job
+
+    def retry(self, job_id: str) -> Optional[Job]:
+        """a new job for the items that failed or never ran; None when there are none"""
+        job = self._jobs.get(job_id)
+        if job is None or job.active:
+            return None
+        items = job.unfinished_items()
+        if not items:
+            return None
+        return self.submit(job.action, items, job.worker, job.options, retry_of=job.id)
+
+    async def shutdown(self, timeout: float = 10.0) -> None:
+        """cancel everything and give in-flight items up to timeout to land"""
+        for job in list(self._jobs.values()):
+            self.cancel(job.id)
+        runner = self._runner
+        if runner is not None and not runner.done():
+            try:
+                await asyncio.wait_for(asyncio.shield(runner), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("jobs_shutdown_timeout", extra={"count": len(self._queue)})
+
+    def clear(self) -> None:
+        """forget finished jobs (tests)"""
+        for job_id in [j for j, job in self._jobs.items() if not job.active]:
+            del self._jobs[job_id]
+
+    # internals
+
+    def _trim_history(self) -> None:
+        limit = max(1, int(self._history_n or settings.JOBS_HISTORY))
+        finished = [j for j, job in self._jobs.items() if not job.active]
+        for job_id in finished[: max(0, len(self._jobs) - limit)]:
+            del self._jobs[job_id]
+
+    def _finish(self, job: Job, state: str) -> None:
+        job.state = state
+        job.finished_at = _now()
+        job._touch()
+        job.progress.finish(state)
+        self._trim_history()
+
+    async def _run_queue(self) -> None:
+        while self._queue:
+            await self._run(self._queue.popleft())
+
+    async def _run(self, job: Job) -> None:
+        job.state = "running"
+        job.started_at = _now()
+        job._touch()
+        job.progress.start()
+
+        async def _one(i: int) -> Optional[Tuple[int, Dict[str, Any]]]:
+            if job.cancel_requested:
+                return None
+            return i, await job.worker(job.items[i])
+
+        def _landed(landed: Optional[Tuple[int, Dict[str, Any]]]) -> None:
+            if landed is None:
+                return
+            i, result = landed
+            job.results.append((job.items[i], result))
+            if result.get("ok"):
+                job._ok.add(i)
+            job.progress.item(result)
+            job._touch()
+
+        try:
+            await run_bounded(range(len(job.items)), _one, on_result=_landed)
+        except Exception as e:
+            # workers turn their own failures into results; this is a bug, not a bad item
+            job.error = str(e)
+            logger.exception("job_crashed", extra={"job_id": job.id, "error": str(e)})
+        self._finish(job, "cancelled" if job.cancel_requested else "finished")
+        status = job.status()
+        logger.info(
+            "job_finished",
+            extra={
+                "job_id": job.id,
+                "outcome": job.state,
+                "ok": status["ok"],
+                "failed": status["failed"],
+            },
+        )
+
+
+job_scheduler = JobScheduler()
@@ -0,0 +1,99 @@
+# services/membership_cache.py
+from __future__ import annotations
+
+import itertools
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from tools.settings import settings
+
+
+class MembershipCache:
+    """group listings keyed by group uuid; expires after a ttl, patched in place on switches"""
+
+    def __init__(
+        self,
+        ttl: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        # group uuid -> (stored_at, group_name, {pk: slim user})
+        self._groups: Dict[str, Tuple[float, str, Dict[int, Dict[str, Any]]]] = {}
+        # group uuid -> version of the stored listing; bumped on every put and patch
+        self._versions: Dict[str, int] = {}
+        self._counter = itertools.count(1)
+
+    @property
+    def ttl(self) -> float:
+        return max(0.0, float(settings.AK_MEMBERSHIP_CACHE_TTL if self._ttl is None else self._ttl))
+
+    @staticmethod
+    def _listing(name: str, members: Dict[int, Dict[str, Any]]) -> Dict[str, Any]:
+        return {"group_name": name, "users": [members[pk] for pk in sorted(members)]}
+
+    def get(self, group_uuid: str) -> Optional[Dict[str, Any]]:
+        """fresh listing in the same shape list_group_users returns, or None"""
+        with self._lock:
+            entry = self._groups.get(group_uuid)
+            if entry is None:
+                return None
+            stored_at, name, members = entry
+            if self._clock() - stored_at >= self.ttl:
+                del self._groups[group_uuid]
+                return None
+            return self._listing(name, members)
+
+    def version(self, group_uuid: str) -> Optional[int]:
+        """changes whenever the cached listing does; None when nothing is cached"""
+        with self._lock:
+            entry = self._groups.get(group_uuid)
+            if entry is None or self._clock() - entry[0] >= self.ttl:
+                return None
+            return self._versions.get(group_uuid)
+
+    def put(self, group_uuid: str, listing: Dict[str, Any]) -> None:
+        """remember a complete listing; partial ones (with failures) are not kept"""
+        if self.ttl <= 0 or listing.get("failed"):
+            return
+        members: Dict[int, Dict[str, Any]] = {}
+        for u in listing.get("users") or []:
+            if u.get("pk") is not None:
+                members[int(u["pk"])] = dict(u)
+        with self._lock:
+            self._groups[group_uuid] = (self._clock(), listing.get("group_name") or "", members)
+            self._versions[group_uuid] = next(self._counter)
+
+    def move(self, source_group_uuid: str, target_group_uuid: str, user_pk: int) -> None:
+        """write-through for a successful switch: move the pk without refetching"""
+        pk = int(user_pk)
+        with self._lock:
+            src = self._groups.get(source_group_uuid)
+            dst = self._groups.get(target_group_uuid)
+            record = src[2].pop(pk, None) if src else None
+            if src is not None:
+                self._versions[source_group_uuid] = next(self._counter)
+            if dst is None:
+                return
+            if record is None:
+                # we never saw this user; the target listing can't be patched honestly
+                del self._groups[target_group_uuid]
+                return
+            dst[2][pk] = record
+            self._versions[target_group_uuid] = next(self._counter)
+
+    def invalidate(self, *group_uuids: str) -> None:
+        """drop the given groups, or everything when called without arguments"""
+        with self._lock:
+            if not group_uuids:
+                self._groups.clear()
+                self._versions.clear()
+                return
+            for g in group_uuids:
+                self._groups.pop(g, None)
+                self._versions.pop(g, None)
+
+
+membership_cache = MembershipCache()
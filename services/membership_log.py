@@ -0,0 +1,223 @@
+# services/membership_log.py
+from __future__ import annotations
+
+import asyncio
+import logging
+import secrets
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, Optional, Set, Tuple
+
+from services.events import events
+from tools.settings import settings
+
+log = logging.getLogger("authentik_helper.membership_log")
+
+# (seq, group uuid, pk, op, record); op is "add", "edit" or "remove" (record None)
+_Entry = Tuple[int, str, int, str, Optional[Dict[str, Any]]]
+
+# a membership event naming more users than this only says "reload"
+EVENT_MAX_USERS = 500
+
+
+class Delta:
+    """what happened to one group since a version token"""
+
+    def __init__(self) -> None:
+        self.added: Dict[int, Dict[str, Any]] = {}
+        self.removed: Set[int] = set()
+        self.changed: Dict[int, Dict[str, Any]] = {}
+
+    @property
+    def touched(self) -> Set[int]:
+        return set(self.added) | self.removed | set(self.changed)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "added": [self.added[pk] for pk in sorted(self.added)],
+            "removed": sorted(self.removed),
+            "changed": [self.changed[pk] for pk in sorted(self.changed)],
+        }
+
+
+class MembershipLog:
+    """bounded log of membership changes per group, behind opaque version tokens.
+
+    fed by successful switches and by every full listing loaded from authentik, which
+    is diffed against the last one seen (reconciliation). a token older than the log
+    reaches, from before a restart, or from before the group had a baseline cannot be
+    answered; callers then reload the group in full.
+    """
+
+    def __init__(self, maxlen: Optional[int] = None) -> None:
+        self._maxlen = maxlen
+        self._lock = threading.Lock()
+        self._epoch = secrets.token_hex(4)  # tokens from another process never match
+        self._seq = 0
+        self._entries: Deque[_Entry] = deque()
+        self._trimmed = 0  # highest seq dropped off the front
+        self._known: Dict[str, Dict[int, Dict[str, Any]]] = {}  # group -> pk -> record
+        self._floor: Dict[str, int] = {}  # oldest seq each group's baseline answers from
+
+    @property
+    def maxlen(self) -> int:
+        return max(
+            1, int(settings.AK_MEMBERSHIP_LOG_SIZE if self._maxlen is None else self._maxlen)
+        )
+
+    def _token(self) -> str:
+        return f"{self._epoch}.{self._seq}"
+
+    def version(self) -> str:
+        """token for the current state of every group"""
+        with self._lock:
+            return self._token()
+
+    def _append(
+        self, group_uuid: str, pk: int, op: str, record: Optional[Dict[str, Any]] = None
+    ) -> None:
+        # caller holds the lock
+        self._seq += 1
+        self._entries.append((self._seq, group_uuid, pk, op, record))
+        while len(self._entries) > self.maxlen:
+            self._trimmed = self._entries.popleft()[0]
+
+    def _publish(self, group_uuid: str, delta: Optional[Delta]) -> None:
+        # caller holds the lock, so events go out in log order; same shape as a ?since= reply
+        data: Dict[str, Any] = {"group": group_uuid, "version": self._token()}
+        if delta is None or len(delta.touched) > EVENT_MAX_USERS:
+            data["reset"] = True
+        else:
+            data.update(delta.as_dict())
+        events.publish("membership", data)
+
+    def _forget(self, group_uuid: str) -> None:
+        # caller holds the lock; no token issued so far can be answered for this group
+        self._known.pop(group_uuid, None)
+        self._floor[group_uuid] = self._seq + 1
+
+    def observe(self, group_uuid: str, listing: Dict[str, Any]) -> int:
+        """reconcile a full listing fresh from authentik; returns how many changes it logged"""
+        with self._lock:
+            if listing.get("failed"):
+                # members we could not load look removed; don't guess
+                had_baseline = group_uuid in self._known
+                self._forget(group_uuid)
+                if had_baseline:
+                    self._publish(group_uuid, None)
+                return 0
+            new = {int(u["pk"]): dict(u) for u in listing.get("users") or [] if u.get("pk")}
+            old = self._known.get(group_uuid)
+            self._known[group_uuid] = new
+            if old is None:
+                self._floor[group_uuid] = self._seq
+                return 0
+            delta = Delta()
+            for pk in sorted(new.keys() - old.keys()):
+                self._append(group_uuid, pk, "add", new[pk])
+                delta.added[pk] = new[pk]
+            for pk in sorted(old.keys() - new.keys()):
+                self._append(group_uuid, pk, "remove")
+                delta.removed.add(pk)
+            for pk in sorted(new.keys() & old.keys()):
+                if new[pk] != old[pk]:
+                    self._append(group_uuid, pk, "edit", new[pk])
+                    delta.changed[pk] = new[pk]
+            n = len(delta.touched)
+            if n:
+                self._publish(group_uuid, delta)
+            return n
+
+    def moved(
+        self,
+        source_group_uuid: str,
+        target_group_uuid: str,
+        pk: int,
+        record: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """a switch landed: pk left source and joined target"""
+        pk = int(pk)
+        with self._lock:
+            src = self._known.get(source_group_uuid)
+            if src is not None:
+                record = src.pop(pk, None) or record
+                self._append(source_group_uuid, pk, "remove")
+                left = Delta()
+                left.removed.add(pk)
+                self._publish(source_group_uuid, left)
+            dst = self._known.get(target_group_uuid)
+            if dst is None:
+                return
+            if record is None:
+                # we can't tell clients what joined; make them reload the target
+                self._forget(target_group_uuid)
+                self._publish(target_group_uuid, None)
+                return
+            dst[pk] = dict(record)
+            self._append(target_group_uuid, pk, "add", dict(record))
+            joined = Delta()
+            joined.added[pk] = dict(record)
+            self._publish(target_group_uuid, joined)
+
+    def _seq_of(self, token: str) -> Optional[int]:
+        epoch, _, seq = (token or "").partition(".")
+        if epoch != self._epoch or not seq.isdigit():
+            return None
+        n = int(seq)
+        return n if n <= self._seq else None
+
+    def since(self, group_uuid: str, token: str) -> Tuple[Optional[Delta], str]:
+        """(changes to the group after token or None if it can't be answered, new token)"""
+        with self._lock:
+            current = self._token()
+            seq = self._seq_of(token)
+            if (
+                seq is None
+                or group_uuid not in self._known
+                or seq < self._floor.get(group_uuid, self._seq + 1)
+                or seq < self._trimmed
+            ):
+                return None, current
+            was: Dict[int, bool] = {}  # pk -> in the group at token time
+            now: Dict[int, Optional[Dict[str, Any]]] = {}  # pk -> latest record, None if gone
+            for s, g, pk, op, record in self._entries:
+                if s <= seq or g != group_uuid:
+                    continue
+                was.setdefault(pk, op != "add")
+                now[pk] = record
+        delta = Delta()
+        for pk, record in now.items():
+            if record is None:
+                if was[pk]:
+                    delta.removed.add(pk)
+            elif was[pk]:
+                delta.changed[pk] = record
+            else:
+                delta.added[pk] = record
+        return delta, current
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._known.clear()
+            self._floor.clear()
+            self._trimmed = 0
+            self._epoch = secrets.token_hex(4)
+
+
+membership_log = MembershipLog()
+
+
+async def run_reconcile(client: Any, group_uuids: Iterable[str]) -> None:
+    """background loop: reload each group from authentik so changes made elsewhere
+    (the authentik admin, other tools) reach the log"""
+    groups = [g for g in group_uuids if g]
+    while True:
+        await asyncio.sleep(max(1.0, settings.AK_MEMBERSHIP_RECONCILE))
+        for g in groups:
+            try:
+                await client.load_group_users(g)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning("membership_reconcile_failed", extra={"group": g, "error": str(e)})
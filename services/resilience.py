@@ -0,0 +1,179 @@
+# services/resilience.py
+from __future__ import annotations
+
+import random
+import threading
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional
+
+import httpx
+
+from tools.settings import settings
+
+# statuses that mean "try again later" rather than "your request is wrong"
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# transport errors raised before the request reached authentik; safe to resend anything
+_NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class CircuitOpenError(RuntimeError):
+    """raised instead of calling authentik while its circuit is open"""
+
+    def __init__(self, host: str, retry_in: float) -> None:
+        super().__init__(f"circuit open for {host}; retry in {retry_in:.1f}s")
+        self.host = host
+        self.retry_in = retry_in
+
+
+def retry_after_seconds(resp: Any) -> Optional[float]:
+    """parse a Retry-After header given as seconds or an http date"""
+    headers = getattr(resp, "headers", None) or {}
+    raw = headers.get("retry-after") if hasattr(headers, "get") else None
+    if not raw:
+        return None
+    raw = str(raw).strip()
+    try:
+        return max(0.0, float(raw))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(raw).timestamp() - time.time())
+    except Exception:
+        return None
+
+
+@dataclass
+class RetryPolicy:
+    """jittered exponential backoff; idempotent calls also retry 5xx and read errors"""
+
+    attempts: int
+    base_delay: float
+    max_delay: float
+
+    @classmethod
+    def from_settings(cls) -> "RetryPolicy":
+        return cls(
+            attempts=max(0, int(settings.AK_RETRY_ATTEMPTS)),
+            base_delay=max(0.0, float(settings.AK_RETRY_BACKOFF_BASE)),
+            max_delay=max(0.0, float(settings.AK_RETRY_BACKOFF_MAX)),
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """full-jitter delay for the given (0-based) retry attempt"""
+        cap = min(self.max_delay, self.base_delay * (2**attempt))
+        return random.uniform(0, cap) if cap > 0 else 0.0
+
+    def retry_status(self, resp: Any, attempt: int, idempotent: bool) -> Optional[float]:
+        """seconds to wait before retrying this response, or None to return it as is"""
+        if attempt >= self.attempts:
+            return None
+        code = getattr(resp, "status_code", 0)
+        if code not in RETRY_STATUSES:
+            return None
+        # a non-idempotent call may already have run on a 5xx; only 429 proves it did not
+        if code != 429 and not idempotent:
+            return None
+        hint = retry_after_seconds(resp)
+        if hint is not None:
+            # a server asking for a longer pause than we are willing to hold a request for
+            return hint if hint <= self.max_delay else None
+        return self.backoff(attempt)
+
+    def retry_error(self, exc: BaseException, attempt: int, idempotent: bool) -> Optional[float]:
+        """seconds to wait before retrying after a transport error, or None to re-raise"""
+        if attempt >= self.attempts or not isinstance(exc, httpx.TransportError):
+            return None
+        if isinstance(exc, _NOT_SENT_ERRORS) or idempotent:
+            return self.backoff(attempt)
+        return None
+
+
+class CircuitBreaker:
+    """closed -> open after N consecutive failures -> half-open probe after a cool-down"""
+
+    def __init__(
+        self,
+        host: str,
+        failure_threshold: int,
+        reset_timeout: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.host = host
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout = max(0.0, float(reset_timeout))
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if self._clock() - self._opened_at >= self.reset_timeout:
+                return "half_open"
+            return "open"
+
+    def before_call(self) -> bool:
+        """raise CircuitOpenError unless this call may go through; True for the half-open probe"""
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            waited = self._clock() - self._opened_at
+            if waited >= self.reset_timeout and not self._probing:
+                # let exactly one probe through; everyone else keeps failing fast
+                self._probing = True
+                return True
+            raise CircuitOpenError(self.host, max(0.0, self.reset_timeout - waited))
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def release_probe(self) -> None:
+        """the probe ended without a verdict (cancelled, unexpected error); allow another"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+            self._probing = False
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(host: str) -> CircuitBreaker:
+    """shared breaker per authentik host (sync and async clients see the same state)"""
+    with _breakers_lock:
+        b = _breakers.get(host)
+        if b is None:
+            b = CircuitBreaker(
+                host,
+                failure_threshold=settings.AK_BREAKER_FAILURE_THRESHOLD,
+                reset_timeout=settings.AK_BREAKER_RESET_SECONDS,
+            )
+            _breakers[host] = b
+        return b
+
+
+def reset_breakers() -> None:
+    """forget all breaker state (tests, config reloads)"""
+    with _breakers_lock:
+        _breakers.clear()
+
+
+def counts_as_failure(resp: Any) -> bool:
+    """5xx means authentik is unhealthy; 4xx and 429 mean it answered sensibly"""
+    return getattr(resp, "status_code", 0) >= 500
@@ -0,0 +1,126 @@
+# services/search_cache.py
+from __future__ import annotations
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from tools.settings import settings
+
+# rows asked from authentik per search when caching; the most search_users ever returns
+FETCH_ROWS = 100
+
+# fields a search row carries that authentik's icontains search also looks at
+_FIELDS = ("username", "name", "email")
+
+# (stored_at, rows, complete?) - complete means authentik had no more rows to give
+_Entry = Tuple[float, List[Dict[str, Any]], bool]
+
+
+def terms(q: str) -> Tuple[str, ...]:
+    """search terms the way authentik splits them: whitespace/commas, case-insensitive"""
+    return tuple(t for t in re.split(r"[\s,]+", (q or "").lower()) if t)
+
+
+def _key(q: str) -> str:
+    return " ".join(terms(q))
+
+
+def _covers(cached: Tuple[str, ...], wanted: Tuple[str, ...]) -> bool:
+    # every row matching `wanted` also matches `cached` when each cached term sits
+    # inside some wanted term ("jo" inside "john")
+    return all(any(c in w for w in wanted) for c in cached)
+
+
+def _row_matches(row: Dict[str, Any], wanted: Tuple[str, ...]) -> bool:
+    fields = [str(row.get(f) or "").lower() for f in _FIELDS]
+    return all(any(t in f for f in fields) for t in wanted)
+
+
+class SearchCache:
+    """recent upstream search results by query, bounded by size and ttl.
+
+    a complete result (fewer rows than were asked for) also answers any narrower
+    query - "joh" is served by filtering the cached rows for "jo" - so typing a name
+    one key at a time costs a couple of upstream searches instead of one per key.
+    """
+
+    def __init__(
+        self,
+        maxsize: Optional[int] = None,
+        ttl: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+
+    @property
+    def maxsize(self) -> int:
+        return int(settings.AK_SEARCH_CACHE_SIZE if self._maxsize is None else self._maxsize)
+
+    @property
+    def ttl(self) -> float:
+        return float(settings.AK_SEARCH_CACHE_TTL if self._ttl is None else self._ttl)
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0 and self.ttl > 0
+
+    def fetch_size(self, limit: int) -> int:
+        """page size to ask authentik for: the most we serve, so results can be reused"""
+        return max(limit, FETCH_ROWS) if self.enabled else limit
+
+    def key(self, q: str) -> str:
+        return _key(q)
+
+    def _fresh(self, entry: _Entry, now: float) -> bool:
+        return now - entry[0] < self.ttl
+
+    def get(self, q: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+        """rows for q (at most limit), from an exact or a covering complete entry"""
+        if not self.enabled:
+            return None
+        key, wanted = _key(q), terms(q)
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._fresh(entry, now):
+                if entry[2] or len(entry[1]) >= limit:
+                    self._entries.move_to_end(key)
+                    return [dict(r) for r in entry[1][:limit]]
+            # the narrowest complete result that covers this query
+            best: Optional[_Entry] = None
+            for k, e in self._entries.items():
+                if e[2] and self._fresh(e, now) and _covers(terms(k), wanted):
+                    if best is None or len(e[1]) < len(best[1]):
+                        best = e
+            if best is None:
+                return None
+            rows = [r for r in best[1] if _row_matches(r, wanted)]
+        return [dict(r) for r in rows[:limit]]
+
+    def put(self, q: str, rows: List[Dict[str, Any]], fetched: int) -> None:
+        """remember rows authentik returned when asked for `fetched` of them"""
+        if not self.enabled:
+            return
+        entry = (self._clock(), [dict(r) for r in rows], len(rows) < fetched)
+        with self._lock:
+            self._entries[_key(q)] = entry
+            self._entries.move_to_end(_key(q))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+search_cache = SearchCache()
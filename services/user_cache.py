@@ -0,0 +1,116 @@
+# services/user_cache.py
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from tools.settings import settings
+
+# what a listing or search row tells us about a user; enough for a mail step
+CONTACT_FIELDS = ("pk", "username", "name", "email")
+
+# (stored_at, record or None for "authentik said 404", full record?)
+_Entry = Tuple[float, Optional[Dict[str, Any]], bool]
+
+
+class UserCache:
+    """bounded lru of user records by pk, with a ttl and short-lived 404 entries"""
+
+    def __init__(
+        self,
+        maxsize: Optional[int] = None,
+        ttl: Optional[float] = None,
+        negative_ttl: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+
+    @property
+    def maxsize(self) -> int:
+        return int(settings.AK_USER_CACHE_SIZE if self._maxsize is None else self._maxsize)
+
+    @property
+    def ttl(self) -> float:
+        return float(settings.AK_USER_CACHE_TTL if self._ttl is None else self._ttl)
+
+    @property
+    def negative_ttl(self) -> float:
+        return float(
+            settings.AK_USER_CACHE_NEGATIVE_TTL
+            if self._negative_ttl is None
+            else self._negative_ttl
+        )
+
+    def get(self, pk: int, partial_ok: bool = False) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """(hit, record); a hit with record None means the user is known not to exist"""
+        key = int(pk)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            stored_at, record, full = entry
+            ttl = self.ttl if record is not None else self.negative_ttl
+            if self._clock() - stored_at >= ttl:
+                del self._entries[key]
+                return False, None
+            if record is not None and not full and not partial_ok:
+                return False, None
+            self._entries.move_to_end(key)
+            return True, (dict(record) if record is not None else None)
+
+    def put(self, pk: int, record: Dict[str, Any]) -> None:
+        """remember a full user record as returned by /core/users/{pk}/"""
+        self._store(int(pk), dict(record), True)
+
+    def put_missing(self, pk: int) -> None:
+        """remember a 404 so repeated lookups of a deleted user stay local"""
+        if self.negative_ttl > 0:
+            self._store(int(pk), None, True)
+
+    def remember(self, users: Iterable[Dict[str, Any]]) -> None:
+        """fill contact details from listing/search rows without clobbering full records"""
+        now = self._clock()
+        for u in users or []:
+            pk = u.get("pk") or u.get("id")
+            if pk is None:
+                continue
+            key = int(pk)
+            row = {f: u.get(f) for f in CONTACT_FIELDS if u.get(f)}
+            row["pk"] = key
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry and entry[1] is not None and now - entry[0] < self.ttl:
+                    if entry[2]:
+                        continue  # a full record already covers it
+                    row = {**entry[1], **row}  # slim rows must not drop a known name
+            self._store(key, row, False)
+
+    def invalidate(self, pk: Optional[int] = None) -> None:
+        with self._lock:
+            if pk is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(int(pk), None)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _store(self, key: int, record: Optional[Dict[str, Any]], full: bool) -> None:
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (self._clock(), record, full)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+user_cache = UserCache()
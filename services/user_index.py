@@ -0,0 +1,368 @@
+# services/user_index.py
+from __future__ import annotations
+
+import asyncio
+import bisect
+import heapq
+import logging
+import string
+import threading
+import time
+import unicodedata
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from tools.settings import settings
+
+log = logging.getLogger("authentik_helper.user_index")
+
+_ALPHABET = string.ascii_lowercase + string.digits
+_SEPARATORS = " .-_+@'\t"
+# candidates gathered for typo variants
+_FUZZY_CAP = 500
+# raw users carry attributes and groups; a full sync reduces them to rows this many at a
+# time, so it never holds the whole directory as fetched
+_SYNC_BATCH = 1000
+
+
+def normalize(text: Any) -> str:
+    """casefold and strip accents so 'Zoë' matches 'zoe'"""
+    decomposed = unicodedata.normalize("NFKD", str(text or "").casefold())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).strip()
+
+
+def _words(text: str) -> List[str]:
+    out, cur = [], []
+    for ch in text:
+        if ch in _SEPARATORS:
+            if cur:
+                out.append("".join(cur))
+                cur = []
+        else:
+            cur.append(ch)
+    if cur:
+        out.append("".join(cur))
+    return out
+
+
+def tokens_for(row: Dict[str, Any]) -> Tuple[str, ...]:
+    """(username, email, name, *words): the whole fields first, then words and email parts"""
+    username = normalize(row.get("username"))
+    email = normalize(row.get("email"))
+    name = normalize(row.get("name"))
+    local, _, domain = email.partition("@")
+    extra = {local, domain}
+    for part in (username, local, name):
+        extra.update(_words(part))
+    extra -= {"", username, email, name}
+    return (username, email, name, *sorted(extra))
+
+
+def _haystack(tokens: Tuple[str, ...]) -> str:
+    return "\x00" + "\x00".join(tokens) + "\x00"
+
+
+def _edits(word: str) -> Set[str]:
+    """one typo away, as prefixes: the first letter is trusted and dropping the last one
+    would only widen the match, so neither is edited"""
+    splits = [(word[:i], word[i:]) for i in range(len(word) + 1)]
+    out = {a + b[1:] for a, b in splits[1:] if len(b) > 1}
+    out |= {a + b[1] + b[0] + b[2:] for a, b in splits if len(b) > 1}
+    out |= {a + c + b[1:] for a, b in splits[1:] if b for c in _ALPHABET}
+    out |= {a + c + b for a, b in splits[1:-1] for c in _ALPHABET}
+    out.discard(word)
+    return out
+
+
+class _Build:
+    """a full load filled batch by batch, then swapped in whole by UserIndex.swap"""
+
+    def __init__(self) -> None:
+        self.rows: Dict[int, Dict[str, Any]] = {}
+        self.tokens: Dict[int, Tuple[str, ...]] = {}
+        self.hay: Dict[int, str] = {}
+        self.postings: Dict[str, Set[int]] = {}
+        self.watermark: Optional[str] = None
+
+    def add(self, users: Iterable[Dict[str, Any]]) -> None:
+        for u in users:
+            row = UserIndex._row(u)
+            if row is None:
+                continue
+            pk = row["pk"]
+            self.rows[pk] = row
+            self.tokens[pk] = tokens = tokens_for(row)
+            self.hay[pk] = _haystack(tokens)
+            for t in set(tokens) - {""}:
+                self.postings.setdefault(t, set()).add(pk)
+            stamp = str(u.get("last_updated") or "")
+            if stamp and (self.watermark is None or stamp > self.watermark):
+                self.watermark = stamp
+
+
+class UserIndex:
+    """in-process typeahead index over username, name and email.
+
+    tokens live in a sorted list so a prefix is a bisect plus a short scan; each token
+    maps to the pks that carry it. words that start no token are looked for inside them
+    too, like authentik's own search. search() returns None until a full sync has loaded
+    the index, so callers know to ask authentik instead.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._rows: Dict[int, Dict[str, Any]] = {}
+        self._user_tokens: Dict[int, Tuple[str, ...]] = {}
+        self._hay: Dict[int, str] = {}  # "\x00tok\x00tok\x00": one substring test per word
+        self._postings: Dict[str, Set[int]] = {}
+        self._sorted: List[str] = []
+        self.ready = False
+        self.loaded_at: Optional[float] = None
+        self.watermark: Optional[str] = None  # newest last_updated seen
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    # loading
+
+    @staticmethod
+    def _row(u: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        # same shape as an upstream search row
+        pk = u.get("pk") or u.get("id")
+        if pk is None:
+            return None
+        return {
+            "pk": int(pk),
+            "username": u.get("username") or u.get("name") or "",
+            "email": u.get("email") or "",
+            "name": u.get("name") or "",
+        }
+
+    def _bump_watermark(self, users: Iterable[Dict[str, Any]]) -> None:
+        stamps = [str(u["last_updated"]) for u in users if u.get("last_updated")]
+        if stamps:
+            newest = max(stamps)
+            if self.watermark is None or newest > self.watermark:
+                self.watermark = newest
+
+    def replace(self, users: Iterable[Dict[str, Any]]) -> int:
+        """full load in one go; see swap"""
+        build = _Build()
+        build.add(users)
+        return self.swap(build)
+
+    def swap(self, build: _Build) -> int:
+        """make a finished full load the live index; marks the index ready"""
+        sorted_tokens = sorted(build.postings)
+        with self._lock:
+            self._rows, self._user_tokens, self._hay = build.rows, build.tokens, build.hay
+            self._postings, self._sorted = build.postings, sorted_tokens
+            self.watermark = build.watermark
+            self.ready = True
+            self.loaded_at = self._clock()
+        return len(build.rows)
+
+    def _drop(self, pk: int) -> None:
+        # caller holds the lock
+        self._hay.pop(pk, None)
+        for t in set(self._user_tokens.pop(pk, ())):
+            pks = self._postings.get(t)
+            if pks is None:
+                continue
+            pks.discard(pk)
+            if not pks:
+                del self._postings[t]
+                i = bisect.bisect_left(self._sorted, t)
+                if i < len(self._sorted) and self._sorted[i] == t:
+                    del self._sorted[i]
+        self._rows.pop(pk, None)
+
+    def upsert(self, users: Iterable[Dict[str, Any]]) -> int:
+        """incremental update from changed rows; returns how many were applied"""
+        users = list(users)
+        n = 0
+        with self._lock:
+            for u in users:
+                row = self._row(u)
+                if row is None:
+                    continue
+                pk = row["pk"]
+                self._drop(pk)
+                self._rows[pk] = row
+                self._user_tokens[pk] = tokens = tokens_for(row)
+                self._hay[pk] = _haystack(tokens)
+                for t in set(tokens) - {""}:
+                    pks = self._postings.get(t)
+                    if pks is None:
+                        self._postings[t] = pks = set()
+                        bisect.insort(self._sorted, t)
+                    pks.add(pk)
+                n += 1
+            self._bump_watermark(users)
+        return n
+
+    def remove(self, pks: Iterable[int]) -> None:
+        with self._lock:
+            for pk in pks:
+                self._drop(int(pk))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._rows, self._user_tokens, self._hay = {}, {}, {}
+            self._postings, self._sorted = {}, []
+            self.ready = False
+            self.loaded_at = self.watermark = None
+
+    # searching
+
+    def _range(self, prefix: str) -> Tuple[int, int]:
+        """slice of the sorted token list that starts with prefix"""
+        lo = bisect.bisect_left(self._sorted, prefix)
+        return lo, bisect.bisect_left(self._sorted, prefix + "\uffff", lo)
+
+    def _prefixed(self, prefix: str, cap: Optional[int] = None) -> Set[int]:
+        """pks with a token starting with prefix; stops once cap is reached"""
+        out: Set[int] = set()
+        lo, hi = self._range(prefix)
+        for t in self._sorted[lo:hi]:
+            out |= self._postings[t]
+            if cap is not None and len(out) >= cap:
+                break
+        return out
+
+    def _narrow(self, pks: Set[int], words: List[str]) -> Set[int]:
+        """keep pks that match every word, by whichever is cheaper per word: a set
+        intersection over the word's postings or a token check on each candidate"""
+        for w in words:
+            lo, hi = self._range(w)
+            if hi - lo > len(pks):
+                needle, hay = "\x00" + w, self._hay
+                pks = {pk for pk in pks if needle in hay[pk]}
+            else:
+                pks = pks & self._prefixed(w)
+        return pks
+
+    def _inside(self, words: List[str], skip: Set[int], cap: int) -> Set[int]:
+        """pks with every word somewhere inside their tokens ("son" in "johnson"); a scan
+        of the whole index, so only run when the prefixes came up short"""
+        out: Set[int] = set()
+        for pk, hay in self._hay.items():
+            if pk not in skip and all(w in hay for w in words):
+                out.add(pk)
+                if len(out) >= cap:
+                    break
+        return out
+
+    def _score(
+        self, pk: int, query: str, words: List[str], tier: Optional[int] = None
+    ) -> Tuple[Any, ...]:
+        """sort key; substring (4) and typo (5) matches come with their tier"""
+        tokens = self._user_tokens[pk]
+        username = tokens[0]
+        if tier is None:
+            if query in tokens[:3]:
+                tier = 0
+            elif username.startswith(query):
+                tier = 1
+            elif all(f"\x00{w}\x00" in self._hay[pk] for w in words):
+                tier = 2
+            else:
+                tier = 3
+        return (tier, len(username), username, pk)
+
+    def search(self, q: str, limit: int = 25) -> Optional[List[Dict[str, Any]]]:
+        """ranked rows for a typeahead query, or None while the index is cold"""
+        if not self.ready:
+            return None
+        query = normalize(q)
+        words = sorted(set(query.split()), key=len, reverse=True)
+        if not words:
+            return []
+        # the longest word is the most selective; the rest only filter
+        lead, rest = words[0], words[1:]
+        # a lone short prefix matches half the directory; rank a sample, not all of it
+        cap = None if rest else max(limit * 20, 500)
+        with self._lock:
+            hits = self._narrow(self._prefixed(lead, cap), rest)
+            inside: Set[int] = set()
+            if len(hits) < limit:
+                inside = self._inside(words, hits, cap or max(limit * 20, 500))
+            fuzzy: Set[int] = set()
+            if len(hits) + len(inside) < limit and len(lead) >= 4:
+                for variant in _edits(lead):
+                    fuzzy |= self._prefixed(variant, _FUZZY_CAP)
+                    if len(fuzzy) >= _FUZZY_CAP:
+                        break
+                fuzzy = self._narrow(fuzzy - hits - inside, rest)
+            ranked = heapq.nsmallest(
+                limit,
+                [self._score(pk, query, words) for pk in hits]
+                + [self._score(pk, query, words, 4) for pk in inside]
+                + [self._score(pk, query, words, 5) for pk in fuzzy],
+            )
+            return [dict(self._rows[key[-1]]) for key in ranked]
+
+
+user_index = UserIndex()
+
+
+# directory sync
+
+
+async def sync_full(client: Any, index: Optional[UserIndex] = None) -> int:
+    """page through every user and rebuild the index off the event loop; the live index
+    keeps answering until the new one is swapped in"""
+    index = user_index if index is None else index
+    t0 = time.perf_counter()
+    build = _Build()
+    batch: List[Dict[str, Any]] = []
+    async for u in client.aiter_users(ordering="pk"):
+        batch.append(u)
+        if len(batch) >= _SYNC_BATCH:
+            await asyncio.to_thread(build.add, batch)
+            batch = []
+    await asyncio.to_thread(build.add, batch)
+    n = await asyncio.to_thread(index.swap, build)
+    log.info(
+        "user_index_synced",
+        extra={"mode": "full", "count": n, "duration_ms": round((time.perf_counter() - t0) * 1000)},
+    )
+    return n
+
+
+async def sync_incremental(client: Any, index: Optional[UserIndex] = None) -> int:
+    """apply users changed since the watermark, newest first; full sync while cold"""
+    index = user_index if index is None else index
+    if not index.ready:
+        return await sync_full(client, index)
+    if not index.watermark:
+        return 0  # rows carry no last_updated; only the periodic full sync helps
+    mark = index.watermark
+    changed: List[Dict[str, Any]] = []
+    async for u in client.aiter_users(ordering="-last_updated", last_updated__gt=mark):
+        if str(u.get("last_updated") or "") <= mark:
+            break  # upstream ignored the filter; everything after this is older
+        changed.append(u)
+    n = index.upsert(changed)
+    if n:
+        log.info("user_index_synced", extra={"mode": "incremental", "count": n})
+    return n
+
+
+async def run_sync(client: Any, index: Optional[UserIndex] = None) -> None:
+    """background loop: full sync, then incremental refreshes, full again now and then"""
+    index = user_index if index is None else index
+    last_full = 0.0
+    while True:
+        try:
+            if time.monotonic() - last_full >= settings.AK_USER_INDEX_FULL_SYNC:
+                await sync_full(client, index)
+                last_full = time.monotonic()
+            else:
+                await sync_incremental(client, index)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # a stale index keeps serving; a cold one leaves search on authentik
+            log.warning("user_index_sync_failed", extra={"error": str(e)})
+        await asyncio.sleep(max(1.0, settings.AK_USER_INDEX_REFRESH))
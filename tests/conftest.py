@@ -30,6 +30,8 @@ os.environ.update(
         "OIDC_SCOPES": "openid profile email",
         "LOG_LEVEL": "WARNING",
         "DISABLE_AUTH": "true",  # skip oidc during tests
+        "AK_RETRY_BACKOFF_BASE": "0",  # retry without sleeping
+        "MAIL_RETRY_BACKOFF": "0",
     }
 )
 
@@ -39,6 +41,54 @@ import tools.settings as settings_mod
 importlib.reload(settings_mod)  # rebuilds the singleton inside module
 
 
+@pytest.fixture(autouse=True)
+def _fresh_circuit_breakers():
+    # breakers are per-host singletons; don't let one test's failures trip the next
+    from services.resilience import reset_breakers
+
+    reset_breakers()
+    yield
+    reset_breakers()
+
+
+@pytest.fixture(autouse=True)
+def _empty_caches():
+    # listings and users are cached process-wide; each test starts from authentik's answer
+    from services.events import events
+    from services.jobs import job_scheduler
+    from services.membership_cache import membership_cache
+    from services.membership_log import membership_log
+    from services.search_cache import search_cache
+    from services.user_cache import user_cache
+    from services.user_index import user_index
+
+    membership_cache.invalidate()
+    membership_log.clear()
+    events.clear()
+    job_scheduler.clear()
+    user_cache.invalidate()
+    search_cache.invalidate()
+    user_index.clear()
+    yield
+    membership_cache.invalidate()
+    membership_log.clear()
+    user_cache.invalidate()
+    search_cache.invalidate()
+    user_index.clear()
+
+
+@pytest.fixture(autouse=True)
+def _idle_mail_queue():
+    # mail is delivered by background workers; finish it inside the test that queued it
+    from tools.mail_queue import mail_queue
+    from tools.mailer import smtp_pool
+
+    yield mail_queue
+    mail_queue.drain(timeout=5)
+    mail_queue.clear()
+    smtp_pool.close_all()
+
+
 @pytest.fixture(scope="session")
 def app():
     # import here after env is set
@@ -51,3 +101,16 @@ def app():
 def client(app):
     # critical: do not follow redirects so tests can assert 302/303
     return TestClient(app, base_url="http://localhost", follow_redirects=False)
+
+
+@pytest.fixture()
+def as_async():
+    """wrap a plain fake so it can stand in for an AsyncAuthentikClient method"""
+
+    def _wrap(fn):
+        async def _wrapped(*a, **k):
+            return fn(*a, **k)
+
+        return _wrapped
+
+    return _wrap
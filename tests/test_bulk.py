@@ -0,0 +1,84 @@
+# tests/test_bulk.py
+import asyncio
+import random
+
+import pytest
+
+import services.authentik as svc
+import services.bulk as bulk
+from core.bulk_response import run_bulk
+from services.bulk import bulk_concurrency, run_bounded
+
+
+def test_run_bounded_keeps_order_and_limit():
+    state = {"now": 0, "peak": 0}
+
+    async def worker(i):
+        state["now"] += 1
+        state["peak"] = max(state["peak"], state["now"])
+        await asyncio.sleep(random.uniform(0, 0.005))
+        state["now"] -= 1
+        return i * 10
+
+    out = asyncio.run(run_bounded(range(20), worker, limit=3))
+    assert out == [i * 10 for i in range(20)]
+    assert 1 < state["peak"] <= 3
+
+
+def test_bulk_concurrency_defaults_to_setting(monkeypatch):
+    monkeypatch.setattr(svc.settings, "BULK_CONCURRENCY", 5, raising=False)
+    assert bulk_concurrency() == 5
+    assert bulk_concurrency(2) == 2
+
+
+def test_json_bulk_run_finishes_its_progress_when_it_raises(monkeypatch):
+    finished = []
+    monkeypatch.setattr(bulk.BulkProgress, "finish", lambda self, *a: finished.append(self.id))
+
+    async def boom(pk):
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run_bulk("promote", [1, 2], boom, "json"))
+    assert len(finished) == 1
+
+
+def test_promote_bulk_runs_concurrently_in_request_order(monkeypatch, client, as_async):
+    monkeypatch.setattr(svc.settings, "BULK_CONCURRENCY", 4, raising=False)
+    state = {"now": 0, "peak": 0}
+
+    async def _switch(src, dst, pk):
+        state["now"] += 1
+        state["peak"] = max(state["peak"], state["now"])
+        await asyncio.sleep(0.002 * (pk % 3))
+        state["now"] -= 1
+        return {"add": 204, "remove": 204, "outcome": "complete"}
+
+    monkeypatch.setattr(svc.aak, "switch_group_user_pk", _switch, raising=True)
+    pks = [9, 3, 9, 7, 1, 5, 3, 8, 2]
+    j = client.post("/promote/bulk", json={"pks": pks, "send_mail": False}).json()
+    assert [r["pk"] for r in j["results"]] == [9, 3, 7, 1, 5, 8, 2]
+    assert j["count_ok"] == 7 and j["count_failed"] == 0
+    assert 1 < state["peak"] <= 4
+
+
+def test_bulk_streams_progress_lines(monkeypatch, client, as_async):
+    import json
+
+    def _switch(src, dst, pk):
+        if pk == 2:
+            raise svc.SwitchError("nope", "rolled_back")
+        return {"add": 204, "remove": 204, "outcome": "complete"}
+
+    monkeypatch.setattr(svc.aak, "switch_group_user_pk", as_async(_switch))
+    r = client.post("/demote/bulk", params={"format": "ndjson"}, json={"pks": [1, 2, 3]})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    items, summary = lines[:-1], lines[-1]
+    assert sorted(i["pk"] for i in items) == [1, 2, 3]
+    assert [i["outcome"] for i in items if not i["ok"]] == ["rolled_back"]
+    assert summary == {"done": True, "count_ok": 2, "count_failed": 1}
+
+    r = client.post("/promote/bulk", params={"format": "xml"}, json={"pks": [1]})
+    assert r.status_code == 400
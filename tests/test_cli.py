@@ -58,7 +58,7 @@ def calls(monkeypatch):
 def fake_ak(monkeypatch):
     """Mock Authentik client that `cli._ak()` returns."""
     ak = types.SimpleNamespace(
-        get_user=lambda pk: {
+        get_user=lambda pk, **k: {
             "pk": pk,
             "username": f"user{pk}",
             "name": f"User {pk}",
@@ -137,6 +137,21 @@ def test_groups_guests(fake_ak):
     assert "guest1" in out and "guest2" in out
 
 
+def test_groups_members_streams_from_iterator(fake_ak):
+    pulled = []
+
+    def iter_group_users(group_uuid):
+        assert group_uuid == "members-uuid"
+        for pk in (7, 8):
+            pulled.append(pk)
+            yield {"pk": pk, "username": f"member{pk}", "email": f"m{pk}@example.com"}
+
+    fake_ak.iter_group_users = iter_group_users
+    out = run_cli(["groups", "members"])
+    assert "member7" in out and "member8" in out
+    assert pulled == [7, 8]
+
+
 def test_membership_promote_sends_email(fake_ak, calls):
     out = run_cli(["membership", "promote", "123"])
     # Pretty output contains "promote"
@@ -171,3 +186,97 @@ def test_brand_info(fake_ak):
     out = run_cli(["brand", "info"])
     assert "Fairyland" in out
     assert "example.com" in out
+
+
+def test_promote_many_reads_csv_resumes_and_mails_in_one_batch(fake_ak, calls, tmp_path):
+    src = tmp_path / "pks.csv"
+    src.write_text("username,pk\nann,1\nbob,2\nann,1\ncy,3\n")
+    progress = tmp_path / "progress.ndjson"
+    # ann was promoted by a run that died before mailing her; the last line is torn
+    ann = {"to_email": "ann@example.com", "name": "Ann"}
+    progress.write_text(
+        json.dumps({"pk": 1, "ok": True, "mail_to": ann}) + '\n{"pk":2,"ok":false}\n{"pk":3,"o'
+    )
+
+    batches = []
+    cli.mailer.send_promotion_emails = lambda rcpts, **kw: batches.append(rcpts) or [True] * len(
+        rcpts
+    )
+
+    def switch(src, dst, pk):
+        if pk == 3:
+            raise RuntimeError("boom")
+        return {"outcome": "complete"}
+
+    fake_ak.switch_group_user_pk = switch
+    with pytest.raises(SystemExit) as exit_:
+        run_cli(
+            ["membership", "promote-many", str(src), "--ndjson", "--resume-from", str(progress)]
+        )
+    assert exit_.value.code == 1
+
+    recorded = [json.loads(line) for line in progress.read_text().splitlines()[3:]]
+    switched, mailed = recorded[:2], recorded[2:]
+    assert sorted((r["pk"], r["ok"]) for r in switched) == [(2, True), (3, False)]
+    # one batch: bob from this run and ann left over from the last one
+    assert sorted(r["to_email"] for r in batches[0]) == ["ann@example.com", "user2@example.com"]
+    assert len(batches) == 1 and calls.sent_promos == []  # no per-user sends
+    assert sorted(r["pk"] for r in mailed) == [1, 2] and all(r["mailed"] for r in mailed)
+
+    # a second resume has nobody left to mail
+    batches.clear()
+    with pytest.raises(SystemExit):
+        run_cli(["membership", "promote-many", str(src), "--resume-from", str(progress)])
+    assert batches == []
+
+
+def test_demote_many_stdin_ndjson_dry_run(fake_ak, monkeypatch):
+    monkeypatch.setattr(sys, "stdin", io.StringIO('{"pk": 5}\n\n# note\n{"pk": 6}\n'))
+    fake_ak.switch_group_user_pk = lambda *a: pytest.fail("dry run must not switch")
+    data = json.loads(run_cli(["--json", "membership", "demote-many", "--dry-run"]))
+    assert [r["pk"] for r in data["results"]] == [5, 6]
+    assert data["pending"] == 2 and data["failed"] == 0
+
+    monkeypatch.setattr(sys, "stdin", io.StringIO("7\nseven\n"))
+    with pytest.raises(SystemExit) as exit_:
+        run_cli(["membership", "demote-many"])
+    assert exit_.value.code == 2
+
+
+def test_invites_create_many_checkpoints_and_resumes(fake_ak, calls, tmp_path):
+    import csv
+
+    src = tmp_path / "cohort.csv"
+    src.write_text("Name,Email\nAda,ada@example.com\nBob,bob@example.com\nAda 2,ADA@example.com\n")
+    out, progress = tmp_path / "out.csv", tmp_path / "progress.ndjson"
+    created, batches, down = [], [], {"Bob"}
+
+    def create(**kw):
+        if kw["name"] in down:
+            raise RuntimeError("authentik down")
+        created.append(kw["email"])
+        return {"pk": f"tok-{kw['name']}", "invite_url": f"https://x/?itoken={kw['name']}"}
+
+    def send_invitation_emails(rcpts, **kw):
+        batches.append([r["to_email"] for r in rcpts])
+        return [True] * len(rcpts)
+
+    fake_ak.create_invitation = create
+    cli.mailer.send_invitation_emails = send_invitation_emails
+    args = ["invites", "create-many", "--csv", str(src), "--out", str(out)]
+    with pytest.raises(SystemExit):
+        run_cli(args + ["--progress", str(progress)])
+    down.clear()  # authentik is back; the duplicate row still fails, so exit is 1 again
+    with pytest.raises(SystemExit):
+        run_cli(args + ["--resume-from", str(progress)])
+
+    assert created == ["ada@example.com", "bob@example.com"]
+    assert batches == [["ada@example.com"], ["bob@example.com"]]
+    with out.open() as f:
+        rows = list(csv.DictReader(f))
+    assert [(r["row"], r["ok"], r["token"], r["mailed"]) for r in rows] == [
+        ("1", "True", "tok-Ada", "True"),
+        ("2", "True", "tok-Bob", "True"),
+        ("3", "False", "", ""),
+    ]
+    assert rows[2]["detail"] == "duplicate of row 1"
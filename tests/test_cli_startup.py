@@ -0,0 +1,79 @@
+# tests/test_cli_startup.py
+# the cli runs from cron and shell loops; keep --help and argument errors free of the heavy
+# imports, and the authentik commands free of the web stack. module sets are checked
+# exactly; import time is checked with -X importtime against generous budgets, measured
+# on a second run so bytecode compilation is not counted
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# microseconds, cumulative: `import tools.cli`, which is all --help and usage errors load
+HELP_BUDGET_US = 100_000
+# microseconds of the helper's own modules on the authentik path (settings, client, caches);
+# pydantic and httpx are not counted, every command needs them
+AUTHENTIK_BUDGET_US = 100_000
+
+# never needed to parse arguments; loaded by the commands that use them
+LAZY = ("fastapi", "starlette", "jinja2", "httpx", "pydantic", "tools.mailer", "tools.settings")
+# not even the commands that talk to authentik need these
+WEB_ONLY = ("fastapi", "starlette", "jinja2", "tools.mailer", "web.templates")
+# only the web app fills or reads them
+WEB_STATE = ("services.events", "services.membership_log", "services.user_index")
+OWN = ("tools", "services", "core")
+
+
+@pytest.fixture(scope="module")
+def importtime(tmp_path_factory):
+    """run code twice in fresh interpreters: {module: (self us, cumulative us)}, modules"""
+    env = dict(os.environ, PYTHONPYCACHEPREFIX=str(tmp_path_factory.mktemp("pyc")))
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+
+    def run(code):
+        probe = code + "\nimport json, sys\nprint(json.dumps(sorted(sys.modules)))"
+        cmd = [sys.executable, "-X", "importtime", "-c", probe]
+        for _ in range(2):  # the first run only writes bytecode
+            r = subprocess.run(cmd, cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+        times = {}
+        for line in r.stderr.splitlines():
+            if line.startswith("import time:") and "|" in line:
+                own, cumulative, name = line[len("import time:") :].split("|")
+                if cumulative.strip().isdigit():
+                    times[name.strip()] = (int(own), int(cumulative))
+        return times, json.loads(r.stdout.strip().splitlines()[-1])
+
+    return run
+
+
+def _loaded(modules, prefixes):
+    return sorted(m for m in modules if any(m == p or m.startswith(p + ".") for p in prefixes))
+
+
+def _main(*argv):
+    return (
+        "import contextlib, io, tools.cli as c\n"
+        "with contextlib.redirect_stdout(io.StringIO()), contextlib.suppress(SystemExit):\n"
+        f"    c.main({list(argv)!r})"
+    )
+
+
+def test_help_and_usage_errors_stay_light(importtime):
+    for argv in (["--help"], ["membership", "promote-many", "--help"], ["no-such-command"]):
+        times, modules = importtime(_main(*argv))
+        assert _loaded(modules, LAZY) == [], argv
+        took = times["tools.cli"][1]
+        assert took < HELP_BUDGET_US, f"import tools.cli took {took}us"
+
+
+def test_authentik_commands_load_only_the_client(importtime):
+    times, modules = importtime("import tools.cli as c; c._ak()")
+    assert "services.authentik" in modules
+    assert _loaded(modules, WEB_ONLY + WEB_STATE) == []
+    own = sum(t for name, (t, _) in times.items() if _loaded([name], OWN))
+    assert own < AUTHENTIK_BUDGET_US, f"the helper's modules took {own}us to import"
@@ -0,0 +1,200 @@
+# tests/test_compression.py
+import asyncio
+import gzip
+import os
+import zlib
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+from starlette.testclient import TestClient
+
+from core.compression import (
+    CompressionMiddleware,
+    available_codecs,
+    compressible,
+    negotiate,
+    parse_accept_encoding,
+)
+from tools.precompress import precompress
+from web.static_files import PrecompressedStaticFiles
+
+BIG = "lorem ipsum dolor sit amet " * 200
+
+
+def test_accept_encoding_negotiation():
+    assert parse_accept_encoding("gzip;q=0.5, br, x;q=oops") == {"gzip": 0.5, "br": 1.0, "x": 0.0}
+    both = ("zstd", "br", "gzip")
+    assert negotiate("gzip, br", both) == "br"  # equal q: server preference
+    assert negotiate("gzip, br;q=0.4", both) == "gzip"
+    assert negotiate("*", ("gzip",)) == "gzip"
+    assert negotiate("*, gzip;q=0", ("gzip",)) is None
+    assert negotiate("identity", ("gzip",)) is None and negotiate("", ("gzip",)) is None
+
+
+def test_compressible_types():
+    assert compressible("application/json") and compressible("text/html; charset=utf-8")
+    assert not compressible("image/png") and not compressible("text/event-stream")
+    assert not compressible("")
+
+
+def _client(*routes):
+    app = Starlette(routes=list(routes))
+    wrapped = CompressionMiddleware(app, minimum_size=500, codecs=available_codecs())
+    return TestClient(wrapped)
+
+
+async def _big(request):
+    return PlainTextResponse(BIG)
+
+
+async def _small(request):
+    return PlainTextResponse("tiny")
+
+
+async def _encoded(request):
+    return Response(gzip.compress(BIG.encode()), headers={"content-encoding": "gzip"})
+
+
+async def _png(request):
+    return Response(b"\x89PNG" + os.urandom(2000), media_type="image/png")
+
+
+async def _stream(request):
+    async def lines():
+        for i in range(50):
+            yield f'{{"pk": {i}, "username": "user{i}"}}\n'
+            await asyncio.sleep(0)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+def test_large_bodies_are_compressed_and_small_ones_are_not():
+    c = _client(Route("/big", _big), Route("/small", _small))
+    r = c.get("/big", headers={"accept-encoding": "gzip"})
+    assert r.headers["content-encoding"] == "gzip" and r.headers["vary"] == "Accept-Encoding"
+    assert int(r.headers["content-length"]) < len(BIG) // 10
+    assert r.text == BIG  # httpx decodes it back
+    r = c.get("/small", headers={"accept-encoding": "gzip"})
+    assert "content-encoding" not in r.headers and r.text == "tiny"
+    r = c.get("/big", headers={"accept-encoding": "identity"})
+    assert "content-encoding" not in r.headers and r.text == BIG
+
+
+def test_encoding_weakens_etag_and_large_bodies_leave_the_loop(monkeypatch):
+    import anyio.to_thread
+
+    import core.compression as comp
+
+    async def tagged(request):
+        return PlainTextResponse(BIG, headers={"etag": '"v1"'})
+
+    offloaded = []
+    run_sync = anyio.to_thread.run_sync
+
+    async def spy(fn, *args, **kw):
+        offloaded.append(len(args[0]))
+        return await run_sync(fn, *args, **kw)
+
+    monkeypatch.setattr(anyio.to_thread, "run_sync", spy)
+    c = _client(Route("/tagged", tagged))
+    r = c.get("/tagged", headers={"accept-encoding": "gzip"})
+    # the gzip body is not byte-identical to what the strong tag named
+    assert r.headers["etag"] == 'W/"v1"' and r.text == BIG
+    assert c.get("/tagged", headers={"accept-encoding": "identity"}).headers["etag"] == '"v1"'
+    assert offloaded == []
+
+    monkeypatch.setattr(comp, "LARGE_BODY", 1000)
+    assert c.get("/tagged", headers={"accept-encoding": "gzip"}).text == BIG
+    assert offloaded == [len(BIG)]
+
+
+def test_encoded_and_binary_bodies_pass_through():
+    c = _client(Route("/enc", _encoded), Route("/png", _png))
+    r = c.get("/enc", headers={"accept-encoding": "gzip"})
+    assert r.text == BIG  # decoded once, so it was not wrapped twice
+    r = c.get("/png", headers={"accept-encoding": "gzip"})
+    assert "content-encoding" not in r.headers and len(r.content) == 2004
+
+
+def test_streamed_bodies_are_compressed_chunk_by_chunk():
+    c = _client(Route("/stream", _stream))
+    r = c.get("/stream", headers={"accept-encoding": "gzip"})
+    assert r.headers["content-encoding"] == "gzip" and "content-length" not in r.headers
+    lines = r.text.splitlines()
+    assert len(lines) == 50 and lines[-1] == '{"pk": 49, "username": "user49"}'
+
+
+def test_stream_chunks_decode_as_they_arrive():
+    # each chunk is sync-flushed, so a reader can decode it without waiting for the end
+    stream = available_codecs()["gzip"].stream()
+    d = zlib.decompressobj(31)
+    assert d.decompress(stream.chunk(b'{"pk": 1}\n')) == b'{"pk": 1}\n'
+    assert d.decompress(stream.chunk(b'{"pk": 2}\n') + stream.finish()) == b'{"pk": 2}\n'
+
+
+def test_group_listing_is_gzipped(monkeypatch, client, as_async):
+    import services.authentik as svc
+
+    users = [
+        {"pk": i, "username": f"user{i}", "email": f"user{i}@example.test", "name": f"User {i}"}
+        for i in range(500)
+    ]
+    monkeypatch.setattr(
+        svc.aak,
+        "list_group_users",
+        as_async(lambda *a, **k: {"group_name": "Guests", "users": users}),
+    )
+    r = client.get("/guest-users", headers={"accept-encoding": "gzip"})
+    assert r.status_code == 200 and r.headers["content-encoding"] == "gzip"
+    assert len(r.json()["users"]) == 500
+    assert r.num_bytes_downloaded * 5 < len(r.content)
+
+
+@pytest.fixture()
+def static_dir(tmp_path):
+    (tmp_path / "app.css").write_text("body { color: red; }\n" * 100)
+    (tmp_path / "tiny.js").write_text("x=1")
+    (tmp_path / "logo.png").write_bytes(b"\x89PNG" + os.urandom(1000))
+    return tmp_path
+
+
+def test_precompress_writes_current_variants(static_dir):
+    rows = precompress(static_dir)
+    assert {"file": "app.css", "coding": "gzip"} in [
+        {k: r[k] for k in ("file", "coding")} for r in rows
+    ]
+    assert (static_dir / "app.css.gz").exists()
+    assert not (static_dir / "tiny.js.gz").exists() and not (static_dir / "logo.png.gz").exists()
+    assert gzip.decompress((static_dir / "app.css.gz").read_bytes()).startswith(b"body")
+    # rerunning skips the variants themselves
+    assert not any(str(r["file"]).endswith(".gz") for r in precompress(static_dir))
+
+
+def test_static_files_prefer_precompressed_variant(static_dir):
+    precompress(static_dir)
+    app = Starlette(routes=[Mount("/static", PrecompressedStaticFiles(directory=static_dir))])
+    c = TestClient(app)
+
+    r = c.get("/static/app.css", headers={"accept-encoding": "gzip"})
+    assert r.headers["content-encoding"] == "gzip"
+    assert r.headers["content-type"].startswith("text/css")
+    assert r.headers["vary"] == "Accept-Encoding"
+    assert int(r.headers["content-length"]) == (static_dir / "app.css.gz").stat().st_size
+    assert r.text.startswith("body")
+    again = c.get(
+        "/static/app.css",
+        headers={"accept-encoding": "gzip", "if-none-match": r.headers["etag"]},
+    )
+    assert again.status_code == 304
+
+    r = c.get("/static/app.css", headers={"accept-encoding": "identity"})
+    assert "content-encoding" not in r.headers and r.headers["vary"] == "Accept-Encoding"
+
+    # a variant older than its source is stale and ignored
+    src = static_dir / "app.css"
+    st = src.stat()
+    os.utime(src, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    r = c.get("/static/app.css", headers={"accept-encoding": "gzip"})
+    assert "content-encoding" not in r.headers
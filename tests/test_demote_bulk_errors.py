@@ -18,12 +18,15 @@ def test_demote_bulk_too_many(client):
     assert r.status_code == 413
 
 
-def test_demote_bulk_dedupes_and_counts(monkeypatch, client):
+def test_demote_bulk_dedupes_and_counts(monkeypatch, client, as_async):
     import services.authentik as svc
 
     # Always succeed
     monkeypatch.setattr(
-        svc.ak, "switch_group_user_pk", lambda *a, **k: {"add": 200, "remove": 200}, raising=True
+        svc.aak,
+        "switch_group_user_pk",
+        as_async(lambda *a, **k: {"add": 200, "remove": 200}),
+        raising=True,
     )
 
     payload = {"pks": [1, 1, 2, 2, 3]}
@@ -34,3 +37,24 @@ def test_demote_bulk_dedupes_and_counts(monkeypatch, client):
     assert j["count_ok"] + j["count_failed"] == 3
     assert len(j["results"]) == 3
     assert all(item["ok"] for item in j["results"])
+
+
+def test_demote_bulk_reports_switch_outcome(monkeypatch, client, as_async):
+    import services.authentik as svc
+
+    def _switch(src, dst, pk):
+        if pk == 2:
+            raise svc.SwitchError(
+                "switch failed add=204 remove=500 outcome=rolled_back", "rolled_back"
+            )
+        return {"add": 204, "remove": 204, "outcome": "complete"}
+
+    monkeypatch.setattr(svc.aak, "switch_group_user_pk", as_async(_switch), raising=True)
+    j = client.post("/demote/bulk", json={"pks": [1, 2]}).json()
+    by_pk = {item["pk"]: item for item in j["results"]}
+    assert by_pk[2]["ok"] is False and by_pk[2]["outcome"] == "rolled_back"
+    assert "outcome" not in by_pk[1]
+
+    r = client.post("/demote", json={"pk": 2})
+    assert r.status_code == 500
+    assert r.json() == {"detail": "backend unavailable", "outcome": "rolled_back"}
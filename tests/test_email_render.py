@@ -0,0 +1,103 @@
+# tests/test_email_render.py
+from email import message_from_bytes
+from email import policy
+
+from jinja2 import Environment
+
+import tools.email_render as er
+import tools.mailer as mail
+
+
+def _parse(data):
+    msg = message_from_bytes(data, policy=policy.default)
+    plain, rich = msg.get_body(("plain",)), msg.get_body(("html",))
+    assert plain is not None and rich is not None
+    text, html = plain.get_content(), rich.get_content()
+    return msg, text, html
+
+
+def test_invitation_bytes_have_text_and_html_parts():
+    c = er.compiled_email(
+        "invitation",
+        {"org_name": "Org & Co", "external_url": None, "footer": "bye", "brand_logo": ""},
+        "Your invite to Org & Co!",
+    )
+    assert c.exact
+    data = c.render(
+        "from@example.test",
+        "t@example.test\r\nBcc: x@evil.test",
+        {"name": "<Ada>", "invite_url": "https://x.test/?a=1&b=2", "expires_friendly": "soon"},
+    )
+    assert b"\r\n" in data and b"\n" not in data.replace(b"\r\n", b"")
+    msg, text, html = _parse(data)
+    assert msg.get_content_type() == "multipart/alternative"
+    assert msg["Subject"] == "Your invite to Org & Co!"
+    assert msg["Bcc"] is None
+    assert "Welcome, <Ada>" in text and "https://x.test/?a=1&b=2" in text
+    assert "Welcome, &lt;Ada&gt;" in html
+    assert 'href="https://x.test/?a=1&amp;b=2"' in html
+    assert "Org &amp; Co" in html
+
+
+def test_placeholder_render_matches_full_render():
+    shared = {"portal_url": "https://p", "org_name": "O", "footer": "f", "brand_logo": "/l.png"}
+    c = er.compiled_email("promotion", shared, "s")
+    for name in ("", "Bob", "Zoë & <i>x</i>"):
+        text, html = c.bodies({"name": name})
+        full = er._templates.env.get_template("promotion_email.html").render(**shared, name=name)
+        assert html == full
+        assert f"Welcome aboard, {name}" in text
+
+
+def test_compiled_emails_are_reused_per_shared_context():
+    a = er.compiled_email("promotion", {"org_name": "A"}, "s")
+    assert er.compiled_email("promotion", {"org_name": "A"}, "s") is a
+    assert er.compiled_email("promotion", {"org_name": "B"}, "s") is not a
+    er.clear_cache("promotion")
+    assert er.compiled_email("promotion", {"org_name": "A"}, "s") is not a
+
+
+def test_filtered_fields_fall_back_to_full_render():
+    tpl = Environment(autoescape=True).from_string("hi {{ name|upper }} from {{ org }}")
+    part = er._Part(tpl, {"org": "O"}, ("name",), html=True)
+    assert part.exact is False
+    assert part.render({"name": "ada"}) == "hi ADA from O"
+
+
+def test_send_promotion_emails_batches_on_one_session(monkeypatch):
+    sent = []
+
+    class FakeSMTP:
+        def __init__(self, host, port, timeout=30):
+            sent.append(("connect", host))
+
+        def ehlo(self):
+            pass
+
+        def starttls(self):
+            pass
+
+        def login(self, user, pwd):
+            pass
+
+        def noop(self):
+            return (250, b"ok")
+
+        def sendmail(self, from_addr, rcpts, msg):
+            sent.append((rcpts[0], msg))
+
+        def quit(self):
+            pass
+
+    monkeypatch.setattr(mail.settings, "SMTP_PORT", 587, raising=False)
+    monkeypatch.setattr(mail.smtplib, "SMTP", FakeSMTP, raising=True)
+    mail.smtp_pool.close_all()
+
+    rcpts = [{"to_email": f"u{i}@example.test", "name": f"U{i}"} for i in range(3)]
+    ok = mail.send_promotion_emails(
+        rcpts, portal_url="https://portal", authentik_url="https://ak", org_name="Org"
+    )
+    assert ok == [True, True, True]
+    assert [s[0] for s in sent].count("connect") == 1
+    _, text, html = _parse(sent[-1][1])
+    assert "Welcome aboard, U2" in text and "https://portal" in html
@@ -41,9 +41,9 @@ def test_invitation_email_sends_starttls(monkeypatch):
     assert ok is True
     assert calls["init"][1] != 465  # starttls path
     assert calls.get("starttls") is True
-    assert "invite_url" not in calls.get(
-        "msg", ""
-    )  # template renders, but we don't assert body here
+    assert b"invite_url" not in calls.get(
+        "msg", b""
+    )  # template renders (ready-made bytes), but we don't assert body here
 
 
 def test_promotion_email_sends_ssl_465(monkeypatch):
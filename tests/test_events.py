@@ -0,0 +1,129 @@
+# tests/test_events.py
+import asyncio
+import json
+from typing import AsyncGenerator, cast
+
+import services.authentik as svc
+from routers import events as events_router
+from services.events import EventBroker, events
+from services.membership_log import EVENT_MAX_USERS, MembershipLog
+
+
+def _frames(text):
+    out = []
+    for block in text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line)
+        if "data" in fields:
+            out.append((fields.get("event"), json.loads(fields["data"]), fields.get("id")))
+        elif block.startswith(":"):
+            out.append(("ping", None, None))
+    return out
+
+
+def test_broker_replays_after_last_event_id():
+    broker = EventBroker(buffer=3)
+
+    async def _run():
+        for i in range(5):
+            broker.publish("n", {"i": i})
+        sub, resumed = broker.subscribe(broker.event_id(3))
+        assert resumed
+        replay = [e[2]["i"] for e in await sub.next_batch(0.1)]
+        # event 2 fell off the buffer; resuming before it can't be honoured
+        assert broker.subscribe(broker.event_id(1))[1] is False
+        assert broker.subscribe("other.4")[1] is False
+        assert broker.subscribe(None)[1] is False
+        broker.publish("n", {"i": 5})
+        live = [e[2]["i"] for e in await sub.next_batch(0.1)]
+        return replay, live, await sub.next_batch(0.01), broker.subscribers
+
+    replay, live, idle, subscribers = asyncio.run(_run())
+    assert replay == [3, 4] and live == [5] and idle == [] and subscribers == 4
+
+
+def test_slow_client_is_cut_off_not_waited_for(monkeypatch):
+    monkeypatch.setattr(svc.settings, "EVENTS_QUEUE_SIZE", 2, raising=False)
+    monkeypatch.setattr(svc.settings, "EVENTS_HEARTBEAT", 0.01, raising=False)
+
+    async def _run():
+        sub, _ = events.subscribe()
+        stream = events_router.event_stream(sub, False)
+        hello = await stream.__anext__()
+        assert await stream.__anext__() == ": ping\n\n"
+        for i in range(4):
+            events.publish("n", {"i": i})
+        rest = [chunk async for chunk in stream]  # ends once the backlog is sent
+        return hello, rest, events.subscribers
+
+    hello, rest, subscribers = asyncio.run(_run())
+    name, data, eid = _frames(hello)[0]
+    assert name == "hello" and data["resumed"] is False and eid is None
+    assert hello.startswith("retry: ")
+    assert [d["i"] for _, d, _ in _frames("".join(rest))] == [0, 1]
+    assert subscribers == 0
+
+
+def test_membership_changes_are_published_as_deltas():
+    log = MembershipLog()
+
+    async def _run():
+        sub, _ = events.subscribe()
+        log.observe("guests", {"users": [{"pk": 1}, {"pk": 2}]})
+        log.observe("members", {"users": []})
+        log.moved("guests", "members", 2)
+        log.observe("guests", {"users": [{"pk": 1, "username": "new"}]})
+        big = [{"pk": pk} for pk in range(10, 12 + EVENT_MAX_USERS)]
+        log.observe("members", {"users": big})
+        return [e[2] for e in await sub.next_batch(0.1)]
+
+    left, joined, edited, reset = asyncio.run(_run())
+    assert left["group"] == "guests" and left["removed"] == [2]
+    assert joined["group"] == "members" and joined["added"] == [{"pk": 2}]
+    assert edited["changed"] == [{"pk": 1, "username": "new"}]
+    assert reset["reset"] is True and "added" not in reset
+    assert log.since("members", joined["version"])[0] is not None
+
+
+def test_bulk_and_invites_publish_events(monkeypatch, client, as_async):
+    monkeypatch.setattr(
+        svc.aak,
+        "switch_group_user_pk",
+        as_async(lambda s, d, pk: {"add": 204, "remove": 204, "outcome": "complete"}),
+    )
+    r = client.post("/promote/bulk", json={"pks": [1, 2], "send_mail": False})
+    assert r.status_code == 200
+
+    monkeypatch.setattr(
+        svc.aak,
+        "create_invitation",
+        as_async(lambda **k: {"pk": "secret", "invite_url": "https://x/?itoken=secret"}),
+    )
+    assert client.post("/invites", json={"name": "Ann"}).status_code == 200
+
+    published = [(t, d) for _, t, d in events._recent]
+    bulk = [d for t, d in published if t == "bulk"]
+    assert [d["state"] for d in bulk] == ["running", "running", "running", "finished"]
+    assert bulk[-1]["ok"] == 2 and bulk[-1]["total"] == 2 and bulk[-1]["action"] == "promote"
+    invite = [d for t, d in published if t == "invite"][0]
+    assert invite["name"] == "Ann" and "secret" not in json.dumps(invite)
+
+
+def test_events_route_resumes_from_header():
+    from starlette.requests import Request
+
+    async def _run():
+        first = events.publish("n", {"i": 0})
+        second = events.publish("n", {"i": 1})
+        scope = {"type": "http", "method": "GET", "headers": [(b"last-event-id", first.encode())]}
+        resp = await events_router.stream_events(Request(scope))
+        body = cast(AsyncGenerator[str, None], resp.body_iterator)
+        chunks = [await body.__anext__(), await body.__anext__()]
+        await body.aclose()
+        return resp, chunks, second
+
+    resp, chunks, second = asyncio.run(_run())
+    assert resp.media_type == "text/event-stream"
+    frames = _frames("".join(chunks))
+    assert frames[0][1]["resumed"] is True
+    assert frames[1][1] == {"i": 1} and frames[1][2] == second
+    assert events.subscribers == 0
@@ -0,0 +1,92 @@
+# tests/test_group_stream.py
+import asyncio
+import json
+import re
+
+import httpx
+
+import routers.users as users_router
+import services.authentik as svc
+from services.membership_cache import membership_cache
+
+MEMBERS = [{"pk": pk, "username": f"m{pk}", "email": f"m{pk}@x"} for pk in range(1, 6)]
+
+
+def _directory(calls, fail_page=None, legacy=False):
+    def handler(request: httpx.Request) -> httpx.Response:
+        params = dict(request.url.params)
+        calls.append(params.get("page") or request.url.path)
+        if re.search(r"/core/groups/[^/]+/$", request.url.path):
+            if params.get("include_users") == "true":
+                return httpx.Response(200, json={"name": "Gäste", "users_obj": MEMBERS[:2]})
+            return httpx.Response(200, json={"name": "Gäste"})
+        if legacy:
+            return httpx.Response(400, json={"groups_by_pk": ["unknown"]})
+        page, size = int(params["page"]), int(params["page_size"])
+        if page == fail_page:
+            return httpx.Response(500, json={"detail": "boom"})
+        chunk = MEMBERS[(page - 1) * size : page * size]
+        nxt = page + 1 if page * size < len(MEMBERS) else 0
+        return httpx.Response(200, json={"pagination": {"next": nxt}, "results": chunk})
+
+    return svc.AsyncAuthentikClient(transport=httpx.MockTransport(handler))
+
+
+def test_stream_opens_with_the_first_page_only(monkeypatch):
+    monkeypatch.setattr(svc.settings, "AK_GROUP_PAGE_SIZE", 2, raising=False)
+    calls = []
+    client = _directory(calls)
+
+    async def _run():
+        name, pages = await client.open_group_stream("guests")
+        opened = list(calls)
+        batches = [[u["pk"] for u in rows] async for rows in pages]
+        return name, opened, batches
+
+    name, opened, batches = asyncio.run(_run())
+    assert name == "Gäste"
+    assert opened == ["/api/v3/core/groups/guests/", "1"]
+    assert batches == [[1, 2], [3, 4], [5]]
+
+
+def test_stream_uses_cached_listing_and_falls_back_to_include_users(monkeypatch):
+    calls = []
+    membership_cache.put("guests", {"group_name": "Guests", "users": MEMBERS})
+
+    async def _collect(client, group):
+        name, pages = await client.open_group_stream(group)
+        return name, [u["pk"] async for rows in pages for u in rows]
+
+    assert asyncio.run(_collect(_directory(calls), "guests")) == ("Guests", [1, 2, 3, 4, 5])
+    assert calls == []
+
+    name, pks = asyncio.run(_collect(_directory(calls, legacy=True), "other"))
+    assert (name, pks) == ("Gäste", [1, 2])
+
+
+def test_ndjson_route_streams_lines(monkeypatch, client):
+    monkeypatch.setattr(svc.settings, "AK_GROUP_PAGE_SIZE", 2, raising=False)
+    monkeypatch.setattr(users_router, "aak", _directory([]))
+    r = client.get("/members-users", params={"format": "ndjson"})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    assert r.headers["x-group-name"] == "G%C3%A4ste"
+    rows = [json.loads(line) for line in r.text.splitlines()]
+    assert [u["pk"] for u in rows] == [1, 2, 3, 4, 5]
+
+
+def test_ndjson_route_reports_a_late_failure_in_band(monkeypatch, client):
+    monkeypatch.setattr(svc.settings, "AK_GROUP_PAGE_SIZE", 2, raising=False)
+    monkeypatch.setattr(svc.settings, "AK_RETRY_ATTEMPTS", 0, raising=False)
+    monkeypatch.setattr(users_router, "aak", _directory([], fail_page=2))
+    r = client.get("/guest-users", params={"format": "ndjson"})
+    assert r.status_code == 200
+    rows = [json.loads(line) for line in r.text.splitlines()]
+    assert [u.get("pk") for u in rows[:2]] == [1, 2]
+    assert "error" in rows[-1] and len(rows) == 3
+
+
+def test_ndjson_route_rejects_bad_combinations(client):
+    assert client.get("/guest-users", params={"format": "xml"}).status_code == 400
+    r = client.get("/guest-users", params={"format": "ndjson", "page": 2})
+    assert r.status_code == 400 and "ndjson" in r.json()["detail"]
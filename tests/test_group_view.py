@@ -0,0 +1,119 @@
+# tests/test_group_view.py
+import asyncio
+
+import pytest
+
+import services.authentik as svc
+from services.group_view import GroupView, GroupViews, parse_sort
+from services.membership_cache import membership_cache
+
+USERS = [
+    {"pk": 3, "username": "carol", "email": "carol@example.test"},
+    {"pk": 1, "username": "alice", "email": "zed@corp.test"},
+    {"pk": 12, "username": "bob", "email": "bob@example.test"},
+    {"pk": 2, "username": "Dave", "email": None},
+]
+
+
+def _view():
+    return GroupView({"group_name": "Guests", "users": USERS})
+
+
+def _pks(out):
+    return [u["pk"] for u in out["users"]]
+
+
+def test_sort_parsing():
+    assert parse_sort("") == ("pk", False)
+    assert parse_sort("-email") == ("email", True)
+    with pytest.raises(ValueError):
+        parse_sort("password")
+
+
+def test_sorting_and_paging():
+    v = _view()
+    out = v.page(page_size=2)
+    assert _pks(out) == [1, 2] and out["total"] == 4 and out["pages"] == 2
+    assert _pks(v.page(page=2, page_size=2)) == [3, 12]
+    assert _pks(v.page(sort="username")) == [1, 12, 3, 2]  # case-insensitive
+    assert _pks(v.page(sort="-username", page_size=3)) == [2, 3, 12]
+    assert _pks(v.page(sort="-pk", page=2, page_size=3)) == [1]
+    assert _pks(v.page(sort="email")) == [2, 12, 3, 1]
+    # out-of-range pages clamp, like the old client-side pager did
+    clamped = v.page(page=9, page_size=3)
+    assert clamped["page"] == 2 and _pks(clamped) == [12]
+
+
+def test_filter_matches_pk_username_and_email():
+    v = _view()
+    out = v.page(q=" EXAMPLE ")
+    assert _pks(out) == [3, 12] and out["matched"] == 2 and out["total"] == 4
+    assert out["q"] == "EXAMPLE"
+    assert _pks(v.page(q="1")) == [1, 12]  # pk substring
+    assert _pks(v.page(q="dave")) == [2]
+    assert _pks(v.page(q="e", sort="-username")) == [2, 3, 12, 1]
+    # matches never span two fields or two rows
+    assert v.page(q="carol@example.testbob")["users"] == []
+    assert v.page(q="\x00")["matched"] == 0
+    assert v.page(q="nobody")["pages"] == 1
+
+
+def test_views_are_reused_until_the_listing_changes():
+    views = GroupViews()
+    a = views.build("g", 1, {"users": USERS})
+    assert views.lookup("g", 1) is a
+    assert views.lookup("g", 2) is None and views.lookup("g", None) is None
+    views.build("h", None, {"users": USERS})
+    assert views.lookup("h", None) is None
+
+
+def test_list_group_page_rebuilds_after_a_move(monkeypatch):
+    calls = []
+
+    async def fake_load(self, group_uuid):
+        calls.append(group_uuid)
+        offset = 0 if group_uuid == "guests" else 100
+        return {"group_name": group_uuid, "users": [dict(u, pk=u["pk"] + offset) for u in USERS]}
+
+    monkeypatch.setattr(svc.AsyncAuthentikClient, "_load_group_users", fake_load)
+    client = svc.AsyncAuthentikClient()
+
+    async def _run():
+        first = await client.list_group_page("guests", q="example")
+        again = await client.list_group_page("guests", page=2, page_size=1)
+        await client.list_group_users("members")
+        membership_cache.move("guests", "members", 3)
+        moved = await client.list_group_page("guests", q="example")
+        members = await client.list_group_page("members", sort="-pk")
+        return first, again, moved, members
+
+    first, again, moved, members = asyncio.run(_run())
+    assert _pks(first) == [3, 12] and _pks(again) == [2]
+    assert _pks(moved) == [12] and moved["total"] == 3
+    assert 3 in _pks(members) and members["total"] == 5
+    assert calls == ["guests", "members"]
+
+
+def test_group_routes_page_when_asked(monkeypatch, client, as_async):
+    users = [
+        {"pk": i, "username": f"user{i}", "email": f"u{i}@example.test"} for i in range(1, 121)
+    ]
+    monkeypatch.setattr(
+        svc.aak,
+        "list_group_users",
+        as_async(lambda *a, **k: {"group_name": "Guests", "users": users}),
+    )
+    full = client.get("/guest-users").json()
+    assert len(full["users"]) == 120 and "total" not in full
+
+    r = client.get("/guest-users", params={"page": 2, "page_size": 25, "q": "user1", "sort": "-pk"})
+    assert r.status_code == 200
+    j = r.json()
+    assert j["matched"] == 32 and j["total"] == 120 and j["pages"] == 2
+    assert [u["pk"] for u in j["users"]] == [15, 14, 13, 12, 11, 10, 1]
+
+    j = client.get("/members-users", params={"page_size": 10000}).json()
+    assert j["page_size"] == 500 and len(j["users"]) == 120
+
+    r = client.get("/guest-users", params={"sort": "password"})
+    assert r.status_code == 400 and "sort must be one of" in r.json()["detail"]
@@ -1,5 +1,5 @@
 # tests/test_invites.py
-def test_create_invite_with_email_sends_mail(monkeypatch, client):
+def test_create_invite_with_email_sends_mail(monkeypatch, client, as_async):
     fake_inv = {
         "pk": "abc123",
         "invite_url": "https://ak.example.test/if/flow/invite-via-email/?itoken=abc123",
@@ -9,7 +9,7 @@ def test_create_invite_with_email_sends_mail(monkeypatch, client):
 
     import services.authentik as svc
 
-    monkeypatch.setattr(svc.ak, "create_invitation", lambda *a, **k: dict(fake_inv))
+    monkeypatch.setattr(svc.aak, "create_invitation", as_async(lambda *a, **k: dict(fake_inv)))
 
     import routers.invites as invites_router
 
@@ -28,3 +28,81 @@ def test_create_invite_with_email_sends_mail(monkeypatch, client):
     j = r.json()
     assert j["pk"] == "abc123"
     assert j["invite_url"].startswith("https://ak.example.test/")
+
+
+def test_bulk_invites_from_csv_validate_and_dedupe(monkeypatch, client, as_async):
+    import services.authentik as svc
+    import routers.invites as invites_router
+    from services.events import events
+
+    created = []
+
+    def _create(**k):
+        if k["username"] == "boom":
+            raise RuntimeError("authentik said no")
+        created.append(k)
+        return {"invite_url": f"https://ak.example.test/?itoken={k['username']}", "expires": "x"}
+
+    monkeypatch.setattr(svc.aak, "create_invitation", as_async(_create))
+    monkeypatch.setattr(invites_router, "send_invitation_email", lambda **k: True)
+
+    body = (
+        "﻿Name,Email,Expires_Days,notes\n"
+        "Ada,ADA@example.test,,hi\n"
+        "Bob,bob@example.test,3,\n"
+        "Ada again,ada@example.test,,\n"
+        "Nope,not-an-email,,\n"
+        "boom,,,\n"
+        ",,,\n"
+    )
+    r = client.post(
+        "/invites/bulk?single_use=false",
+        content=body,
+        headers={"content-type": "text/csv; charset=utf-8"},
+    )
+    assert r.status_code == 200
+    j = r.json()
+    assert (j["count_ok"], j["count_failed"]) == (2, 4)
+    rows = j["results"]
+    assert [x["row"] for x in rows] == [1, 2, 3, 4, 5, 6]
+    assert rows[0]["ok"] and rows[0]["email"] == "ada@example.test" and "mail_id" in rows[0]
+    assert rows[2]["detail"] == "duplicate of row 1"
+    assert rows[3]["detail"].startswith("invalid email")
+    assert rows[4]["detail"] == "authentik said no"
+    assert rows[5]["detail"] == "name, username or email is required"
+    assert [(c["expires_days"], c["single_use"]) for c in created] == [(None, False), (3, False)]
+    # other admins hear about each created invite, as with POST /invites
+    invited = [d for _, t, d in events._recent if t == "invite"]
+    assert sorted(d["name"] for d in invited[-2:]) == ["Ada", "Bob"]
+    assert all(d["mailed"] for d in invited[-2:])
+
+
+def test_bulk_invites_stream_json_rows(monkeypatch, client, as_async):
+    import json
+
+    import services.authentik as svc
+
+    monkeypatch.setattr(
+        svc.aak, "create_invitation", as_async(lambda **k: {"invite_url": "https://x/?itoken=t"})
+    )
+    payload = {"rows": [{"name": "Ann"}, {"name": "Cy", "expires_days": "soon"}], "flow": "f"}
+    r = client.post("/invites/bulk", params={"format": "ndjson"}, json=payload)
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    assert sorted((x["row"], x["ok"]) for x in lines[:-1]) == [(1, True), (2, False)]
+    assert lines[-1] == {"done": True, "count_ok": 1, "count_failed": 1}
+
+    assert client.post("/invites/bulk", json=[]).status_code == 400
+    assert (
+        client.post(
+            "/invites/bulk", content="a,b\n1,2\n", headers={"content-type": "text/csv"}
+        ).status_code
+        == 400
+    )
+    assert (
+        client.post(
+            "/invites/bulk", content="x", headers={"content-type": "text/plain"}
+        ).status_code
+        == 415
+    )
+    monkeypatch.setattr(svc.settings, "INVITES_BULK_MAX_ROWS", 1, raising=False)
+    assert client.post("/invites/bulk", json=[{"name": "a"}, {"name": "b"}]).status_code == 413
@@ -0,0 +1,125 @@
+# tests/test_jobs.py
+import asyncio
+import json
+
+import httpx
+
+import services.authentik as svc
+from services.jobs import JobScheduler
+
+
+def _run_with_app(app, scenario):
+    # background jobs live on the event loop; keep every request of a test on one loop
+    async def _main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://localhost") as c:
+            return await scenario(c)
+
+    return asyncio.run(_main())
+
+
+async def _wait(c, job_id):
+    for _ in range(200):
+        j = (await c.get(f"/jobs/{job_id}")).json()
+        if j["state"] in ("finished", "cancelled"):
+            return j
+        await asyncio.sleep(0.005)
+    raise AssertionError("job did not finish")
+
+
+def test_job_runs_past_the_bulk_cap_and_retries_failures(monkeypatch, app, as_async):
+    flaky = {7, 450}
+
+    def _switch(src, dst, pk):
+        if pk in flaky:
+            raise svc.SwitchError("authentik said no", "failed")
+        return {"add": 204, "remove": 204, "outcome": "complete"}
+
+    monkeypatch.setattr(svc.aak, "switch_group_user_pk", as_async(_switch))
+
+    async def scenario(c):
+        r = await c.post("/jobs", json={"action": "demote", "pks": list(range(1, 501))})
+        assert r.status_code == 202 and r.json()["state"] in ("queued", "running")
+        done = await _wait(c, r.json()["id"])
+        full = (await c.get(f"/jobs/{done['id']}", params={"results": "true"})).json()
+
+        flaky.clear()  # authentik recovered
+        retry = await c.post(f"/jobs/{done['id']}/retry")
+        assert retry.status_code == 202
+        again = await _wait(c, retry.json()["id"])
+        nothing_left = await c.post(f"/jobs/{again['id']}/retry")
+        listing = (await c.get("/jobs")).json()["jobs"]
+        return done, full, again, nothing_left, listing
+
+    done, full, again, nothing_left, listing = _run_with_app(app, scenario)
+    assert (done["total"], done["ok"], done["failed"]) == (500, 498, 2)
+    assert "failures" not in done and "results" not in done
+    assert sorted(f["pk"] for f in full["failures"]) == [7, 450]
+    assert len(full["results"]) == 500
+    assert again["retry_of"] == done["id"] and (again["total"], again["ok"]) == (2, 2)
+    assert nothing_left.status_code == 409
+    assert [j["id"] for j in listing] == [again["id"], done["id"]]
+
+
+def test_cancel_stops_new_items_but_lets_moves_finish(monkeypatch, app):
+    monkeypatch.setattr(svc.settings, "BULK_CONCURRENCY", 2, raising=False)
+    started = []
+
+    async def scenario(c):
+        release = asyncio.Event()
+
+        async def _switch(src, dst, pk):
+            started.append(pk)
+            await release.wait()
+            return {"add": 204, "remove": 204, "outcome": "complete"}
+
+        monkeypatch.setattr(svc.aak, "switch_group_user_pk", _switch)
+        job = (await c.post("/jobs", json={"action": "promote", "pks": [1, 2, 3, 4, 5]})).json()
+        queued = (await c.post("/jobs", json={"action": "demote", "pks": [9]})).json()
+        while len(started) < 2:
+            await asyncio.sleep(0.001)
+
+        cancelled = (await c.post(f"/jobs/{job['id']}/cancel")).json()
+        assert cancelled["cancel_requested"] and cancelled["state"] == "running"
+        gone = (await c.post(f"/jobs/{queued['id']}/cancel")).json()
+        again = await c.post(f"/jobs/{queued['id']}/cancel")
+
+        stream = asyncio.create_task(c.get(f"/jobs/{job['id']}", params={"format": "ndjson"}))
+        release.set()
+        final = await _wait(c, job["id"])
+        before_retry = sorted(started)
+        retry = (await c.post(f"/jobs/{job['id']}/retry")).json()
+        return final, before_retry, gone, again, await stream, await _wait(c, retry["id"])
+
+    final, before_retry, gone, again, stream, retried = _run_with_app(app, scenario)
+    assert final["state"] == "cancelled" and final["done"] == 2 and final["ok"] == 2
+    assert before_retry == [1, 2]  # the queued job never ran either
+    assert gone["state"] == "cancelled" and again.status_code == 409
+    lines = [json.loads(line) for line in stream.text.splitlines()]
+    assert sorted(line["pk"] for line in lines[:-1]) == [1, 2]
+    assert lines[-1] == {"done": True, "state": "cancelled", "total": 5, "ok": 2, "failed": 0}
+    # nothing failed, but the users the cancel skipped are retried
+    assert retried["total"] == 3 and sorted(started) == [1, 2, 3, 4, 5]
+
+
+def test_job_routes_validate(client):
+    assert client.post("/jobs", json={"action": "delete", "pks": [1]}).status_code == 400
+    assert client.post("/jobs", json={"action": "promote", "pks": []}).status_code == 400
+    assert client.get("/jobs/nope").status_code == 404
+    assert client.post("/jobs/nope/retry").status_code == 404
+
+
+def test_history_keeps_only_recent_finished_jobs():
+    scheduler = JobScheduler(history=2)
+
+    async def ok(pk):
+        return {"pk": pk, "ok": True}
+
+    async def _run():
+        jobs = [scheduler.submit("demote", [i], ok) for i in range(4)]
+        while any(j.active for j in jobs):
+            await asyncio.sleep(0.001)
+        return jobs
+
+    jobs = asyncio.run(_run())
+    assert [j.id for j in scheduler.list()] == [jobs[3].id, jobs[2].id]
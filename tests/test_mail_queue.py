@@ -0,0 +1,132 @@
+# tests/test_mail_queue.py
+import pytest
+
+import tools.mailer as mail
+from tools.mail_queue import MailQueue, NoRecipient
+
+
+def _flaky(fail_times, result=True):
+    calls = []
+
+    def send(**kw):
+        calls.append(kw)
+        if len(calls) <= fail_times:
+            raise OSError("smtp down")
+        return result
+
+    return send, calls
+
+
+def test_sent_message_reports_state_and_passes_raise_on_error():
+    q = MailQueue(workers=2)
+    send, calls = _flaky(0)
+    mid = q.submit("promotion", send, "ada@example.test", meta={"pk": 7}, name="Ada")
+    assert q.join(timeout=5)
+    st = q.status(mid)
+    assert st is not None
+    assert st["status"] == "sent" and st["attempts"] == 1 and st["pk"] == 7
+    assert st["to"] == "ad***@example.test"
+    assert calls == [{"raise_on_error": True, "to_email": "ada@example.test", "name": "Ada"}]
+    assert q.stats()["by_status"] == {"sent": 1}
+    q.drain(timeout=1)
+
+
+def test_transient_errors_are_retried(monkeypatch):
+    monkeypatch.setattr(mail.settings, "MAIL_RETRY_ATTEMPTS", 3, raising=False)
+    q = MailQueue(workers=1)
+    send, calls = _flaky(2)
+    mid = q.submit("invitation", send, "b@example.test")
+    q.join(timeout=5)
+    st = q.status(mid)
+    assert st is not None
+    assert st["status"] == "sent"
+    assert st["attempts"] == 3
+    q.drain(timeout=1)
+
+
+def test_exhausted_retries_mark_failed_and_false_is_not_retried(monkeypatch):
+    monkeypatch.setattr(mail.settings, "MAIL_RETRY_ATTEMPTS", 1, raising=False)
+    q = MailQueue(workers=1)
+    boom, boom_calls = _flaky(99)
+    unconfigured, unconfigured_calls = _flaky(0, result=False)
+    failed = q.submit("promotion", boom, "c@example.test")
+    skipped = q.submit("promotion", unconfigured, "d@example.test")
+    q.join(timeout=5)
+    st, skip = q.status(failed), q.status(skipped)
+    assert st is not None and skip is not None
+    assert st["status"] == "failed"
+    assert "smtp down" in st["error"]
+    assert len(boom_calls) == 2
+    assert skip["status"] == "not_sent"
+    assert len(unconfigured_calls) == 1
+    q.drain(timeout=1)
+
+
+def test_lookup_finds_the_recipient_on_the_worker(monkeypatch):
+    monkeypatch.setattr(mail.settings, "MAIL_RETRY_ATTEMPTS", 3, raising=False)
+    q = MailQueue(workers=1)
+    send, calls = _flaky(0)
+    found = q.submit_lookup(
+        "promotion", send, lambda: {"to_email": "ada@example.test", "name": "Ada"}
+    )
+    nobody = q.submit_lookup("promotion", send, lambda: None, meta={"pk": 9})
+    lookups = []
+
+    def deleted():
+        lookups.append(1)
+        raise NoRecipient("user not found")
+
+    gone = q.submit_lookup("promotion", send, deleted)
+    assert q.join(timeout=5)
+    st, skip, lost = q.status(found), q.status(nobody), q.status(gone)
+    assert st is not None and skip is not None and lost is not None
+    assert st["status"] == "sent" and st["to"] == "ad***@example.test"
+    assert calls == [{"raise_on_error": True, "to_email": "ada@example.test", "name": "Ada"}]
+    assert skip["status"] == "not_sent" and skip["error"] == "no email address"
+    # a definite no is not retried
+    assert lost["status"] == "not_sent" and lost["error"] == "user not found"
+    assert lookups == [1]
+    q.drain(timeout=1)
+
+
+def test_drain_stops_workers_and_history_is_bounded():
+    q = MailQueue(workers=2, history=2)
+    send, _ = _flaky(0)
+    ids = [q.submit("promotion", send, f"u{i}@example.test") for i in range(4)]
+    assert q.drain(timeout=5)
+    assert q.stats()["workers"] == 0
+    last = q.status(ids[-1])
+    assert q.status(ids[0]) is None and last is not None and last["status"] == "sent"
+    # workers come back on demand
+    q.submit("promotion", send, "again@example.test")
+    assert q.join(timeout=5)
+    q.drain(timeout=1)
+
+
+def test_send_html_raise_on_error(monkeypatch):
+    class BrokenSMTP:
+        def __init__(self, *a, **k):
+            raise OSError("connection refused")
+
+    monkeypatch.setattr(mail.settings, "SMTP_PORT", 587, raising=False)
+    monkeypatch.setattr(mail.smtplib, "SMTP", BrokenSMTP, raising=True)
+    assert mail._send_html("a@example.test", "s", "<p>x</p>") is False
+    with pytest.raises(OSError):
+        mail._send_html("a@example.test", "s", "<p>x</p>", raise_on_error=True)
+
+
+def test_invite_route_queues_mail_and_exposes_status(monkeypatch, client, as_async):
+    import routers.invites as invites_router
+    import services.authentik as svc
+    from tools.mail_queue import mail_queue
+
+    inv = {"pk": "t", "invite_url": "https://ak.example.test/x", "expires_friendly": "soon"}
+    monkeypatch.setattr(svc.aak, "create_invitation", as_async(lambda **k: dict(inv)))
+    monkeypatch.setattr(invites_router, "send_invitation_email", lambda **k: True)
+
+    j = client.post("/invites", json={"email": "eve@example.test"}).json()
+    mail_queue.join(timeout=5)
+    st = client.get(f"/mail/{j['mail_id']}").json()
+    assert st["status"] == "sent" and st["kind"] == "invitation"
+    assert client.get("/mail").json()["by_status"]["sent"] >= 1
+    assert client.get("/mail/nope").status_code == 404
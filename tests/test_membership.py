@@ -1,11 +1,11 @@
 # tests/test_membership.py
-def test_promote_ok_sends_mail(monkeypatch, client):
+def test_promote_ok_sends_mail(monkeypatch, client, as_async):
     import services.authentik as svc
 
     def fake_switch_group_user_pk(*args, **kwargs):
         return {"add": 200, "remove": 200}
 
-    monkeypatch.setattr(svc.ak, "switch_group_user_pk", fake_switch_group_user_pk)
+    monkeypatch.setattr(svc.aak, "switch_group_user_pk", as_async(fake_switch_group_user_pk))
     monkeypatch.setattr(
         svc.ak, "get_user", lambda *a, **k: {"email": "u@example.test", "name": "U"}
     )
@@ -19,24 +19,26 @@ def test_promote_ok_sends_mail(monkeypatch, client):
     assert r.json().get("status") == "ok"
 
 
-def test_demote_ok(monkeypatch, client):
+def test_demote_ok(monkeypatch, client, as_async):
     import services.authentik as svc
 
-    monkeypatch.setattr(svc.ak, "switch_group_user_pk", lambda *a, **k: {"add": 200, "remove": 200})
+    monkeypatch.setattr(
+        svc.aak, "switch_group_user_pk", as_async(lambda *a, **k: {"add": 200, "remove": 200})
+    )
 
     r = client.post("/demote", json={"pk": 7})
     assert r.status_code == 200
     assert r.json().get("status") == "ok"
 
 
-def test_promote_bulk_mixtures(monkeypatch, client):
+def test_promote_bulk_mixtures(monkeypatch, client, as_async):
     import services.authentik as svc
 
     def fake_switch(*args, **kwargs):
         pk = args[-1] if args else kwargs.get("pk", 0)
         return {"add": 200, "remove": 200} if pk % 2 == 0 else {"add": 500, "remove": 500}
 
-    monkeypatch.setattr(svc.ak, "switch_group_user_pk", fake_switch)
+    monkeypatch.setattr(svc.aak, "switch_group_user_pk", as_async(fake_switch))
 
     import routers.membership as membership_router
 
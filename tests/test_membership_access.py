@@ -16,7 +16,12 @@ def client_auth_on(monkeypatch):
     from web.app_factory import create_app
 
     app = create_app("Authentik Helper")
-    return TestClient(app, base_url="http://localhost", follow_redirects=False)
+    yield TestClient(app, base_url="http://localhost", follow_redirects=False)
+
+    # put auth back OFF so later tests don't inherit the reloaded settings
+    monkeypatch.setenv("DISABLE_AUTH", "true")
+    importlib.reload(settings_mod)
+    importlib.reload(auth_mod)
 
 
 def test_promote_requires_auth_when_enabled(client_auth_on):
@@ -0,0 +1,110 @@
+# tests/test_membership_cache.py
+import asyncio
+
+import httpx
+import pytest
+
+import services.authentik as svc
+from services.membership_cache import MembershipCache
+
+
+def _listing(name, *pks):
+    return {"group_name": name, "users": [{"pk": pk, "username": f"u{pk}"} for pk in pks]}
+
+
+def _cache(ttl=30.0):
+    now = [0.0]
+    return MembershipCache(ttl=ttl, clock=lambda: now[0]), now
+
+
+def test_get_put_and_expiry():
+    c, now = _cache()
+    assert c.get("g") is None
+    c.put("g", _listing("Guests", 3, 1))
+    assert c.get("g") == _listing("Guests", 1, 3)
+    now[0] = 30.0
+    assert c.get("g") is None
+
+
+def test_partial_listings_and_zero_ttl_are_not_cached():
+    c, _ = _cache()
+    c.put("g", {**_listing("Guests", 1), "failed": [{"pk": 2, "error": "x"}]})
+    assert c.get("g") is None
+
+    off, _ = _cache(ttl=0)
+    off.put("g", _listing("Guests", 1))
+    assert off.get("g") is None
+
+
+def test_move_patches_both_groups():
+    c, _ = _cache()
+    c.put("guests", _listing("Guests", 1, 2))
+    c.put("members", _listing("Members", 5))
+    c.move("guests", "members", 2)
+    guests, members = c.get("guests"), c.get("members")
+    assert guests is not None and members is not None
+    assert [u["pk"] for u in guests["users"]] == [1]
+    assert [u["pk"] for u in members["users"]] == [2, 5]
+
+
+def test_move_of_unknown_user_drops_target():
+    c, _ = _cache()
+    c.put("members", _listing("Members", 5))
+    c.move("guests", "members", 9)
+    assert c.get("members") is None
+
+
+def test_invalidate_some_or_all():
+    c, _ = _cache()
+    c.put("a", _listing("A", 1))
+    c.put("b", _listing("B", 2))
+    c.invalidate("a")
+    assert c.get("a") is None and c.get("b") is not None
+    c.invalidate()
+    assert c.get("b") is None
+
+
+def test_client_serves_cached_listing_and_writes_through_switch():
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append((request.method, request.url.path))
+        if request.method == "POST":
+            return httpx.Response(204)
+        gid = request.url.params.get("groups_by_pk")
+        if gid is None:
+            return httpx.Response(200, json={"name": "G"})
+        pks = [1, 2] if gid == "guests" else [7]
+        results = [{"pk": pk, "username": f"u{pk}", "email": f"{pk}@x"} for pk in pks]
+        return httpx.Response(200, json={"pagination": {"next": 0}, "results": results})
+
+    async def _go():
+        c = svc.AsyncAuthentikClient(transport=httpx.MockTransport(handler))
+        await c.list_group_users("guests")
+        await c.list_group_users("members")
+        fetched = len(calls)
+        await c.switch_group_user_pk("guests", "members", 2)
+        guests = await c.list_group_users("guests")
+        members = await c.list_group_users("members")
+        return fetched, guests, members
+
+    fetched, guests, members = asyncio.run(_go())
+    assert [u["pk"] for u in guests["users"]] == [1]
+    assert [u["pk"] for u in members["users"]] == [2, 7]
+    # only the two switch posts went out after the first loads
+    assert len(calls) == fetched + 2
+
+
+def test_failed_switch_invalidates_both_groups():
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.method == "POST":
+            return httpx.Response(400, json={"pk": ["bad"]})
+        return httpx.Response(200, json={"name": "G", "results": []})
+
+    c = svc.AsyncAuthentikClient(transport=httpx.MockTransport(handler))
+    svc.membership_cache.put("guests", _listing("Guests", 1))
+    svc.membership_cache.put("members", _listing("Members", 2))
+    with pytest.raises(RuntimeError, match="switch failed"):
+        asyncio.run(c.switch_group_user_pk("guests", "members", 1))
+    assert svc.membership_cache.get("guests") is None
+    assert svc.membership_cache.get("members") is None
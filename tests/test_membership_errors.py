@@ -45,7 +45,7 @@ def test_promote_bulk_too_many(client: TestClient):
         return
 
 
-def test_promote_bulk_dedupes_and_counts(monkeypatch, client: TestClient):
+def test_promote_bulk_dedupes_and_counts(monkeypatch, client: TestClient, as_async):
     # ensure the handler logic is exercised when reachable.
     # if unauthenticated, we still accept the redirect path via helper above.
     import services.authentik as svc
@@ -55,7 +55,7 @@ def test_promote_bulk_dedupes_and_counts(monkeypatch, client: TestClient):
         # even pks succeed, odd fail
         return {"add": 200, "remove": 200} if pk % 2 == 0 else {"add": 500, "remove": 500}
 
-    monkeypatch.setattr(svc.ak, "switch_group_user_pk", fake_switch)
+    monkeypatch.setattr(svc.aak, "switch_group_user_pk", as_async(fake_switch))
 
     r = client.post("/promote/bulk", json={"pks": [1, 1, 2, 3, 4]})
     if _assert_status_or_login_redirect(r, 200):
@@ -0,0 +1,155 @@
+# tests/test_membership_log.py
+import asyncio
+
+import routers.users as users_router
+import services.authentik as svc
+from services.membership_log import MembershipLog
+
+
+def _listing(*pks, name="u"):
+    return {"group_name": "G", "users": [{"pk": pk, "username": f"{name}{pk}"} for pk in pks]}
+
+
+def _delta(log, group, token):
+    delta, _ = log.since(group, token)
+    assert delta is not None
+    return delta
+
+
+def test_observe_logs_adds_removes_and_edits():
+    log = MembershipLog()
+    assert log.observe("g", _listing(1, 2, 3)) == 0  # first listing is the baseline
+    t0 = log.version()
+    changed = _listing(2, 3, 4)
+    changed["users"][0]["username"] = "renamed"
+    assert log.observe("g", changed) == 3
+
+    delta, t1 = log.since("g", t0)
+    assert delta is not None
+    assert delta.as_dict() == {
+        "added": [{"pk": 4, "username": "u4"}],
+        "removed": [1],
+        "changed": [{"pk": 2, "username": "renamed"}],
+    }
+    assert _delta(log, "g", t1).as_dict() == {"added": [], "removed": [], "changed": []}
+
+
+def test_moves_between_groups_and_round_trips():
+    log = MembershipLog()
+    log.observe("guests", _listing(1, 2))
+    log.observe("members", _listing(9))
+    t0 = log.version()
+    log.moved("guests", "members", 2)
+    assert _delta(log, "guests", t0).removed == {2}
+    assert _delta(log, "members", t0).added == {2: {"pk": 2, "username": "u2"}}
+
+    # moved back again: members saw nothing, guests may have a fresher record
+    log.moved("members", "guests", 2)
+    assert _delta(log, "guests", t0).as_dict()["changed"] == [{"pk": 2, "username": "u2"}]
+    assert _delta(log, "members", t0).touched == set()
+
+
+def test_tokens_that_cannot_be_answered():
+    log = MembershipLog(maxlen=2)
+    assert log.since("g", log.version())[0] is None  # no baseline yet
+    log.observe("g", _listing(1))
+    t0 = log.version()
+    assert log.since("g", "other.0")[0] is None  # another process
+    assert log.since("g", "junk")[0] is None
+    log.observe("g", _listing(2, 3))  # three entries; the first falls off
+    assert log.since("g", t0)[0] is None
+
+    t1 = log.version()
+    log.observe("g", {"users": [], "failed": [{"pk": 3}]})  # partial: start over
+    assert log.since("g", t1)[0] is None
+
+    # a move into a group whose joiner we know nothing about also starts over
+    log.observe("h", _listing(5))
+    t2 = log.version()
+    log.moved("elsewhere", "h", 7)
+    assert log.since("h", t2)[0] is None
+
+    log.clear()
+    assert log.since("g", log.version())[0] is None
+
+
+def _groups_are(monkeypatch):
+    monkeypatch.setattr(svc.settings, "AK_GUESTS_GROUP_UUID", "guests", raising=False)
+    monkeypatch.setattr(svc.settings, "AK_MEMBERS_GROUP_UUID", "members", raising=False)
+
+
+def _fake_directory(monkeypatch, groups, loads=None):
+    async def fake_load(self, group_uuid):
+        if loads is not None:
+            loads.append(group_uuid)
+        return _listing(*groups[group_uuid])
+
+    monkeypatch.setattr(svc.AsyncAuthentikClient, "_load_group_users", fake_load)
+    client = svc.AsyncAuthentikClient()
+    monkeypatch.setattr(users_router, "aak", client)
+    return client
+
+
+def test_routes_hand_out_versions_and_deltas(monkeypatch, client):
+    _groups_are(monkeypatch)
+    groups = {"guests": [1, 2, 3], "members": [7]}
+    ak = _fake_directory(monkeypatch, groups)
+
+    full = client.get("/guest-users").json()
+    assert len(full["users"]) == 3 and full["version"]
+    page = client.get("/members-users", params={"page_size": 10}).json()
+
+    # a switch through the helper, then a change made in authentik itself
+    ak._switch_result("guests", "members", 2, _Ok(), _Ok())
+    groups["guests"] = [1, 3, 4]
+    asyncio.run(ak.load_group_users("guests"))
+
+    r = client.get("/guest-users", params={"since": full["version"]}).json()
+    assert r["removed"] == [2] and [u["pk"] for u in r["added"]] == [4]
+    assert r["changed"] == [] and "users" not in r
+    r = client.get("/members-users", params={"since": page["version"]}).json()
+    assert [u["pk"] for u in r["added"]] == [2]
+
+    assert client.get("/guest-users", params={"since": "stale.1"}).json()["reset"] is True
+    r = client.get("/guest-users", params={"since": "x", "format": "ndjson"})
+    assert r.status_code == 400
+
+
+def test_polls_after_the_cache_expires_do_not_reload(monkeypatch, client):
+    from services.membership_cache import membership_cache
+
+    _groups_are(monkeypatch)
+    loads = []
+    _fake_directory(monkeypatch, {"guests": [1, 2], "members": []}, loads)
+
+    full = client.get("/guest-users").json()
+    membership_cache.invalidate("guests")
+    for _ in range(3):
+        r = client.get("/guest-users", params={"since": full["version"]}).json()
+        assert r["added"] == [] and "reset" not in r
+    assert loads == ["guests"]
+
+
+def test_paged_refresh_stubs_rows_the_client_already_has(monkeypatch, client):
+    _groups_are(monkeypatch)
+    groups = {"guests": [1, 2, 3, 4], "members": []}
+    ak = _fake_directory(monkeypatch, groups)
+
+    first = client.get("/guest-users", params={"page_size": 3}).json()
+    assert [u["pk"] for u in first["users"]] == [1, 2, 3]
+    ak._switch_result("guests", "members", 2, _Ok(), _Ok())
+
+    params = {"page_size": 3, "since": first["version"], "have": "1,2,3"}
+    again = client.get("/guest-users", params=params).json()
+    assert again["users"] == [{"pk": 1}, {"pk": 3}, {"pk": 4, "username": "u4"}]
+    assert again["version"] != first["version"] and "reset" not in again
+
+    stale = client.get("/guest-users", params=dict(params, since="nope.0")).json()
+    assert stale["reset"] is True and stale["users"][0] == {"pk": 1, "username": "u1"}
+    r = client.get("/guest-users", params=dict(params, have="1,x"))
+    assert r.status_code == 400
+
+
+class _Ok:
+    status_code = 204
+
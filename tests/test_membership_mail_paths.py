@@ -3,6 +3,7 @@ from starlette.testclient import TestClient
 
 import routers.membership as membership
 from services import authentik as svc
+from tools.mail_queue import mail_queue
 
 
 def _assert_status_or_login_redirect(resp, expected: int) -> bool:
@@ -17,13 +18,19 @@ def _assert_status_or_login_redirect(resp, expected: int) -> bool:
     return False
 
 
-def test_promote_logs_not_sent_when_mail_false(monkeypatch, client, caplog):
+def test_promote_logs_not_sent_when_mail_false(monkeypatch, client, caplog, as_async):
     # real email address, but mailer returns False -> logs 'promotion_email_not_sent'
     monkeypatch.setattr(
-        svc.ak, "switch_group_user_pk", lambda *a, **k: {"add": 200, "remove": 200}, raising=True
+        svc.aak,
+        "switch_group_user_pk",
+        as_async(lambda *a, **k: {"add": 200, "remove": 200}),
+        raising=True,
     )
     monkeypatch.setattr(
-        svc.ak, "get_user", lambda pk: {"email": "x@example.test", "name": "X"}, raising=True
+        svc.ak,
+        "get_user",
+        lambda pk, **k: {"email": "x@example.test", "name": "X"},
+        raising=True,
     )
     monkeypatch.setattr(membership, "send_promotion_email", lambda **k: False, raising=True)
 
@@ -32,16 +39,23 @@ def test_promote_logs_not_sent_when_mail_false(monkeypatch, client, caplog):
     if _assert_status_or_login_redirect(r, 200):
         # if we were redirected to /login (auth enabled), we can't assert mail logs.
         return
+    mail_queue.join(timeout=5)
     # should log 'promotion_email_not_sent' when mailer returns false
     assert any("promotion_email_not_sent" in rec.message for rec in caplog.records)
 
 
-def test_promote_logs_failed_when_mail_raises(monkeypatch, client, caplog):
+def test_promote_logs_failed_when_mail_raises(monkeypatch, client, caplog, as_async):
     monkeypatch.setattr(
-        svc.ak, "switch_group_user_pk", lambda *a, **k: {"add": 200, "remove": 200}, raising=True
+        svc.aak,
+        "switch_group_user_pk",
+        as_async(lambda *a, **k: {"add": 200, "remove": 200}),
+        raising=True,
     )
     monkeypatch.setattr(
-        svc.ak, "get_user", lambda pk: {"email": "x@example.test", "name": "X"}, raising=True
+        svc.ak,
+        "get_user",
+        lambda pk, **k: {"email": "x@example.test", "name": "X"},
+        raising=True,
     )
 
     def _boom(**k):
@@ -53,6 +67,7 @@ def test_promote_logs_failed_when_mail_raises(monkeypatch, client, caplog):
     r = client.post("/promote", json={"pk": 100, "send_mail": True})
     if _assert_status_or_login_redirect(r, 200):
         return
+    mail_queue.join(timeout=5)
 
     # even though mail raised, route should log 'promotion_email_failed' (best-effort)
     assert any("promotion_email_failed" in rec.message for rec in caplog.records)
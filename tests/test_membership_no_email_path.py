@@ -1,4 +1,4 @@
-def test_promote_with_send_mail_true_but_user_has_no_email(monkeypatch, client):
+def test_promote_with_send_mail_true_but_user_has_no_email(monkeypatch, client, as_async):
     # helper: accept redirect to /login when auth is enabled
     def _assert_status_or_login_redirect(resp, expected: int) -> bool:
         if resp.status_code in (302, 303):
@@ -11,10 +11,15 @@ def test_promote_with_send_mail_true_but_user_has_no_email(monkeypatch, client):
     import services.authentik as svc
 
     monkeypatch.setattr(
-        svc.ak, "switch_group_user_pk", lambda *a, **k: {"add": 200, "remove": 200}, raising=True
+        svc.aak,
+        "switch_group_user_pk",
+        as_async(lambda *a, **k: {"add": 200, "remove": 200}),
+        raising=True,
     )
     # user has no email -> mail function must NOT be called
-    monkeypatch.setattr(svc.ak, "get_user", lambda pk: {"pk": pk, "name": "NoMail"}, raising=True)
+    monkeypatch.setattr(
+        svc.ak, "get_user", lambda pk, **k: {"pk": pk, "name": "NoMail"}, raising=True
+    )
 
     # track unexpected calls
     called = []
@@ -31,3 +36,18 @@ def test_promote_with_send_mail_true_but_user_has_no_email(monkeypatch, client):
     _assert_status_or_login_redirect(r, 200)
     # mailer must not be called because user has no email
     assert called == []
+
+
+def test_promotion_recipient_of_a_deleted_user_is_final(monkeypatch):
+    import pytest
+
+    import services.authentik as svc
+    from routers.membership import _promotion_recipient
+    from tools.mail_queue import NoRecipient
+
+    def gone(pk, **k):
+        raise svc.AuthentikNotFound(f"user {pk} not found")
+
+    monkeypatch.setattr(svc.ak, "get_user", gone, raising=True)
+    with pytest.raises(NoRecipient, match="user not found"):
+        _promotion_recipient(123)
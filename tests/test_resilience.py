@@ -0,0 +1,223 @@
+# tests/test_resilience.py
+import asyncio
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+
+import services.authentik as svc
+from services import resilience as res
+
+
+class _Resp:
+    def __init__(self, code, headers=None):
+        self.status_code = code
+        self.headers = headers or {}
+
+
+def _policy(**kw):
+    return res.RetryPolicy(**{"attempts": 3, "base_delay": 0.1, "max_delay": 2.0, **kw})
+
+
+def test_retry_after_parsing():
+    assert res.retry_after_seconds(_Resp(429, {"retry-after": "3"})) == 3.0
+    future = datetime.now(timezone.utc) + timedelta(seconds=30)
+    got = res.retry_after_seconds(_Resp(503, {"retry-after": format_datetime(future)}))
+    assert got is not None and 25 <= got <= 31
+    assert res.retry_after_seconds(_Resp(503, {"retry-after": "soon"})) is None
+    assert res.retry_after_seconds(object()) is None
+
+
+def test_backoff_is_jittered_and_capped():
+    p = _policy()
+    for attempt in range(10):
+        assert 0 <= p.backoff(attempt) <= min(2.0, 0.1 * 2**attempt)
+    assert _policy(base_delay=0).backoff(3) == 0.0
+
+
+def test_retry_status_classification():
+    p = _policy()
+    assert p.retry_status(_Resp(503), 0, idempotent=True) is not None
+    assert p.retry_status(_Resp(429), 0, idempotent=False) is not None
+    # 5xx on a non-idempotent call may have been applied already
+    assert p.retry_status(_Resp(500), 0, idempotent=False) is None
+    # validation errors are never retried
+    for code in (400, 403, 404, 422):
+        assert p.retry_status(_Resp(code), 0, idempotent=True) is None
+    # attempts exhausted
+    assert p.retry_status(_Resp(503), 3, idempotent=True) is None
+    # Retry-After honoured, but not beyond what we are willing to wait
+    assert p.retry_status(_Resp(429, {"retry-after": "1.5"}), 0, True) == 1.5
+    assert p.retry_status(_Resp(429, {"retry-after": "60"}), 0, True) is None
+
+
+def test_retry_error_classification():
+    p = _policy()
+    req = httpx.Request("POST", "https://ak.test/x")
+    assert p.retry_error(httpx.ConnectError("x", request=req), 0, idempotent=False) is not None
+    assert p.retry_error(httpx.ReadTimeout("x", request=req), 0, idempotent=True) is not None
+    assert p.retry_error(httpx.ReadTimeout("x", request=req), 0, idempotent=False) is None
+    assert p.retry_error(ValueError("x"), 0, idempotent=True) is None
+    assert p.retry_error(httpx.ConnectError("x", request=req), 3, idempotent=True) is None
+
+
+def test_breaker_opens_probes_and_closes():
+    now = [0.0]
+    b = res.CircuitBreaker("ak.test", failure_threshold=2, reset_timeout=10, clock=lambda: now[0])
+    b.before_call()
+    b.record_failure()
+    assert b.state == "closed"
+    b.record_failure()
+    assert b.state == "open"
+    with pytest.raises(res.CircuitOpenError) as ei:
+        b.before_call()
+    assert ei.value.retry_in == pytest.approx(10)
+
+    now[0] = 11
+    assert b.state == "half_open"
+    b.before_call()  # the single probe
+    with pytest.raises(res.CircuitOpenError):
+        b.before_call()  # everyone else still fails fast
+    b.record_failure()  # probe failed -> open again
+    assert b.state == "open"
+
+    now[0] = 22
+    b.before_call()
+    b.record_success()
+    assert b.state == "closed"
+    b.before_call()
+
+
+def test_breaker_registry_is_per_host():
+    assert res.breaker_for("a.test") is res.breaker_for("a.test")
+    assert res.breaker_for("a.test") is not res.breaker_for("b.test")
+    res.reset_breakers()
+    assert res.breaker_for("a.test").state == "closed"
+
+
+def _client(handler):
+    return svc.AsyncAuthentikClient(transport=httpx.MockTransport(handler))
+
+
+def test_async_get_retries_transient_then_succeeds():
+    codes = [503, 429, 200]
+
+    def handler(request):
+        code = codes.pop(0)
+        return httpx.Response(code, json={"pk": 1} if code == 200 else {})
+
+    assert asyncio.run(_client(handler).get_user(1)) == {"pk": 1}
+    assert codes == []
+
+
+def test_async_does_not_retry_validation_errors():
+    calls = []
+
+    def handler(request):
+        calls.append(1)
+        return httpx.Response(400, json={"pk": ["invalid"]})
+
+    with pytest.raises(RuntimeError, match="400"):
+        asyncio.run(_client(handler).get_user(1))
+    assert len(calls) == 1
+
+
+def test_async_invitation_not_resent_after_server_error(monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(1)
+        return httpx.Response(502, json={})
+
+    with pytest.raises(RuntimeError, match="invite create failed 502"):
+        asyncio.run(_client(handler).create_invitation(name="x", flow_slug="f"))
+    assert len(calls) == 1
+
+
+def test_sync_transport_errors_retry_then_raise_and_trip_breaker(monkeypatch):
+    monkeypatch.setattr(svc.settings, "AK_BREAKER_FAILURE_THRESHOLD", 2, raising=False)
+    res.reset_breakers()
+    calls = []
+
+    def handler(request):
+        calls.append(1)
+        raise httpx.ConnectError("refused", request=request)
+
+    c = svc.AuthentikClient(transport=httpx.MockTransport(handler))
+    for _ in range(2):
+        with pytest.raises(httpx.ConnectError):
+            c.get_user(1)
+    assert len(calls) == 2 * (1 + svc.settings.AK_RETRY_ATTEMPTS)
+
+    # circuit is now open: fail fast without touching the transport
+    with pytest.raises(res.CircuitOpenError):
+        c.get_user(1)
+    assert len(calls) == 2 * (1 + svc.settings.AK_RETRY_ATTEMPTS)
+
+
+def _tripped(monkeypatch):
+    """a breaker opened by one failure and due for its half-open probe"""
+    monkeypatch.setattr(svc.settings, "AK_BREAKER_FAILURE_THRESHOLD", 1, raising=False)
+    monkeypatch.setattr(svc.settings, "AK_BREAKER_RESET_SECONDS", 0.0, raising=False)
+    res.reset_breakers()
+    res.breaker_for(svc.aak._breaker().host).record_failure()
+
+
+def _recovering():
+    codes = [503, 200]
+
+    def handler(request):
+        code = codes.pop(0) if codes else 200
+        return httpx.Response(code, json={"pk": 1} if code == 200 else {})
+
+    return handler
+
+
+def test_sync_probe_retries_and_closes_breaker(monkeypatch):
+    _tripped(monkeypatch)
+    c = svc.AuthentikClient(transport=httpx.MockTransport(_recovering()))
+    assert c.get_user(1) == {"pk": 1}
+    assert c._breaker().state == "closed"
+
+
+def test_async_probe_retries_and_closes_breaker(monkeypatch):
+    _tripped(monkeypatch)
+    c = _client(_recovering())
+    assert asyncio.run(c.get_user(1)) == {"pk": 1}
+    assert c._breaker().state == "closed"
+
+
+def test_cancelled_probe_lets_the_next_call_probe(monkeypatch):
+    async def stall(request):
+        await asyncio.sleep(10)
+        return httpx.Response(200, json={})
+
+    async def healthy(request):
+        return httpx.Response(200, json={"pk": 1})
+
+    _tripped(monkeypatch)
+
+    async def run():
+        c = svc.AsyncAuthentikClient(transport=httpx.MockTransport(stall))
+        probe = asyncio.ensure_future(c.get_user(1))
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        c2 = svc.AsyncAuthentikClient(transport=httpx.MockTransport(healthy))
+        return await c2.get_user(2)
+
+    assert asyncio.run(run()) == {"pk": 1}
+    assert res.breaker_for(svc.aak._breaker().host).state == "closed"
+
+
+def test_circuit_open_maps_to_503(monkeypatch, client, as_async):
+    async def _open(*a, **k):
+        raise res.CircuitOpenError("ak.example.test", 4.2)
+
+    monkeypatch.setattr(svc.aak, "list_group_users", _open)
+    r = client.get("/guest-users")
+    assert r.status_code == 503
+    assert r.headers["retry-after"] == "5"
+    assert r.json() == {"detail": "backend unavailable"}
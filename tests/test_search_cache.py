@@ -0,0 +1,114 @@
+# tests/test_search_cache.py
+import asyncio
+
+import httpx
+
+import services.authentik as svc
+from services.search_cache import SearchCache
+
+ROWS = [
+    {"pk": 1, "username": "john", "name": "John Smith", "email": "john@example.test"},
+    {"pk": 2, "username": "johanna", "name": "Johanna Berg", "email": "jb@example.test"},
+    {"pk": 3, "username": "jojo", "name": "Jo Jo", "email": "jojo@corp.test"},
+]
+
+
+def _cache(**kw):
+    now = [0.0]
+    kw = {"maxsize": 4, "ttl": 30.0, **kw}
+    return SearchCache(clock=lambda: now[0], **kw), now
+
+
+def _pks(c, q, limit):
+    rows = c.get(q, limit)
+    assert rows is not None
+    return [r["pk"] for r in rows]
+
+
+def test_exact_hit_until_ttl():
+    c, now = _cache()
+    assert c.get("jo", 25) is None
+    c.put("Jo", ROWS, fetched=100)
+    assert _pks(c, " jo ", 25) == [1, 2, 3]
+    assert _pks(c, "jo", 2) == [1, 2]
+    now[0] = 30.0
+    assert c.get("jo", 25) is None
+
+
+def test_complete_result_answers_longer_queries():
+    c, _ = _cache()
+    c.put("jo", ROWS, fetched=100)
+    assert _pks(c, "joh", 25) == [1, 2]
+    assert _pks(c, "john", 25) == [1]
+    assert _pks(c, "jo smith", 25) == [1]
+    assert c.get("corp", 25) is None  # "jo" is not inside "corp"
+
+
+def test_truncated_result_is_not_reused_for_narrower_queries():
+    c, _ = _cache()
+    c.put("jo", ROWS, fetched=3)  # authentik may have had more
+    assert c.get("joh", 25) is None
+    assert _pks(c, "jo", 3) == [1, 2, 3]
+    assert c.get("jo", 25) is None
+
+
+def test_size_bound_and_disabled():
+    c, _ = _cache(maxsize=2)
+    for q in ("a", "b", "c"):
+        c.put(q, [], fetched=100)
+    assert len(c) == 2 and c.get("a", 5) is None
+    off, _ = _cache(maxsize=0)
+    off.put("jo", ROWS, fetched=100)
+    assert off.get("jo", 5) is None and off.fetch_size(10) == 10
+
+
+def _search_client(calls, delay=0.0):
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(dict(request.url.params))
+        await asyncio.sleep(delay)
+        q = request.url.params["search"].lower()
+        hits = [r for r in ROWS if any(q in str(v).lower() for v in r.values())]
+        return httpx.Response(200, json={"results": hits})
+
+    return svc.AsyncAuthentikClient(transport=httpx.MockTransport(handler))
+
+
+def test_typing_a_name_costs_one_upstream_search():
+    calls = []
+    c = _search_client(calls)
+
+    async def _type():
+        return [await c.search_users(q, limit=10) for q in ("jo", "joh", "john", "johan")]
+
+    results = asyncio.run(_type())
+    assert [u["pk"] for u in results[2]["users"]] == [1]
+    assert [u["pk"] for u in results[3]["users"]] == [2]
+    assert results[3]["query"] == "johan"
+    assert len(calls) == 1 and calls[0]["page_size"] == "100"
+
+
+def test_identical_queries_in_flight_share_one_call():
+    calls = []
+    c = _search_client(calls, delay=0.01)
+
+    async def _burst():
+        return await asyncio.gather(*(c.search_users("jojo", limit=5) for _ in range(5)))
+
+    results = asyncio.run(_burst())
+    assert len(calls) == 1
+    assert all(r["users"] == results[0]["users"] for r in results)
+    assert c._searches == {}
+
+
+def test_sync_client_uses_the_cache(monkeypatch):
+    calls = []
+
+    def _fake_get(self, path, _op="search", **params):
+        calls.append(params)
+        return {"results": ROWS[:2]}
+
+    monkeypatch.setattr(svc.AuthentikClient, "_get", _fake_get, raising=True)
+    client = svc.AuthentikClient()
+    client.search_users("joh")
+    out = client.search_users("johanna")
+    assert [u["pk"] for u in out["users"]] == [2] and len(calls) == 1
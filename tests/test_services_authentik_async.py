@@ -0,0 +1,282 @@
+# tests/test_services_authentik_async.py
+# unit tests for AsyncAuthentikClient over an in-memory httpx transport
+
+import asyncio
+import json
+import re
+
+import httpx
+import pytest
+
+import services.authentik as svc
+
+
+def _handler(request: httpx.Request) -> httpx.Response:
+    path = request.url.path
+    params = dict(request.url.params)
+
+    if request.method == "GET" and re.search(r"/core/groups/[^/]+/$", path):
+        if "legacy" in path:
+            return httpx.Response(200, json={"name": "Legacy", "users": [3, 404, 1]})
+        if params.get("include_users") != "true":
+            return httpx.Response(200, json={"name": "Guests"})
+        return httpx.Response(
+            200,
+            json={
+                "name": "Guests",
+                "users_obj": [
+                    {"pk": 2, "username": "beta", "email": "b@example.test"},
+                    {"pk": 1, "username": "alpha", "email": "a@example.test"},
+                ],
+            },
+        )
+    if request.method == "GET" and re.search(r"/core/users/(\d+)/$", path):
+        pk = int(path.rstrip("/").rsplit("/", 1)[1])
+        if pk == 404:
+            return httpx.Response(404, json={"detail": "not found"})
+        return httpx.Response(200, json={"pk": pk, "username": f"u{pk}", "email": f"{pk}@x"})
+    if request.method == "GET" and path.endswith("/core/users/") and "groups_by_pk" in params:
+        if params["groups_by_pk"] == "legacy":
+            # older authentik: the paged filter is rejected -> include_users fallback
+            return httpx.Response(400, json={"groups_by_pk": ["unknown"]})
+        page, size = int(params["page"]), int(params["page_size"])
+        members = [{"pk": pk, "username": f"m{pk}", "email": f"m{pk}@x"} for pk in range(1, 6)]
+        chunk = members[(page - 1) * size : page * size]
+        nxt = page + 1 if page * size < len(members) else 0
+        return httpx.Response(
+            200, json={"pagination": {"next": nxt, "count": len(members)}, "results": chunk}
+        )
+    if request.method == "GET" and path.endswith("/core/users/"):
+        return httpx.Response(
+            200,
+            json={"results": [{"pk": 9, "username": "neo", "name": "Neo"}], "q": params},
+        )
+    if request.method == "GET" and "/core/brands/" in path:
+        return httpx.Response(
+            200,
+            json={"branding_title": "Fairies", "domain": "f.test", "branding_logo": "/l.png"},
+        )
+    if request.method == "POST" and re.search(r"/(add_user|remove_user)/$", path):
+        code = 500 if "broken" in path else 204
+        return httpx.Response(code)
+    if request.method == "POST" and path.endswith("/stages/invitation/invitations/"):
+        body = json.loads(request.content)
+        return httpx.Response(201, json={"pk": "tok", "name": body["name"]})
+    return httpx.Response(404, json={"detail": "not found"})
+
+
+def _client() -> svc.AsyncAuthentikClient:
+    return svc.AsyncAuthentikClient(transport=httpx.MockTransport(_handler))
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_async_list_group_users_pages_through_members(monkeypatch):
+    monkeypatch.setattr(svc.settings, "AK_GROUP_PAGE_SIZE", 2, raising=False)
+    out = _run(_client().list_group_users("guests"))
+    assert out["group_name"] == "Guests"
+    assert [u["pk"] for u in out["users"]] == [1, 2, 3, 4, 5]
+    assert set(out["users"][0]) == {"pk", "username", "email"}
+
+
+def test_async_iter_group_users_streams_pages():
+    pages = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        pages.append(int(request.url.params["page"]))
+        assert request.url.params["include_groups"] == "false"
+        return _handler(request)
+
+    async def _first_two():
+        c = svc.AsyncAuthentikClient(transport=httpx.MockTransport(handler))
+        out = []
+        async for u in c.aiter_group_users("guests", page_size=2):
+            out.append(u["pk"])
+            if len(out) == 2:
+                break
+        return out
+
+    # stopping early never requests later pages
+    assert _run(_first_two()) == [1, 2]
+    assert pages == [1]
+
+
+def test_async_list_group_users_embedded_mode(monkeypatch):
+    monkeypatch.setattr(svc.settings, "AK_GROUP_LISTING", "include_users", raising=False)
+    out = _run(_client().list_group_users("guests"))
+    assert [u["username"] for u in out["users"]] == ["alpha", "beta"]
+
+
+def test_async_list_group_users_legacy_shape():
+    out = _run(_client().list_group_users("legacy"))
+    assert [u["username"] for u in out["users"]] == ["u1", "u3"]
+    # the missing member is reported, not silently dropped
+    assert [f["pk"] for f in out["failed"]] == [404]
+    assert "404" in out["failed"][0]["error"]
+
+
+def test_async_get_users_fans_out_with_a_bound():
+    state = {"now": 0, "peak": 0}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        state["now"] += 1
+        state["peak"] = max(state["peak"], state["now"])
+        await asyncio.sleep(0.005)
+        state["now"] -= 1
+        return _handler(request)
+
+    c = svc.AsyncAuthentikClient(transport=httpx.MockTransport(handler))
+    users, failed = _run(c.get_users(range(1, 13), concurrency=4))
+    assert [u["pk"] for u in users] == list(range(1, 13))
+    assert failed == []
+    assert 1 < state["peak"] <= 4
+    assert _run(c.get_users([])) == ([], [])
+
+
+def test_async_get_user_and_errors():
+    c = _client()
+    assert _run(c.get_user(7))["email"] == "7@x"
+    with pytest.raises(RuntimeError, match="404"):
+        _run(c.get_user(404))
+
+
+def test_async_switch_ok_and_failure():
+    c = _client()
+    ok = _run(c.switch_group_user_pk("src", "dst", 1))
+    assert ok == {"add": 204, "remove": 204, "outcome": "complete"}
+    with pytest.raises(svc.SwitchError, match="switch failed") as ei:
+        _run(c.switch_group_user_pk("broken", "dst", 1))
+    # remove from "broken" failed, so the add to dst was undone
+    assert ei.value.outcome == "rolled_back"
+    with pytest.raises(svc.SwitchError) as ei:
+        _run(c.switch_group_user_pk("broken", "broken-too", 1))
+    assert ei.value.outcome == "failed"
+
+
+def test_async_switch_issues_both_halves_concurrently():
+    state = {"now": 0, "peak": 0}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        state["now"] += 1
+        state["peak"] = max(state["peak"], state["now"])
+        await asyncio.sleep(0.01)
+        state["now"] -= 1
+        return httpx.Response(204)
+
+    c = svc.AsyncAuthentikClient(transport=httpx.MockTransport(handler))
+    assert _run(c.switch_group_user_pk("src", "dst", 1))["outcome"] == "complete"
+    assert state["peak"] == 2
+
+
+def test_async_switch_compensates_and_reports_partial():
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.url.path.split("/core/groups/")[1])
+        if request.url.path.endswith("/src/add_user/"):
+            return httpx.Response(400, json={"detail": "no"})  # the undo fails too
+        if request.url.path.endswith("/dst/add_user/"):
+            return httpx.Response(400, json={"detail": "no"})
+        return httpx.Response(204)
+
+    c = svc.AsyncAuthentikClient(transport=httpx.MockTransport(handler))
+    with pytest.raises(svc.SwitchError) as ei:
+        _run(c.switch_group_user_pk("src", "dst", 1))
+    # the remove landed alone; re-adding to src was attempted and failed
+    assert ei.value.outcome == "partial"
+    assert "rollback=400" in str(ei.value)
+    assert sorted(seen) == ["dst/add_user/", "src/add_user/", "src/remove_user/"]
+
+
+def test_async_switch_reraises_transport_errors_when_nothing_landed():
+    def handler(request: httpx.Request) -> httpx.Response:
+        raise httpx.ConnectError("refused", request=request)
+
+    c = svc.AsyncAuthentikClient(transport=httpx.MockTransport(handler))
+    with pytest.raises(httpx.ConnectError):
+        _run(c.switch_group_user_pk("src", "dst", 1))
+
+
+def test_async_create_invitation_and_search_and_brand():
+    c = _client()
+    inv = _run(c.create_invitation(name="Ada L", flow_slug="enroll"))
+    assert inv["name"] == "ada-l"
+    assert inv["invite_url"].endswith("/if/flow/enroll/?itoken=tok")
+    assert inv["expires_friendly"]
+
+    found = _run(c.search_users("neo", limit=500))
+    assert found["users"][0]["name"] == "Neo"
+
+    brand = _run(c.brand_info("b"))
+    assert brand["brand_name"] == "Fairies"
+    assert brand["brand_logo"].endswith("/l.png")
+
+
+def test_async_session_is_reused_and_closed():
+    async def _go():
+        c = _client()
+        s1 = c._get_session()
+        assert c._get_session() is s1
+        assert s1.headers["authorization"].startswith("Bearer ")
+        await c.aclose()
+        assert c._session is None
+
+    _run(_go())
+
+
+def test_async_timeouts_follow_operation_class(monkeypatch):
+    seen = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        key = request.method + " " + request.url.path
+        if "groups_by_pk" in request.url.params:
+            key += " paged"
+        seen[key] = request.extensions["timeout"]
+        if request.method == "POST":
+            return httpx.Response(204)
+        return httpx.Response(200, json={"name": "G", "results": []})
+
+    monkeypatch.setattr(svc.settings, "AK_HTTP_LIST_TIMEOUT", 61.0, raising=False)
+    monkeypatch.setattr(svc.settings, "AK_HTTP_MUTATION_TIMEOUT", 16.0, raising=False)
+    monkeypatch.setattr(svc.settings, "AK_HTTP_SEARCH_TIMEOUT", 4.0, raising=False)
+    c = svc.AsyncAuthentikClient(transport=httpx.MockTransport(handler))
+    _run(c.list_group_users("g"))
+    _run(c.search_users("x"))
+    _run(c.switch_group_user_pk("a", "b", 1))
+
+    reads = {k: v["read"] for k, v in seen.items()}
+    assert reads["GET /api/v3/core/users/ paged"] == 61.0
+    assert reads["GET /api/v3/core/users/"] == 4.0
+    assert reads["POST /api/v3/core/groups/b/add_user/"] == 16.0
+    assert all(v["connect"] == svc.settings.AK_HTTP_CONNECT_TIMEOUT for v in seen.values())
+
+
+def test_async_warm_up_counts_successes():
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        if len(calls) == 1:
+            raise httpx.ConnectError("refused")
+        return httpx.Response(200, json={})
+
+    c = svc.AsyncAuthentikClient(transport=httpx.MockTransport(handler))
+    assert _run(c.warm_up(3)) == 2
+    assert calls == ["/api/v3/root/config/"] * 3
+    assert _run(c.warm_up(0)) == 0
+
+
+def test_session_kwargs_pool_limits_and_http2_fallback(monkeypatch):
+    import importlib.util
+
+    monkeypatch.setattr(svc.settings, "AK_HTTP_MAX_CONNECTIONS", 7, raising=False)
+    monkeypatch.setattr(svc.settings, "AK_HTTP2", True, raising=False)
+    monkeypatch.setattr(importlib.util, "find_spec", lambda name: None)
+    kw = svc.AsyncAuthentikClient()._session_kwargs()
+    assert kw["limits"].max_connections == 7
+    assert kw["http2"] is False
+
+    monkeypatch.setattr(svc.settings, "AK_HTTP2", False, raising=False)
+    assert svc.AuthentikClient()._session_kwargs()["http2"] is False
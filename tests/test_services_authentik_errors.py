@@ -58,6 +58,8 @@ def test_create_invitation_missing_flow_slug(monkeypatch):
 
 def test_list_group_users_legacy_users_field(monkeypatch):
     # legacy shape: users list of pks -> get_user is called
+    monkeypatch.setattr(svc.settings, "AK_GROUP_LISTING", "include_users", raising=False)
+
     def _fake_get(self, path, **params):
         if path.startswith("/core/groups/"):
             return {"name": "Guests", "users": [1]}
@@ -73,6 +75,20 @@ def test_list_group_users_legacy_users_field(monkeypatch):
     out = svc.AuthentikClient().list_group_users("uuid")
     assert out["group_name"] == "Guests"
     assert out["users"][0]["pk"] == 1
+    assert "failed" not in out
+
+
+def test_get_users_keeps_order_and_reports_failures(monkeypatch):
+    def _fake_get_user(self, pk):
+        if pk == 2:
+            raise RuntimeError("GET /core/users/2/ -> 500: boom")
+        return {"pk": pk, "email": "e", "username": f"u{pk}"}
+
+    monkeypatch.setattr(svc.AuthentikClient, "get_user", _fake_get_user, raising=True)
+    users, failed = svc.AuthentikClient().get_users([3, 2, 1], concurrency=2)
+    assert [u["pk"] for u in users] == [3, 1]
+    assert failed == [{"pk": 2, "error": "GET /core/users/2/ -> 500: boom"}]
+    assert svc.AuthentikClient().get_users([]) == ([], [])
 
 
 def test_time_helpers_are_sane():
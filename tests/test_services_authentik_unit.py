@@ -106,11 +106,11 @@ def _monkeypatch_transport(monkeypatch):
         def __init__(self):
             self.headers = {}
 
-        def get(self, url, params=None):
+        def get(self, url, params=None, timeout=None):
             code, payload = _fake_requests_responder("GET", url, params=params or {})
             return FakeResp(status_code=code, json_data=payload)
 
-        def post(self, url, json=None):
+        def post(self, url, json=None, timeout=None):
             code, payload = _fake_requests_responder("POST", url, json=json or {})
             return FakeResp(status_code=code, json_data=payload)
 
@@ -122,6 +122,7 @@ def _monkeypatch_transport(monkeypatch):
 
 def test_list_group_users(monkeypatch):
     _monkeypatch_transport(monkeypatch)
+    monkeypatch.setattr(svc.settings, "AK_GROUP_LISTING", "include_users", raising=False)
     out = svc.ak.list_group_users("uuid-guests")
     assert out["group_name"] == "Guests"
     assert isinstance(out["users"], list) and out["users"]
@@ -145,6 +146,21 @@ def test_switch_group_user_pk_add_and_remove(monkeypatch):
     assert res_add.get("status") == "ok" or "add" in res_add or "remove" in res_add
 
 
+def test_sync_switches_share_one_pool_until_close():
+    import httpx
+
+    c = svc.AuthentikClient(transport=httpx.MockTransport(lambda r: httpx.Response(204)))
+    c.switch_group_user_pk("src", "dst", 1)
+    pool = c._pool
+    c.switch_group_user_pk("src", "dst", 2)
+    assert pool is not None and c._pool is pool
+    # a lookup burst goes through the same pool, bounded by its limit
+    assert c._gather([c._lookup_flow(pk) for pk in (3, 4, 5)], 2)[0][0] == 3
+    assert c._pool is pool
+    c.close()
+    assert c._pool is None and pool._shutdown
+
+
 def test_create_invitation(monkeypatch):
     _monkeypatch_transport(monkeypatch)
     out = svc.ak.create_invitation(
@@ -172,10 +188,10 @@ def test_create_invitation_uses_slug(monkeypatch):
         def __init__(self):
             self.headers = {}
 
-        def get(self, url, params=None):
+        def get(self, url, params=None, timeout=None):
             return FakeResp(status_code=200, json_data={})
 
-        def post(self, url, json=None):
+        def post(self, url, json=None, timeout=None):
             recorded['url'] = url
             recorded['json'] = json or {}
             return FakeResp(status_code=201, json_data={"pk": "abc123", "expires": "2030-01-01T00:00:00Z"})
@@ -191,3 +207,20 @@ def test_create_invitation_uses_slug(monkeypatch):
     assert recorded.get('json', {}).get('name') == 'john-smith'
     assert recorded.get('json', {}).get('fixed_data', {}).get('name') == 'John Smith'
     assert "invite_url" in out and out["invite_url"].startswith("https://")
+
+
+def test_iter_group_users_without_pagination_envelope(monkeypatch):
+    # pages keep coming while they are full; a short page ends the walk
+    seen = []
+
+    def _fake_get(self, path, _op="search", **params):
+        assert path == "/core/users/" and _op == "list"
+        seen.append(params["page"])
+        start = (params["page"] - 1) * params["page_size"] + 1
+        pks = range(start, min(start + params["page_size"], 6))
+        return {"results": [{"pk": pk, "username": f"u{pk}"} for pk in pks]}
+
+    monkeypatch.setattr(svc.AuthentikClient, "_get", _fake_get, raising=True)
+    out = list(svc.AuthentikClient().iter_group_users("g", page_size=2))
+    assert [u["pk"] for u in out] == [1, 2, 3, 4, 5]
+    assert seen == [1, 2, 3]
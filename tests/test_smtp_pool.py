@@ -0,0 +1,123 @@
+# tests/test_smtp_pool.py
+import smtplib
+
+import pytest
+
+import tools.mailer as mail
+
+
+class FakeServer:
+    """records connections; individual sessions can be told to misbehave"""
+
+    def __init__(self):
+        self.connections = []
+        self.sent = []
+        self.refuse = set()
+        self.drop_next_send = False
+        self.noop_code = 250
+        self.down = False
+
+    def factory(self):
+        server = self
+
+        class Conn:
+            def __init__(self, host, port, timeout=30):
+                if server.down:
+                    raise ConnectionRefusedError("down")
+                server.connections.append(self)
+                self.logins = 0
+                self.closed = False
+
+            def ehlo(self):
+                pass
+
+            def starttls(self):
+                pass
+
+            def login(self, user, pwd):
+                self.logins += 1
+
+            def noop(self):
+                return (server.noop_code, b"ok")
+
+            def sendmail(self, from_addr, rcpts, msg):
+                if server.drop_next_send:
+                    server.drop_next_send = False
+                    raise smtplib.SMTPServerDisconnected("gone")
+                if rcpts[0] in server.refuse:
+                    raise smtplib.SMTPRecipientsRefused({rcpts[0]: (550, b"no")})
+                server.sent.append((self, rcpts[0]))
+
+            def quit(self):
+                self.closed = True
+
+        return Conn
+
+
+@pytest.fixture
+def server(monkeypatch):
+    srv = FakeServer()
+    monkeypatch.setattr(mail.settings, "SMTP_PORT", 587, raising=False)
+    monkeypatch.setattr(mail.smtplib, "SMTP", srv.factory(), raising=True)
+    mail.smtp_pool.close_all()
+    yield srv
+    mail.smtp_pool.close_all()
+
+
+def _msgs(n, prefix="u"):
+    return [(f"{prefix}{i}@example.test", "hi", "<p>hi</p>") for i in range(n)]
+
+
+def test_one_session_serves_many_messages(server):
+    assert mail.send_many(_msgs(5)) == [True] * 5
+    for to, subject, html in _msgs(3, "single"):
+        assert mail._send_html(to, subject, html) is True
+    assert len(server.connections) == 1
+    assert server.connections[0].logins == 1
+    assert len(server.sent) == 8
+
+
+def test_sessions_rotate_after_max_messages(server, monkeypatch):
+    monkeypatch.setattr(mail.settings, "SMTP_SESSION_MAX_MESSAGES", 2, raising=False)
+    assert all(mail.send_many(_msgs(5)))
+    assert len(server.connections) == 3
+    assert all(c.closed for c in server.connections[:2])
+
+
+def test_idle_sessions_expire(server, monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(mail.smtp_pool, "_clock", lambda: now[0])
+    mail._send_html("a@example.test", "s", "b")
+    now[0] = mail.settings.SMTP_SESSION_MAX_IDLE + 1
+    mail._send_html("b@example.test", "s", "b")
+    assert len(server.connections) == 2
+    assert server.connections[0].closed
+
+
+def test_dead_sessions_are_replaced(server):
+    mail._send_html("a@example.test", "s", "b")
+    server.noop_code = 421  # NOOP fails -> new connection before sending
+    mail._send_html("b@example.test", "s", "b")
+    server.noop_code = 250
+    server.drop_next_send = True  # passes NOOP but drops on send -> one reconnect
+    assert mail._send_html("c@example.test", "s", "b") is True
+    assert len(server.connections) == 3
+    assert [to for _, to in server.sent] == ["a@example.test", "b@example.test", "c@example.test"]
+
+
+def test_refused_recipient_fails_only_that_message(server):
+    server.refuse.add("u1@example.test")
+    assert mail.send_many(_msgs(3)) == [True, False, True]
+    assert len(server.connections) == 1
+
+
+def test_unreachable_server_fails_batch_without_reconnect_storm(server):
+    server.down = True
+    assert mail.send_many(_msgs(4)) == [False] * 4
+    with pytest.raises(ConnectionRefusedError):
+        mail._send_html("a@example.test", "s", "b", raise_on_error=True)
+
+
+def test_send_many_not_configured(monkeypatch):
+    monkeypatch.setattr(mail.settings, "SMTP_HOST", "", raising=False)
+    assert mail.send_many(_msgs(2)) == [False, False]
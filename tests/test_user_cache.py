@@ -0,0 +1,123 @@
+# tests/test_user_cache.py
+import asyncio
+
+import httpx
+import pytest
+
+import services.authentik as svc
+from services.user_cache import UserCache
+
+
+def _cache(**kw):
+    now = [0.0]
+    kw = {"maxsize": 3, "ttl": 60.0, "negative_ttl": 5.0, **kw}
+    return UserCache(clock=lambda: now[0], **kw), now
+
+
+def test_full_records_hit_until_ttl():
+    c, now = _cache()
+    assert c.get(1) == (False, None)
+    c.put(1, {"pk": 1, "email": "a@x", "is_active": True})
+    assert c.get(1) == (True, {"pk": 1, "email": "a@x", "is_active": True})
+    now[0] = 60.0
+    assert c.get(1) == (False, None)
+
+
+def test_lru_evicts_least_recently_used():
+    c, _ = _cache()
+    for pk in (1, 2, 3):
+        c.put(pk, {"pk": pk})
+    c.get(1)  # touch 1 so 2 is now the oldest
+    c.put(4, {"pk": 4})
+    assert len(c) == 3
+    assert c.get(2) == (False, None)
+    assert c.get(1)[0] and c.get(4)[0]
+
+
+def test_negative_entries_expire_sooner():
+    c, now = _cache()
+    c.put_missing(9)
+    assert c.get(9) == (True, None)
+    now[0] = 5.0
+    assert c.get(9) == (False, None)
+
+
+def test_remembered_rows_are_partial_and_merge():
+    c, _ = _cache()
+    c.remember([{"pk": 1, "username": "a", "name": "Ada", "email": "a@x", "groups": ["g"]}])
+    # a plain get wants a full record
+    assert c.get(1) == (False, None)
+    assert c.get(1, partial_ok=True) == (
+        True,
+        {"pk": 1, "username": "a", "name": "Ada", "email": "a@x"},
+    )
+    # a slimmer row later does not lose the name
+    c.remember([{"pk": 1, "username": "a", "email": "a2@x"}])
+    row = c.get(1, partial_ok=True)[1]
+    assert row is not None
+    assert row["name"] == "Ada"
+    assert row["email"] == "a2@x"
+    # and never replaces a full record
+    c.put(2, {"pk": 2, "email": "full@x", "is_active": True})
+    c.remember([{"pk": 2, "email": "row@x"}, {"username": "no-pk"}])
+    full = c.get(2)[1]
+    assert full is not None and full["email"] == "full@x"
+
+
+def test_disabled_cache_stores_nothing():
+    c, _ = _cache(maxsize=0)
+    c.put(1, {"pk": 1})
+    c.remember([{"pk": 2, "email": "b@x"}])
+    assert len(c) == 0
+
+
+def _counting_client(calls):
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        path = request.url.path
+        if path.endswith("/core/users/404/"):
+            return httpx.Response(404, json={"detail": "not found"})
+        if "groups_by_pk" in request.url.params:
+            results = [{"pk": 1, "username": "ada", "name": "Ada L", "email": "ada@x"}]
+            return httpx.Response(200, json={"pagination": {"next": 0}, "results": results})
+        if path.endswith("/core/users/"):
+            results = [{"pk": 2, "username": "bob", "name": "Bob", "email": "bob@x"}]
+            return httpx.Response(200, json={"results": results})
+        if "/core/users/" in path:
+            pk = int(path.rstrip("/").rsplit("/", 1)[1])
+            return httpx.Response(200, json={"pk": pk, "email": f"{pk}@x", "is_active": True})
+        return httpx.Response(200, json={"name": "Guests"})
+
+    return svc.AsyncAuthentikClient(transport=httpx.MockTransport(handler))
+
+
+def test_mail_lookup_is_served_from_listing_and_search():
+    calls = []
+
+    async def _go():
+        c = _counting_client(calls)
+        await c.list_group_users("guests")
+        await c.search_users("bob")
+        before = len(calls)
+        ada = await c.get_user(1, partial_ok=True)
+        bob = await c.get_user(2, partial_ok=True)
+        assert len(calls) == before
+        # callers that need the whole record still go to authentik, once
+        full = await c.get_user(1)
+        again = await c.get_user(1)
+        return ada, bob, full, again, len(calls) - before
+
+    ada, bob, full, again, extra = asyncio.run(_go())
+    assert ada == {"pk": 1, "username": "ada", "name": "Ada L", "email": "ada@x"}
+    assert bob["name"] == "Bob"
+    assert full == again and full["is_active"] is True
+    assert extra == 1
+
+
+def test_404_is_cached_briefly():
+    calls = []
+    c = _counting_client(calls)
+    for _ in range(3):
+        with pytest.raises(svc.AuthentikNotFound, match="404"):
+            asyncio.run(c.get_user(404))
+    assert calls.count("/api/v3/core/users/404/") == 1
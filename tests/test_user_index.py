@@ -0,0 +1,153 @@
+# tests/test_user_index.py
+import asyncio
+
+import httpx
+
+import services.authentik as svc
+import services.user_index as user_index_mod
+from services.user_index import UserIndex, sync_full, sync_incremental
+
+PEOPLE = [
+    {"pk": 1, "username": "john", "name": "John Smith", "email": "john@example.test"},
+    {"pk": 2, "username": "johnny.b", "name": "Johnny Bravo", "email": "jb@example.test"},
+    {"pk": 3, "username": "zoe", "name": "Zoë Saldaña", "email": "zoe@corp.test"},
+    {"pk": 4, "username": "asmith", "name": "Alice Smith", "email": "alice.smith@example.test"},
+    {"pk": 5, "username": "margaret", "name": "Margaret Hamilton", "email": "mh@nasa.test"},
+]
+
+
+def _index(rows=PEOPLE):
+    idx = UserIndex()
+    idx.replace(rows)
+    return idx
+
+
+def _pks(rows):
+    return [r["pk"] for r in rows]
+
+
+def test_cold_index_answers_none():
+    assert UserIndex().search("john") is None
+
+
+def test_prefix_search_over_fields_with_ranking():
+    idx = _index()
+    # exact username first, then the longer username that starts with the query
+    assert _pks(idx.search("john")) == [1, 2]
+    assert _pks(idx.search("smi")) == [1, 4]
+    assert _pks(idx.search("alice.sm")) == [4]
+    assert _pks(idx.search("corp.test")) == [3]
+    hit = idx.search("JOHN")
+    assert hit is not None
+    assert hit[0] == {
+        "pk": 1,
+        "username": "john",
+        "email": "john@example.test",
+        "name": "John Smith",
+    }
+
+
+def test_accents_words_and_limit():
+    idx = _index()
+    assert _pks(idx.search("zoe sal")) == [3]
+    assert _pks(idx.search("saldana")) == [3]
+    assert _pks(idx.search("smith alice")) == [4]
+    assert _pks(idx.search("jo", limit=1)) == [1]
+    assert idx.search("   ") == []
+
+
+def test_one_typo_is_tolerated():
+    idx = _index()
+    assert _pks(idx.search("margret")) == [5]  # missing letter
+    assert _pks(idx.search("hamliton")) == [5]  # transposed
+    assert idx.search("xyzzy") == []
+
+
+def test_substrings_match_after_prefixes_and_before_typos():
+    idx = _index()
+    idx.upsert([{"pk": 6, "username": "sonia", "name": "Sonia", "email": "s@example.test"}])
+    idx.upsert([{"pk": 7, "username": "bjohnson", "name": "B Johnson", "email": "b@x.test"}])
+    # upstream search is a substring match; "son" still finds johnson, after the prefix hit
+    assert _pks(idx.search("son")) == [6, 7]
+    assert _pks(idx.search("ohn")) == [1, 7, 2]
+    assert _pks(idx.search("milton")) == [5]
+    assert _pks(idx.search("aldan zoe")) == [3]
+
+
+def test_upsert_and_remove_update_tokens():
+    idx = _index()
+    idx.upsert([{"pk": 1, "username": "jsmith", "name": "Jon Smith", "email": "j@example.test"}])
+    # "jon" is still one typo away from "john", so pk 1 only trails as a fuzzy hit
+    assert _pks(idx.search("john")) == [2, 1]
+    assert _pks(idx.search("jsm")) == [1]
+    idx.upsert([{"pk": 9, "username": "newbie", "name": "New Bie", "email": "n@example.test"}])
+    assert _pks(idx.search("newb")) == [9]
+    idx.remove([9])
+    assert idx.search("newb") == []
+    assert len(idx) == 5
+
+
+def _directory(rows, calls):
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(dict(request.url.params))
+        params = request.url.params
+        if params.get("search"):
+            return httpx.Response(200, json={"results": []})
+        data = list(rows)
+        if params.get("ordering") == "-last_updated":
+            # ignores last_updated__gt like an older authentik would
+            data.sort(key=lambda u: u["last_updated"], reverse=True)
+        size, page = int(params["page_size"]), int(params["page"])
+        chunk = data[(page - 1) * size : page * size]
+        nxt = page + 1 if page * size < len(data) else 0
+        return httpx.Response(200, json={"pagination": {"next": nxt}, "results": chunk})
+
+    return svc.AsyncAuthentikClient(transport=httpx.MockTransport(handler))
+
+
+def test_full_then_incremental_sync(monkeypatch):
+    monkeypatch.setattr(svc.settings, "AK_GROUP_PAGE_SIZE", 2, raising=False)
+    rows = [dict(u, last_updated=f"2026-01-0{u['pk']}T00:00:00Z") for u in PEOPLE]
+    calls = []
+    client = _directory(rows, calls)
+    idx = UserIndex()
+
+    monkeypatch.setattr(user_index_mod, "_SYNC_BATCH", 2)
+    batches = []
+    add = user_index_mod._Build.add
+
+    def counted(build, users):
+        batches.append(len(users))
+        add(build, users)
+
+    monkeypatch.setattr(user_index_mod._Build, "add", counted)
+
+    assert asyncio.run(sync_full(client, idx)) == 5
+    assert len(calls) == 3 and idx.watermark == "2026-01-05T00:00:00Z"
+    # reduced to rows as it pages, not held as one list
+    assert batches == [2, 2, 1]
+
+    rows[0] = dict(rows[0], username="johnathan", last_updated="2026-02-01T00:00:00Z")
+    calls.clear()
+    assert asyncio.run(sync_incremental(client, idx)) == 1
+    # newest first; stopped on the first unchanged row instead of paging everything
+    assert len(calls) == 1 and calls[0]["last_updated__gt"] == "2026-01-05T00:00:00Z"
+    hit = idx.search("johnat")
+    assert hit is not None and hit[0]["pk"] == 1
+    assert idx.watermark == "2026-02-01T00:00:00Z"
+
+
+def test_search_users_uses_warm_index(monkeypatch):
+    calls = []
+    client = _directory([dict(u, last_updated="") for u in PEOPLE], calls)
+    monkeypatch.setattr(user_index_mod, "user_index", UserIndex())
+
+    cold = asyncio.run(client.search_users("john"))
+    assert cold == {"query": "john", "users": []} and calls[-1]["search"] == "john"
+
+    asyncio.run(sync_full(client, user_index_mod.user_index))
+    calls.clear()
+    warm = asyncio.run(client.search_users("john"))
+    assert _pks(warm["users"]) == [1, 2] and calls == []
+    # no last_updated on the rows: incremental sync waits for the next full one
+    assert asyncio.run(sync_incremental(client, user_index_mod.user_index)) == 0 and calls == []
@@ -1,5 +1,5 @@
 # tests/test_users.py
-def test_guest_and_member_lists(monkeypatch, client):
+def test_guest_and_member_lists(monkeypatch, client, as_async):
     import services.authentik as svc
 
     def fake_list_group_users(*args, **kwargs):
@@ -20,7 +20,7 @@ def test_guest_and_member_lists(monkeypatch, client):
             ],
         }
 
-    monkeypatch.setattr(svc.ak, "list_group_users", fake_list_group_users)
+    monkeypatch.setattr(svc.aak, "list_group_users", as_async(fake_list_group_users))
 
     r1 = client.get("/guest-users", follow_redirects=False)
     if r1.status_code in (302, 303):
@@ -41,7 +41,7 @@ def test_guest_and_member_lists(monkeypatch, client):
     assert len(j2["users"]) == 2
 
 
-def test_search_users(monkeypatch, client):
+def test_search_users(monkeypatch, client, as_async):
     import services.authentik as svc
 
     def fake_search(*args, **kwargs):
@@ -68,7 +68,7 @@ def test_search_users(monkeypatch, client):
                 q = ""
         return {"query": q, "users": [{"pk": 9, "username": "neo", "email": "n@example.test"}]}
 
-    monkeypatch.setattr(svc.ak, "search_users", fake_search)
+    monkeypatch.setattr(svc.aak, "search_users", as_async(fake_search))
 
     r = client.get("/search-users?q=neo&limit=5", follow_redirects=False)
     if r.status_code in (302, 303):
@@ -2,18 +2,38 @@
 # tools/cli.py  CLI wrapper
 # Pretty tables by default; --json for raw output.
 # Sends emails on "invites create" (if email provided) and, optionally, "membership promote" (if user has email).
+# Startup stays cheap: commands import settings, the Authentik client and the mailer
+# only when they run (tests/test_cli_startup.py holds the budget).
 
 from __future__ import annotations
 
 import argparse
+import csv
 import json
 import os
 import shutil
-import subprocess
 import sys
-from typing import Any, Iterable, Mapping, Sequence
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Mapping, Sequence, TextIO
 
-from tools import mailer
+if TYPE_CHECKING:
+    from types import ModuleType
+
+
+def __getattr__(name: str) -> Any:
+    # `cli.mailer` still works for callers and tests; it is loaded on first access
+    if name == "mailer":
+        return _mailer()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _mailer() -> "ModuleType":
+    # tools.mailer brings in jinja2, fastapi and the brand lookup; a patched cli.mailer wins
+    patched = globals().get("mailer")
+    if patched is not None:
+        return patched
+    from tools import mailer
+
+    return mailer
 
 
 def _settings():
@@ -100,6 +120,8 @@ def _maybe_page(num_rows: int) -> bool:
     less = shutil.which("less")
     if not less:
         return False
+    import subprocess
+
     try:
         p = subprocess.Popen([less, "-R"], stdin=subprocess.PIPE)
         sys.stdout = p.stdin if p.stdin else sys.stdout  # type: ignore[assignment]
@@ -147,18 +169,22 @@ def cmd_users_get(args: argparse.Namespace) -> None:
 
 
 def cmd_groups_guests(args: argparse.Namespace) -> None:
-    s, ak = _settings(), _ak()
-    if not hasattr(ak, "list_group_users"):
-        _die("Client missing method: list_group_users(group_uuid)")
-    data = ak.list_group_users(s.AK_GUESTS_GROUP_UUID)  # type: ignore[attr-defined]
-    _render_group_listing(data, args)
+    _list_group(_settings().AK_GUESTS_GROUP_UUID, args)
 
 
 def cmd_groups_members(args: argparse.Namespace) -> None:
-    s, ak = _settings(), _ak()
+    _list_group(_settings().AK_MEMBERS_GROUP_UUID, args)
+
+
+def _list_group(group_uuid: str, args: argparse.Namespace) -> None:
+    ak = _ak()
+    # tables only need rows: stream slim records page by page when the client can
+    if not args.json and hasattr(ak, "iter_group_users"):
+        _render_group_listing(ak.iter_group_users(group_uuid), args)  # type: ignore[attr-defined]
+        return
     if not hasattr(ak, "list_group_users"):
         _die("Client missing method: list_group_users(group_uuid)")
-    data = ak.list_group_users(s.AK_MEMBERS_GROUP_UUID)  # type: ignore[attr-defined]
+    data = ak.list_group_users(group_uuid)  # type: ignore[attr-defined]
     _render_group_listing(data, args)
 
 
@@ -192,11 +218,11 @@ def cmd_membership_promote(args: argparse.Namespace) -> None:
     res = ak.switch_group_user_pk(s.AK_GUESTS_GROUP_UUID, s.AK_MEMBERS_GROUP_UUID, int(args.pk))  # type: ignore[attr-defined]
     if not args.no_email:
         try:
-            u = ak.get_user(int(args.pk))  # type: ignore[attr-defined]
+            u = ak.get_user(int(args.pk), partial_ok=True)  # type: ignore[attr-defined]
             to_email = (u.get("email") or "").strip()
             name = (u.get("name") or u.get("username") or "").strip()
             if to_email:
-                mailer.send_promotion_email(
+                _mailer().send_promotion_email(
                     to_email=to_email,
                     name=name,
                     portal_url=_settings().PORTAL_URL,
@@ -230,6 +256,263 @@ def cmd_membership_demote(args: argparse.Namespace) -> None:
     _print_table(rows, headers=["Field", "Value"])
 
 
+# bulk helpers
+def _open_input(path: str) -> TextIO:
+    if path == "-":
+        return sys.stdin
+    try:
+        return open(path, encoding="utf-8-sig", newline="")
+    except OSError as e:
+        _die(f"cannot read {path}: {e}")
+        raise  # unreachable; _die exits
+
+
+def _read_pks(stream: Iterable[str]) -> list[int]:
+    """pks from plain lines, csv (its `pk` column, else the first) or ndjson; first-seen order"""
+    pks: list[int] = []
+    col, first = 0, True
+    for n, raw in enumerate(stream, start=1):
+        line = raw.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            if line.startswith("{"):
+                value = json.loads(line).get("pk")
+            else:
+                cells = next(csv.reader([line]))
+                if first and not cells[0].strip().isdigit():
+                    headers = [c.strip().lower() for c in cells]
+                    if "pk" not in headers:
+                        _die(f"line {n}: csv header has no pk column")
+                    col, first = headers.index("pk"), False
+                    continue
+                value = cells[col]
+            pks.append(int(value))
+        except (ValueError, TypeError, IndexError, AttributeError):
+            _die(f"line {n}: not a pk: {line[:60]}")
+        first = False
+    return list(dict.fromkeys(pks))
+
+
+def _load_progress(path: str, key: str) -> dict[Any, dict[str, Any]]:
+    """results recorded in an ndjson progress file, by key; a torn last line is ignored"""
+    done: dict[Any, dict[str, Any]] = {}
+    try:
+        f = open(path, encoding="utf-8")
+    except FileNotFoundError:
+        return done
+    with f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(rec, dict) and key in rec:
+                done[rec[key]] = rec
+    return done
+
+
+class _ProgressFile:
+    """append-only ndjson record of finished items, flushed per line so a killed run can
+    resume from it"""
+
+    def __init__(self, path: str | None) -> None:
+        self._f: TextIO | None = None
+        if path:
+            # records can hold invite links; keep a new file private to its owner
+            self._f = open(path, "a+", encoding="utf-8", opener=lambda p, f: os.open(p, f, 0o600))
+            self._f.seek(0, os.SEEK_END)
+            if self._f.tell():
+                # a crash may have left half a line; start ours on a fresh one
+                self._f.seek(self._f.tell() - 1)
+                if self._f.read(1) != "\n":
+                    self._f.write("\n")
+
+    def write(self, rec: Mapping[str, Any]) -> None:
+        if self._f is not None:
+            self._f.write(json.dumps(rec, separators=(",", ":")) + "\n")
+            self._f.flush()
+
+    def close(self) -> None:
+        if self._f is not None:
+            self._f.close()
+
+
+def _run_pool(
+    items: Sequence[Any],
+    fn: Callable[[Any], Any],
+    concurrency: int,
+    on_result: Callable[[Any], None],
+) -> None:
+    """fn over items on a bounded thread pool sharing the client's connection pool.
+
+    on_result runs in the calling thread as each item lands. on ctrl-c, items not yet
+    started are dropped and the ones in flight are waited for, so none stops halfway.
+    """
+    if not items:
+        return
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    pool = ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(items))))
+    try:
+        for fut in as_completed([pool.submit(fn, item) for item in items]):
+            on_result(fut.result())
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _concurrency(args: argparse.Namespace) -> int:
+    return max(1, int(args.concurrency or getattr(_settings(), "BULK_CONCURRENCY", 8)))
+
+
+def _out_line(rec: Mapping[str, Any]) -> None:
+    sys.stdout.write(json.dumps(rec, separators=(",", ":")) + "\n")
+    sys.stdout.flush()
+
+
+def _bulk_report(
+    args: argparse.Namespace, summary: dict[str, Any], results: list[dict[str, Any]]
+) -> None:
+    """final output of a bulk command; exits 1 when any item failed"""
+    if args.ndjson:
+        _out_line({"done": True, **summary})
+    elif args.json:
+        _out_json({**summary, "results": results})
+    else:
+        _print_table([[k, v] for k, v in summary.items()], headers=["Field", "Value"])
+        failures = [r for r in results if r.get("ok") is False]
+        if failures:
+            key = "pk" if "pk" in failures[0] else "row"
+            _print_table(failures, headers=[key, "outcome", "detail"])
+    if summary.get("failed"):
+        raise SystemExit(1)
+
+
+def _switch_one(ak: Any, source: str, target: str, pk: int, mail: bool) -> dict[str, Any]:
+    """one bulk entry; failures become ok=false instead of stopping the run"""
+    try:
+        res = ak.switch_group_user_pk(source, target, pk)
+    except Exception as e:
+        out = {"pk": pk, "ok": False, "detail": str(e)}
+        if getattr(e, "outcome", None):
+            out["outcome"] = e.outcome  # type: ignore[attr-defined]
+        return out
+    out = {"pk": pk, "ok": True, "detail": res}
+    if mail:
+        # the address is checkpointed with the switch so a resumed run can still mail it;
+        # it is left out of the output
+        try:
+            u = ak.get_user(pk, partial_ok=True)
+            out["mail_to"] = {
+                "to_email": (u.get("email") or "").strip(),
+                "name": (u.get("name") or u.get("username") or "").strip(),
+            }
+        except Exception as e:
+            sys.stderr.write(f"[warn] no promotion email for {pk}: {e}\n")
+    return out
+
+
+def _membership_many(args: argparse.Namespace, action: str) -> None:
+    s = _settings()
+    if action == "promote":
+        source, target = s.AK_GUESTS_GROUP_UUID, s.AK_MEMBERS_GROUP_UUID
+    else:
+        source, target = s.AK_MEMBERS_GROUP_UUID, s.AK_GUESTS_GROUP_UUID
+    stream = _open_input(args.source)
+    try:
+        pks = _read_pks(stream)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+    # users recorded as done are skipped; failed ones are tried again
+    done: dict[Any, dict[str, Any]] = {}
+    if args.resume_from:
+        done = {pk: r for pk, r in _load_progress(args.resume_from, "pk").items() if r.get("ok")}
+    todo = [pk for pk in pks if pk not in done]
+    summary: dict[str, Any] = {
+        "action": action,
+        "total": len(pks),
+        "skipped": len(pks) - len(todo),
+        "ok": 0,
+        "failed": 0,
+    }
+
+    if args.dry_run:
+        results = [{"pk": pk, "action": action, "dry_run": True} for pk in todo]
+        if args.ndjson:
+            for r in results:
+                _out_line(r)
+        summary["dry_run"] = True
+        summary["pending"] = len(todo)
+        _bulk_report(args, summary, results)
+        return
+
+    ak = _ak()
+    if not hasattr(ak, "switch_group_user_pk"):
+        _die("Client missing method: switch_group_user_pk(source_uuid, target_uuid, pk)")
+    mail = action == "promote" and not args.no_email
+    progress = _ProgressFile(args.progress or args.resume_from)
+    records: list[dict[str, Any]] = []
+    results: list[dict[str, Any]] = []
+
+    def _landed(r: dict[str, Any]) -> None:
+        summary["ok" if r["ok"] else "failed"] += 1
+        # checkpoint first, address included: a crash after this line still gets mailed
+        progress.write(r)
+        records.append(r)
+        out = {k: v for k, v in r.items() if k != "mail_to"}
+        results.append(out)
+        if args.ndjson:
+            _out_line(out)
+
+    try:
+        _run_pool(
+            todo,
+            lambda pk: _switch_one(ak, source, target, pk, mail),
+            _concurrency(args),
+            _landed,
+        )
+
+        # mail every promoted user not yet mailed, including ones from an earlier run
+        by_pk = {**done, **{r["pk"]: r for r in records}}
+        pending = [
+            r
+            for r in by_pk.values()
+            if r.get("ok") and (r.get("mail_to") or {}).get("to_email") and not r.get("mailed")
+        ]
+        if pending and mail:
+            try:
+                # one smtp session for the whole batch
+                sent = _mailer().send_promotion_emails(
+                    [r["mail_to"] for r in pending],
+                    portal_url=s.PORTAL_URL,
+                    authentik_url=s.AK_BASE_URL,
+                    org_name=s.ORGANIZATION_NAME,
+                    external_url=s.EXTERNAL_BASE_URL,
+                    footer=s.EMAIL_FOOTER,
+                )
+            except Exception as e:
+                sys.stderr.write(f"[warn] promotion emails failed: {e}\n")
+                sent = []
+            for r, ok in zip(pending, sent):
+                if ok:
+                    r["mailed"] = True
+                    progress.write(r)
+            summary["mailed"] = sum(1 for ok in sent if ok)
+    finally:
+        progress.close()
+    _bulk_report(args, summary, results)
+
+
+def cmd_membership_promote_many(args: argparse.Namespace) -> None:
+    _membership_many(args, "promote")
+
+
+def cmd_membership_demote_many(args: argparse.Namespace) -> None:
+    _membership_many(args, "demote")
+
+
 def cmd_invites_create(args: argparse.Namespace) -> None:
     ak = _ak()
     if not hasattr(ak, "create_invitation"):
@@ -244,7 +527,7 @@ def cmd_invites_create(args: argparse.Namespace) -> None:
     # send email if provided (same logic as web routes)
     try:
         if getattr(args, "email", None):
-            mailer.send_invitation_email(
+            _mailer().send_invitation_email(
                 to_email=args.email,
                 name=args.name,
                 invite_url=inv.get("invite_url") or inv.get("url") or "",
@@ -271,6 +554,185 @@ def cmd_invites_create(args: argparse.Namespace) -> None:
     _print_table(rows, headers=["Field", "Value"])
 
 
+# columns of the create-many output csv
+INVITE_OUT_COLUMNS = [
+    "row",
+    "name",
+    "username",
+    "email",
+    "ok",
+    "token",
+    "url",
+    "expires",
+    "expires_friendly",
+    "mailed",
+    "detail",
+]
+
+
+def _invite_key(entry: Mapping[str, Any]) -> str:
+    """what identifies a row across runs: its email, else its position in the csv.
+    skipped rows (duplicates among them) go by position so they never shadow a real one"""
+    email = (entry.get("fields") or {}).get("email")
+    if "error" in entry or not email:
+        return f"row:{entry['row']}"
+    return email
+
+
+def _create_one(ak: Any, entry: Mapping[str, Any]) -> dict[str, Any]:
+    """one csv row; skipped rows and failed creations become ok=false"""
+    fields = entry.get("fields") or {}
+    out: dict[str, Any] = {
+        "key": _invite_key(entry),
+        "row": entry["row"],
+        "name": fields.get("name"),
+        "username": fields.get("username"),
+        "email": fields.get("email"),
+        "ok": False,
+    }
+    if "error" in entry:
+        out["detail"] = entry["error"]
+        return out
+    try:
+        inv = ak.create_invitation(**fields)
+    except Exception as e:
+        out["detail"] = str(e)
+        return out
+    out.update(
+        ok=True,
+        token=inv.get("pk") or inv.get("token") or "",
+        url=inv.get("invite_url") or inv.get("url") or "",
+        expires=inv.get("expires") or "",
+        expires_friendly=inv.get("expires_friendly") or "",
+    )
+    return out
+
+
+def _write_invites_csv(path: str, records: Iterable[Mapping[str, Any]]) -> None:
+    f = sys.stdout if path == "-" else open(path, "w", encoding="utf-8", newline="")
+    try:
+        w = csv.DictWriter(f, fieldnames=INVITE_OUT_COLUMNS, extrasaction="ignore")
+        w.writeheader()
+        w.writerows(records)
+    finally:
+        if f is not sys.stdout:
+            f.close()
+
+
+def cmd_invites_create_many(args: argparse.Namespace) -> None:
+    from services.invite_rows import plan_rows, read_csv
+
+    s = _settings()
+    to_stdout = args.out == "-"
+    if to_stdout and args.ndjson:
+        _die("--ndjson needs --out; the csv already goes to stdout")
+    stream = _open_input(args.csv)
+    try:
+        text = stream.read()
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    try:
+        rows = read_csv(text)
+    except ValueError as e:
+        _die(str(e))
+
+    defaults: dict[str, Any] = {"single_use": not args.multi_use}
+    if args.expires_days is not None:
+        defaults["expires_days"] = args.expires_days
+    if args.flow:
+        defaults["flow"] = args.flow
+    entries = plan_rows(rows, defaults)
+
+    # rows recorded as created are not created again; their links come from the record
+    done: dict[Any, dict[str, Any]] = {}
+    if args.resume_from:
+        done = {k: r for k, r in _load_progress(args.resume_from, "key").items() if r.get("ok")}
+    todo = [e for e in entries if _invite_key(e) not in done]
+    summary: dict[str, Any] = {
+        "action": "invite",
+        "total": len(entries),
+        "skipped": len(entries) - len(todo),
+        "ok": 0,
+        "failed": 0,
+    }
+
+    if args.dry_run:
+        results = []
+        for e in todo:
+            r = {"row": e["row"], "email": (e.get("fields") or {}).get("email"), "dry_run": True}
+            if "error" in e:
+                r.update(ok=False, detail=e["error"])
+                summary["failed"] += 1
+            results.append(r)
+            if args.ndjson:
+                _out_line(r)
+        summary["dry_run"] = True
+        summary["pending"] = len(todo) - summary["failed"]
+        _bulk_report(args, summary, results)
+        return
+
+    ak = _ak()
+    if not hasattr(ak, "create_invitation"):
+        _die("Client missing method: create_invitation(**kwargs)")
+    progress = _ProgressFile(args.progress or args.resume_from)
+    results: list[dict[str, Any]] = []
+
+    def _landed(r: dict[str, Any]) -> None:
+        summary["ok" if r["ok"] else "failed"] += 1
+        results.append(r)
+        # checkpoint before anything else: a crash after this line cannot create it twice
+        progress.write(r)
+        if args.ndjson:
+            _out_line(r)
+
+    try:
+        _run_pool(todo, lambda e: _create_one(ak, e), _concurrency(args), _landed)
+
+        # mail every created row not yet mailed, including ones from an earlier run
+        by_key = {**done, **{r["key"]: r for r in results}}
+        pending = [
+            r for r in by_key.values() if r.get("ok") and r.get("email") and not r.get("mailed")
+        ]
+        if pending and not args.no_email:
+            try:
+                # one smtp session for the whole batch
+                sent = _mailer().send_invitation_emails(
+                    [
+                        {
+                            "to_email": r["email"],
+                            "name": r["name"],
+                            "invite_url": r["url"],
+                            "expires_friendly": r.get("expires_friendly") or "",
+                        }
+                        for r in pending
+                    ],
+                    org_name=s.ORGANIZATION_NAME,
+                    external_url=s.EXTERNAL_BASE_URL,
+                    footer=s.EMAIL_FOOTER,
+                )
+            except Exception as e:
+                sys.stderr.write(f"[warn] invitation emails failed: {e}\n")
+                sent = []
+            for r, ok in zip(pending, sent):
+                if ok:
+                    r["mailed"] = True
+                    progress.write(r)
+            summary["mailed"] = sum(1 for ok in sent if ok)
+    finally:
+        progress.close()
+
+    by_key = {**done, **{r["key"]: r for r in results}}
+    _write_invites_csv(args.out, (by_key.get(_invite_key(e), e) for e in entries))
+    if to_stdout:
+        # stdout carries the csv; the summary goes next to warnings
+        sys.stderr.write("[info] " + ", ".join(f"{k}={v}" for k, v in summary.items()) + "\n")
+        if summary["failed"]:
+            raise SystemExit(1)
+        return
+    _bulk_report(args, summary, results)
+
+
 def cmd_brand_info(args: argparse.Namespace) -> None:
     s, ak = _settings(), _ak()
     if not hasattr(ak, "brand_info"):
@@ -316,6 +778,19 @@ def cmd_serve(args: argparse.Namespace) -> None:
 
 
 # argparse wiring
+def _add_bulk_args(p: argparse.ArgumentParser, key: str) -> None:
+    p.add_argument(
+        "--concurrency", type=int, help="Items worked on at once (default: BULK_CONCURRENCY)"
+    )
+    p.add_argument("--dry-run", action="store_true", help="Show what would run; change nothing")
+    p.add_argument("--ndjson", action="store_true", help="Print one JSON line per finished item")
+    p.add_argument("--progress", help=f"Append each finished {key} to this ndjson file")
+    p.add_argument(
+        "--resume-from",
+        help=f"Skip every {key} this progress file records as ok, and keep appending to it",
+    )
+
+
 def build_parser() -> argparse.ArgumentParser:
     p = argparse.ArgumentParser(
         prog="authentik-helper", description="Authentik Helper CLI (clean tables)"
@@ -380,6 +855,21 @@ def build_parser() -> argparse.ArgumentParser:
     pmd = sm.add_parser("demote", help="Members → Guests")
     pmd.add_argument("pk", type=int)
     pmd.set_defaults(func=cmd_membership_demote)
+    for name, func, help_ in (
+        ("promote-many", cmd_membership_promote_many, "Guests → Members for many pks"),
+        ("demote-many", cmd_membership_demote_many, "Members → Guests for many pks"),
+    ):
+        pmm = sm.add_parser(name, help=help_)
+        pmm.add_argument(
+            "source",
+            nargs="?",
+            default="-",
+            help="File of pks: one per line, csv with a pk column, or ndjson (default: stdin)",
+        )
+        if name == "promote-many":
+            pmm.add_argument("--no-email", action="store_true", help="Do not send promotion emails")
+        _add_bulk_args(pmm, "pk")
+        pmm.set_defaults(func=func)
 
     # invites
     pi = sub.add_parser("invites", help="Invitations")
@@ -388,6 +878,27 @@ def build_parser() -> argparse.ArgumentParser:
     pic.add_argument("--email", help="Optional invite email")
     pic.add_argument("--name", help="Optional display name")
     pic.set_defaults(func=cmd_invites_create)
+    pim = si.add_parser(
+        "create-many", help="Create invitations for every row of a csv (sends emails)"
+    )
+    pim.add_argument(
+        "--csv",
+        required=True,
+        help="CSV with a header naming name, username and/or email ('-' for stdin)",
+    )
+    pim.add_argument(
+        "--out", default="-", help="Write a csv of tokens, urls and expiry here (default: stdout)"
+    )
+    pim.add_argument(
+        "--expires-days", type=int, help="Default expiry (default: AK_INVITE_EXPIRES_DAYS)"
+    )
+    pim.add_argument("--flow", help="Default invitation flow slug")
+    pim.add_argument(
+        "--multi-use", action="store_true", help="Rows without single_use get reusable invites"
+    )
+    pim.add_argument("--no-email", action="store_true", help="Do not send invitation emails")
+    _add_bulk_args(pim, "row")
+    pim.set_defaults(func=cmd_invites_create_many)
 
     # brand
     pb = sub.add_parser("brand", help="Brand info")
@@ -0,0 +1,178 @@
+# tools/email_render.py
+from __future__ import annotations
+
+import base64
+import re
+import threading
+import uuid
+from collections import OrderedDict
+from email.header import Header
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from jinja2 import Environment, Template
+from markupsafe import escape
+
+from web.templates import templates as _templates
+
+# plain-text parts share the loader but must not be html-escaped
+_text_env = Environment(
+    loader=_templates.env.loader,
+    autoescape=False,
+    keep_trailing_newline=True,
+    auto_reload=False,
+)
+
+# per-recipient fields; everything else in the context is shared by a batch
+RECIPIENT_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "promotion": ("name",),
+    "invitation": ("name", "invite_url", "expires_friendly"),
+}
+
+_SLOT = re.compile("\x00(\\d+)\x00")
+_PROBE = {"name": "Ada & <Lovelace>", "invite_url": "https://x.test/?a=1&b=2"}
+
+
+def _slot(i: int) -> str:
+    return f"\x00{i}\x00"
+
+
+def _split(rendered: str) -> List[str]:
+    # even items are literal text, odd items are field indexes
+    return _SLOT.split(rendered)
+
+
+class _Part:
+    """one template rendered once with placeholders, then filled per recipient"""
+
+    def __init__(
+        self,
+        tpl: Template,
+        shared: Mapping[str, Any],
+        fields: Sequence[str],
+        html: bool,
+    ) -> None:
+        self._tpl = tpl
+        self._shared = dict(shared)
+        self._fields = tuple(fields)
+        self._html = html
+        self._segments = _split(
+            tpl.render(**self._shared, **{f: _slot(i) for i, f in enumerate(fields)})
+        )
+        # a filter or test on a recipient field would not survive the placeholder
+        # trick; such templates fall back to a full render per recipient
+        probe = {f: _PROBE.get(f, f"<{f} & co>") for f in self._fields}
+        self.exact = self._fill(probe) == self._full(probe)
+
+    def _full(self, values: Mapping[str, Any]) -> str:
+        return self._tpl.render(**self._shared, **values)
+
+    def _fill(self, values: Mapping[str, Any]) -> str:
+        out = []
+        for i, seg in enumerate(self._segments):
+            if i % 2 == 0:
+                out.append(seg)
+                continue
+            v = values.get(self._fields[int(seg)])
+            v = "" if v is None else str(v)
+            out.append(str(escape(v)) if self._html else v)
+        return "".join(out)
+
+    def render(self, values: Mapping[str, Any]) -> str:
+        return self._fill(values) if self.exact else self._full(values)
+
+
+def _b64(text: str) -> bytes:
+    return base64.encodebytes(text.encode("utf-8")).replace(b"\n", b"\r\n")
+
+
+def _header_value(value: str) -> str:
+    # no header injection through recipient data
+    return value.replace("\r", " ").replace("\n", " ").strip()
+
+
+class CompiledEmail:
+    """a template pair (html + text) bound to one shared context and subject.
+
+    render() returns the ready-to-send multipart/alternative message as bytes with
+    CRLF line endings; only the recipient fields are formatted per call.
+    """
+
+    def __init__(self, kind: str, shared: Mapping[str, Any], subject: str) -> None:
+        fields = RECIPIENT_FIELDS[kind]
+        self.kind = kind
+        self.subject = subject
+        self._html = _Part(_templates.env.get_template(f"{kind}_email.html"), shared, fields, True)
+        self._text = _Part(_text_env.get_template(f"{kind}_email.txt"), shared, fields, False)
+        # base64 bodies never contain "=_", so one boundary serves every message
+        boundary = f"=_ah_{uuid.uuid4().hex}"
+        self._content_type = f'multipart/alternative; boundary="{boundary}"'
+        self._subject = Header(subject, "utf-8").encode()
+        self._text_head = (
+            f"--{boundary}\r\n"
+            'Content-Type: text/plain; charset="utf-8"\r\n'
+            "MIME-Version: 1.0\r\n"
+            "Content-Transfer-Encoding: base64\r\n\r\n"
+        ).encode("ascii")
+        self._html_head = (
+            f"--{boundary}\r\n"
+            'Content-Type: text/html; charset="utf-8"\r\n'
+            "MIME-Version: 1.0\r\n"
+            "Content-Transfer-Encoding: base64\r\n\r\n"
+        ).encode("ascii")
+        self._tail = f"--{boundary}--\r\n".encode("ascii")
+
+    @property
+    def exact(self) -> bool:
+        return self._html.exact and self._text.exact
+
+    def bodies(self, values: Mapping[str, Any]) -> Tuple[str, str]:
+        """(text, html) for one recipient"""
+        return self._text.render(values), self._html.render(values)
+
+    def render(self, from_addr: str, to_email: str, values: Mapping[str, Any]) -> bytes:
+        text, html = self.bodies(values)
+        head = (
+            f"Content-Type: {self._content_type}\r\n"
+            "MIME-Version: 1.0\r\n"
+            f"Subject: {self._subject}\r\n"
+            f"From: {_header_value(from_addr)}\r\n"
+            f"To: {_header_value(to_email)}\r\n\r\n"
+        )
+        return b"".join(
+            (
+                head.encode("utf-8"),
+                self._text_head,
+                _b64(text),
+                self._html_head,
+                _b64(html),
+                self._tail,
+            )
+        )
+
+
+_cache_lock = threading.Lock()
+_compiled: "OrderedDict[Tuple[Any, ...], CompiledEmail]" = OrderedDict()
+_CACHE_SIZE = 32
+
+
+def compiled_email(kind: str, shared: Mapping[str, Any], subject: str) -> CompiledEmail:
+    """CompiledEmail for (kind, shared context, subject); built once and reused"""
+    key = (kind, subject, tuple(sorted((k, str(v)) for k, v in shared.items())))
+    with _cache_lock:
+        hit = _compiled.get(key)
+        if hit is not None:
+            _compiled.move_to_end(key)
+            return hit
+    built = CompiledEmail(kind, shared, subject)
+    with _cache_lock:
+        _compiled[key] = built
+        while len(_compiled) > _CACHE_SIZE:
+            _compiled.popitem(last=False)
+    return built
+
+
+def clear_cache(kind: Optional[str] = None) -> None:
+    """drop compiled emails (all, or one kind), e.g. after a brand change"""
+    with _cache_lock:
+        for key in [k for k in _compiled if kind is None or k[0] == kind]:
+            del _compiled[key]
@@ -41,7 +41,15 @@ class JSONFormatter(logging.Formatter):
         "failed",
         "pk",
         "result",
+        "outcome",
+        "job_id",
+        "action",
+        # authentik retries / circuit breaker
+        "attempt",
+        "retry_in",
+        "group",
         # invites/emails
+        "message_id",
         "end_session",
         "post_logout",
         # email transport
@@ -55,6 +63,7 @@ class JSONFormatter(logging.Formatter):
         "has_flow",
         "name_set",
         "email_set",
+        "row",
         # generic error
         "error",
     }
@@ -0,0 +1,272 @@
+# tools/mail_queue.py
+from __future__ import annotations
+
+import logging
+import queue
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from core.utils import redact_email
+from tools.settings import settings
+
+logger = logging.getLogger("authentik_helper.mail")
+
+# terminal states; anything else is still in the queue or being worked on
+DONE_STATES = frozenset({"sent", "not_sent", "failed"})
+
+
+class NoRecipient(Exception):
+    """raised by a submit_lookup lookup when there is definitely nobody to mail (e.g. the
+    user was deleted); the message ends not_sent without being retried"""
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class MailQueue:
+    """in-process delivery queue: worker threads, retry with backoff, status by id.
+
+    jobs call a mailer function with raise_on_error=True. True means sent, False
+    means smtp is not configured (not retried), an exception is retried up to
+    MAIL_RETRY_ATTEMPTS times before the message is marked failed.
+    """
+
+    def __init__(self, workers: Optional[int] = None, history: Optional[int] = None) -> None:
+        self._workers_n = workers
+        self._history_n = history
+        self._q: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._threads: List[threading.Thread] = []
+        self._stopping = threading.Event()
+        self._pending = 0
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._status: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    # public api
+
+    def submit(
+        self,
+        kind: str,
+        send: Callable[..., bool],
+        to_email: str,
+        meta: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> str:
+        """queue send(to_email=..., **kwargs); meta (e.g. pk) is logged and kept in the status"""
+        return self._enqueue(kind, send, to_email, None, meta, kwargs)
+
+    def submit_lookup(
+        self,
+        kind: str,
+        send: Callable[..., bool],
+        lookup: Callable[[], Optional[Dict[str, Any]]],
+        meta: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> str:
+        """like submit, but the worker calls lookup() for the recipient before sending.
+
+        lookup returns extra send kwargs including to_email, or None when there is nobody
+        to mail (the message ends not_sent); it raises NoRecipient to say the same with a
+        reason. its other errors are retried like send errors.
+        """
+        return self._enqueue(kind, send, "", lookup, meta, kwargs)
+
+    def _enqueue(
+        self,
+        kind: str,
+        send: Callable[..., bool],
+        to_email: str,
+        lookup: Optional[Callable[[], Optional[Dict[str, Any]]]],
+        meta: Optional[Dict[str, Any]],
+        kwargs: Dict[str, Any],
+    ) -> str:
+        message_id = uuid.uuid4().hex
+        meta = dict(meta or {})
+        log_extra = {"message_id": message_id, "email": redact_email(to_email), **meta}
+        with self._lock:
+            self._jobs[message_id] = {
+                "send": send,
+                "lookup": lookup,
+                "kwargs": {"to_email": to_email, **kwargs},
+                "log": log_extra,
+            }
+            self._status[message_id] = {
+                **meta,
+                "id": message_id,
+                "kind": kind,
+                "to": redact_email(to_email),
+                "status": "queued",
+                "attempts": 0,
+                "error": None,
+                "queued_at": _now(),
+                "updated_at": _now(),
+            }
+            self._trim_history()
+            self._pending += 1
+            self._ensure_workers()
+        self._q.put(message_id)
+        logger.info(f"{kind}_email_queued", extra=log_extra)
+        return message_id
+
+    def status(self, message_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            st = self._status.get(message_id)
+            return dict(st) if st else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for st in self._status.values():
+                counts[st["status"]] = counts.get(st["status"], 0) + 1
+            return {
+                "pending": self._pending,
+                "workers": sum(1 for t in self._threads if t.is_alive()),
+                "by_status": counts,
+            }
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """wait until every submitted message reached a final state"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._pending:
+                left = None if deadline is None else deadline - time.monotonic()
+                if left is not None and left <= 0:
+                    return False
+                self._idle.wait(left)
+            return True
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """graceful shutdown: finish queued mail (up to timeout), then stop the workers"""
+        wait = settings.MAIL_DRAIN_TIMEOUT if timeout is None else timeout
+        drained = self.join(wait)
+        if not drained:
+            logger.warning("mail_queue_drain_timeout", extra={"count": self._pending})
+        self._stopping.set()
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._q.put(None)
+        for t in threads:
+            t.join(timeout=1.0)
+        self._stopping.clear()
+        return drained
+
+    def clear(self) -> None:
+        """forget finished message states (tests)"""
+        with self._lock:
+            for mid in [m for m, st in self._status.items() if st["status"] in DONE_STATES]:
+                del self._status[mid]
+
+    # internals
+
+    def _ensure_workers(self) -> None:
+        # caller holds the lock; threads start on first use so importing is free
+        self._threads = [t for t in self._threads if t.is_alive()]
+        want = max(1, int(self._workers_n or settings.MAIL_WORKERS))
+        while len(self._threads) < want:
+            t = threading.Thread(
+                target=self._worker, name=f"mail-worker-{len(self._threads)}", daemon=True
+            )
+            self._threads.append(t)
+            t.start()
+
+    def _trim_history(self) -> None:
+        limit = max(1, int(self._history_n or settings.MAIL_HISTORY))
+        while len(self._status) > limit:
+            oldest = next(iter(self._status))
+            if self._status[oldest]["status"] not in DONE_STATES:
+                break
+            del self._status[oldest]
+
+    def _update(self, message_id: str, **fields: Any) -> None:
+        with self._lock:
+            st = self._status.get(message_id)
+            if st is not None:
+                st.update(fields, updated_at=_now())
+
+    def _finish(self, message_id: str, **fields: Any) -> None:
+        self._update(message_id, **fields)
+        with self._idle:
+            self._jobs.pop(message_id, None)
+            self._pending -= 1
+            self._trim_history()
+            self._idle.notify_all()
+
+    def _backoff(self, attempt: int) -> float:
+        cap = min(settings.MAIL_RETRY_BACKOFF_MAX, settings.MAIL_RETRY_BACKOFF * (2**attempt))
+        return random.uniform(cap / 2, cap) if cap > 0 else 0.0
+
+    def _resolve(self, message_id: str, job: Dict[str, Any]) -> Optional[str]:
+        """fill in the recipient from the job's lookup; why there is none, else None"""
+        try:
+            found = job["lookup"]()
+        except NoRecipient as e:
+            return str(e) or "no recipient"
+        to_email = ((found or {}).get("to_email") or "").strip()
+        if not to_email:
+            return "no email address"
+        job["lookup"] = None
+        job["kwargs"] = {**job["kwargs"], **(found or {}), "to_email": to_email}
+        job["log"]["email"] = redact_email(to_email)
+        self._update(message_id, to=redact_email(to_email))
+        return None
+
+    def _worker(self) -> None:
+        while True:
+            message_id = self._q.get()
+            if message_id is None:
+                return
+            try:
+                self._deliver(message_id)
+            except Exception as e:  # never let a worker die
+                self._finish(message_id, status="failed", error=str(e))
+
+    def _deliver(self, message_id: str) -> None:
+        with self._lock:
+            job = self._jobs.get(message_id)
+            kind = self._status[message_id]["kind"]
+        if job is None:
+            return
+        log_extra = job["log"]
+        attempts = max(0, int(settings.MAIL_RETRY_ATTEMPTS))
+        for attempt in range(attempts + 1):
+            self._update(message_id, status="sending", attempts=attempt + 1)
+            try:
+                missing = self._resolve(message_id, job) if job["lookup"] is not None else None
+                if missing:
+                    logger.info(f"{kind}_email_no_recipient", extra={**log_extra, "error": missing})
+                    self._finish(message_id, status="not_sent", error=missing)
+                    return
+                sent = job["send"](raise_on_error=True, **job["kwargs"])
+            except Exception as e:
+                if attempt >= attempts or self._stopping.is_set():
+                    logger.warning(f"{kind}_email_failed", extra={**log_extra, "error": str(e)})
+                    self._finish(message_id, status="failed", error=str(e))
+                    return
+                wait = self._backoff(attempt)
+                self._update(message_id, status="retrying", error=str(e))
+                logger.info(
+                    "mail_retry",
+                    extra={**log_extra, "attempt": attempt + 1, "retry_in": round(wait, 2)},
+                )
+                if self._stopping.wait(wait):
+                    self._finish(message_id, status="failed", error=f"shutdown: {e}")
+                    return
+                continue
+            if sent:
+                logger.info(f"{kind}_email_sent", extra=log_extra)
+                self._finish(message_id, status="sent", error=None)
+            else:
+                logger.warning(f"{kind}_email_not_sent", extra=log_extra)
+                self._finish(message_id, status="not_sent")
+            return
+
+
+mail_queue = MailQueue()
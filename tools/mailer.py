@@ -1,34 +1,24 @@
 from __future__ import annotations
 
+import atexit
 import logging
 import smtplib
+import threading
+import time
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
 
 from fastapi import FastAPI
-from jinja2 import Environment
 from pydantic import AnyHttpUrl, PositiveInt
 
 from services.brand import brand_ctx
+from tools.email_render import RECIPIENT_FIELDS, CompiledEmail, compiled_email
 from tools.settings import settings
-from web.templates import templates as _templates
 
 logger = logging.getLogger("authentik_helper.mail")
 
 
-# templates
-
-
-def _get_jinja() -> Environment:
-    return _templates.env
-
-
-def _render_html(template_name: str, context: Dict[str, Any]) -> str:
-    tpl = _get_jinja().get_template(template_name)
-    return tpl.render(**context)
-
-
 # smtp
 
 
@@ -47,7 +37,180 @@ def _smtp_settings() -> (
     return host, port, user, pwd, from_addr
 
 
-def _send_html(to_email: str, subject: str, html_body: str) -> bool:
+class _Session:
+    __slots__ = ("conn", "key", "opened", "last_used", "sent")
+
+    def __init__(self, conn: Any, key: Tuple[Any, ...], now: float) -> None:
+        self.conn = conn
+        self.key = key
+        self.opened = now
+        self.last_used = now
+        self.sent = 0
+
+
+# refusals for one message; the session itself is still good
+_MESSAGE_ERRORS = (
+    smtplib.SMTPRecipientsRefused,
+    smtplib.SMTPSenderRefused,
+    smtplib.SMTPDataError,
+)
+
+
+class SMTPPool:
+    """reusable smtp sessions: NOOP before reuse, reconnect once, rotate by count/idle time"""
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._idle: List[_Session] = []
+
+    def _connect(self, key: Tuple[Any, ...]) -> _Session:
+        host, port, user, pwd = key
+        if port == 465:
+            conn = smtplib.SMTP_SSL(host, port)
+        else:
+            conn = smtplib.SMTP(host, port, timeout=30)
+            conn.ehlo()
+            conn.starttls()
+            conn.ehlo()
+        if user and pwd:
+            conn.login(user, pwd)
+        logger.debug("smtp_connected", extra={"host": host, "port": port})
+        return _Session(conn, key, self._clock())
+
+    @staticmethod
+    def _close(session: _Session) -> None:
+        try:
+            session.conn.quit()
+        except Exception:
+            try:
+                session.conn.close()
+            except Exception:
+                pass
+
+    def _expired(self, session: _Session) -> bool:
+        now = self._clock()
+        return (
+            session.sent >= settings.SMTP_SESSION_MAX_MESSAGES
+            or now - session.last_used >= settings.SMTP_SESSION_MAX_IDLE
+        )
+
+    def _checkout(self, key: Tuple[Any, ...]) -> Tuple[_Session, bool]:
+        """(session, reused); reused sessions passed a NOOP just now"""
+        while True:
+            with self._lock:
+                idx = next((i for i, s in enumerate(self._idle) if s.key == key), None)
+                session = self._idle.pop(idx) if idx is not None else None
+            if session is None:
+                return self._connect(key), False
+            if self._expired(session):
+                self._close(session)
+                continue
+            try:
+                code = session.conn.noop()[0]
+            except Exception:
+                code = 0
+            if code == 250:
+                return session, True
+            self._close(session)
+
+    def _checkin(self, session: _Session) -> None:
+        session.last_used = self._clock()
+        if self._expired(session):
+            self._close(session)
+            return
+        with self._lock:
+            if len(self._idle) < settings.SMTP_POOL_SIZE:
+                self._idle.append(session)
+                return
+        self._close(session)
+
+    def _send_on(self, session: _Session, from_addr: str, rcpts: List[str], data: Any) -> None:
+        session.conn.sendmail(from_addr, rcpts, data)
+        session.sent += 1
+
+    def send(self, key: Tuple[Any, ...], from_addr: str, rcpts: List[str], data: Any) -> None:
+        """send one message on a pooled session; a dropped reused session is retried once"""
+        self.send_many(key, from_addr, [(rcpts, data)], raise_on_error=True)
+
+    def send_many(
+        self,
+        key: Tuple[Any, ...],
+        from_addr: str,
+        messages: Iterable[Tuple[List[str], Any]],
+        raise_on_error: bool = False,
+    ) -> List[Optional[Exception]]:
+        """send messages back to back on one session; returns None or the error per message"""
+        results: List[Optional[Exception]] = []
+        session: Optional[_Session] = None
+        reused = False
+        down: Optional[Exception] = None  # set when we cannot connect at all
+        try:
+            for rcpts, data in messages:
+                err: Optional[Exception] = down
+                for _ in range(2 if down is None else 0):
+                    try:
+                        if (
+                            session is not None
+                            and session.sent >= settings.SMTP_SESSION_MAX_MESSAGES
+                        ):
+                            # rotate long-lived sessions mid-batch
+                            self._close(session)
+                            session = None
+                        if session is None:
+                            session, reused = self._checkout(key)
+                    except Exception as e:
+                        err = down = e
+                        break
+                    try:
+                        self._send_on(session, from_addr, rcpts, data)
+                        err = None
+                        break
+                    except _MESSAGE_ERRORS as e:
+                        err = e
+                        break
+                    except Exception as e:
+                        # connection-level failure: drop the session, retry once if it was stale
+                        err = e
+                        self._close(session)
+                        session = None
+                        if not reused:
+                            break
+                if err is not None and raise_on_error:
+                    raise err
+                results.append(err)
+            return results
+        finally:
+            if session is not None:
+                self._checkin(session)
+
+    def close_all(self) -> None:
+        with self._lock:
+            sessions, self._idle = self._idle, []
+        for session in sessions:
+            self._close(session)
+
+
+smtp_pool = SMTPPool()
+atexit.register(smtp_pool.close_all)
+
+
+def _pool_key() -> Tuple[Any, ...]:
+    host, port, user, pwd, _ = _smtp_settings()
+    return (host, port, user, pwd)
+
+
+def _mime(from_addr: str, to_email: str, subject: str, html_body: str) -> str:
+    msg = MIMEMultipart("alternative")
+    msg["Subject"] = subject
+    msg["From"] = from_addr
+    msg["To"] = to_email
+    msg.attach(MIMEText(html_body, "html", "utf-8"))
+    return msg.as_string()
+
+
+def _send_message(to_email: str, data: Any, raise_on_error: bool = False) -> bool:
+    """send one ready message; data is bytes/str or a callable taking from_addr"""
     host, port, user, pwd, from_addr = _smtp_settings()
     logger.info(
         "smtp_attempt",
@@ -63,32 +226,53 @@ def _send_html(to_email: str, subject: str, html_body: str) -> bool:
         logger.warning("smtp_not_configured", extra={"missing": ["SMTP_HOST_or_SMTP_FROM"]})
         return False
 
-    msg = MIMEMultipart("alternative")
-    msg["Subject"] = subject
-    msg["From"] = from_addr
-    msg["To"] = to_email
-    msg.attach(MIMEText(html_body, "html", "utf-8"))
-
     try:
-        if port == 465:
-            with smtplib.SMTP_SSL(host, port) as s:
-                if user and pwd:
-                    s.login(user, pwd)
-                s.sendmail(from_addr, [to_email], msg.as_string())
-        else:
-            with smtplib.SMTP(host, port, timeout=30) as s:
-                s.ehlo()
-                s.starttls()
-                s.ehlo()
-                if user and pwd:
-                    s.login(user, pwd)
-                s.sendmail(from_addr, [to_email], msg.as_string())
+        payload = data(from_addr) if callable(data) else data
+        smtp_pool.send(_pool_key(), from_addr, [to_email], payload)
         return True
     except Exception as e:
-        logger.error("smtp_send_failed", extra={"error": str(e)}, exc_info=True)
+        logger.error("smtp_send_failed", extra={"error": str(e)}, exc_info=not raise_on_error)
+        if raise_on_error:
+            # the delivery queue decides whether to retry
+            raise
         return False
 
 
+def _send_html(to_email: str, subject: str, html_body: str, raise_on_error: bool = False) -> bool:
+    return _send_message(
+        to_email, lambda from_addr: _mime(from_addr, to_email, subject, html_body), raise_on_error
+    )
+
+
+def _send_batch(batch: List[Tuple[str, Callable[[str], Any]]]) -> List[bool]:
+    """send (to_email, build(from_addr)) pairs over one pooled session"""
+    host, port, _, _, from_addr = _smtp_settings()
+    if not host or not from_addr:
+        logger.warning("smtp_not_configured", extra={"missing": ["SMTP_HOST_or_SMTP_FROM"]})
+        return [False] * len(batch)
+    errors = smtp_pool.send_many(
+        _pool_key(), from_addr, (([to], build(from_addr)) for to, build in batch)
+    )
+    for (to, _), err in zip(batch, errors):
+        if err is not None:
+            logger.error("smtp_send_failed", extra={"to": to, "error": str(err)})
+    logger.info(
+        "smtp_batch_sent",
+        extra={"count": len(batch), "failed": sum(1 for e in errors if e is not None)},
+    )
+    return [e is None for e in errors]
+
+
+def send_many(messages: Iterable[Tuple[str, str, str]]) -> List[bool]:
+    """send (to_email, subject, html_body) messages over one pooled session"""
+    return _send_batch(
+        [
+            (to, lambda f, to=to, subject=subject, html=html: _mime(f, to, subject, html))
+            for to, subject, html in messages
+        ]
+    )
+
+
 # brand defaults helper
 
 
@@ -109,6 +293,62 @@ def _brand_defaults(app: Optional[FastAPI] = None) -> Dict[str, Any]:
 # public api
 
 
+def _invitation_email(
+    org_name: Optional[str] = None,
+    external_url: str | AnyHttpUrl | None = None,
+    footer: str = "",
+    brand_logo: Optional[str] = None,
+    app: Optional[FastAPI] = None,
+) -> CompiledEmail:
+    b = _brand_defaults(app)
+    org = org_name or b["org_name"] or "our service"
+    shared = {
+        "org_name": org,
+        "external_url": external_url or getattr(settings, "EXTERNAL_BASE_URL", None),
+        "footer": footer,
+        "brand_logo": brand_logo or b["brand_logo"],
+    }
+    subject = settings.EMAIL_SUBJECT_INVITATION or f"Your invite to {org}!"
+    return compiled_email("invitation", shared, subject)
+
+
+def _promotion_email(
+    portal_url: str | AnyHttpUrl | None = None,
+    authentik_url: str | AnyHttpUrl | None = None,
+    org_name: Optional[str] = None,
+    external_url: str | AnyHttpUrl | None = None,
+    footer: str = "",
+    brand_logo: Optional[str] = None,
+    app: Optional[FastAPI] = None,
+) -> CompiledEmail:
+    b = _brand_defaults(app)
+    portal = portal_url or b["portal_url"] or str(authentik_url)
+    org = org_name or b["org_name"] or portal or "our service"
+    shared = {
+        "portal_url": portal,
+        "org_name": org,
+        "external_url": external_url or getattr(settings, "EXTERNAL_BASE_URL", None),
+        "footer": footer,
+        "brand_logo": brand_logo or b["brand_logo"],
+    }
+    subject = settings.EMAIL_SUBJECT_PROMOTION or f"You've been promoted on {org}!"
+    return compiled_email("promotion", shared, subject)
+
+
+def _fields(kind: str, rcpt: Mapping[str, Any]) -> Dict[str, Any]:
+    values = {f: rcpt.get(f) for f in RECIPIENT_FIELDS[kind]}
+    values["name"] = values.get("name") or ""
+    return values
+
+
+def _send_compiled(compiled: CompiledEmail, recipients: Iterable[Mapping[str, Any]]) -> List[bool]:
+    batch = []
+    for rcpt in recipients:
+        to, values = rcpt["to_email"], _fields(compiled.kind, rcpt)
+        batch.append((to, lambda f, to=to, values=values: compiled.render(f, to, values)))
+    return _send_batch(batch)
+
+
 def send_invitation_email(
     *,
     to_email: str,
@@ -120,9 +360,10 @@ def send_invitation_email(
     footer: str = "",
     brand_logo: Optional[str] = None,
     app: Optional[FastAPI] = None,
+    raise_on_error: bool = False,
 ) -> bool:
     """
-    render and send the invitation email (templates/invitation_email.html)
+    render and send the invitation email (templates/invitation_email.html + .txt)
 
     inputs:
       - to_email, name, invite_url, expires_friendly
@@ -130,26 +371,34 @@ def send_invitation_email(
       - footer (optional)
       - brand_logo (optional; falls back to brand)
       - app (optional fastapi app to reuse warmed brand data)
+      - raise_on_error (re-raise smtp errors instead of returning False)
     """
-    b = _brand_defaults(app)
-    org = org_name or b["org_name"] or "our service"
-    ext = external_url or getattr(settings, "EXTERNAL_BASE_URL", None)
-    logo = brand_logo or b["brand_logo"]
-
-    html = _render_html(
-        "invitation_email.html",
-        {
-            "name": name or "",
-            "invite_url": invite_url,
-            "expires_friendly": expires_friendly,
-            "org_name": org,
-            "external_url": ext,
-            "footer": footer,
-            "brand_logo": logo,
-        },
+    compiled = _invitation_email(org_name, external_url, footer, brand_logo, app)
+    values = _fields(
+        "invitation",
+        {"name": name, "invite_url": invite_url, "expires_friendly": expires_friendly},
     )
-    subject = settings.EMAIL_SUBJECT_INVITATION or f"Your invite to {org}!"
-    return _send_html(to_email, subject, html)
+    return _send_message(
+        to_email, lambda from_addr: compiled.render(from_addr, to_email, values), raise_on_error
+    )
+
+
+def send_invitation_emails(
+    recipients: Iterable[Mapping[str, Any]],
+    *,
+    org_name: Optional[str] = None,
+    external_url: str | AnyHttpUrl | None = None,
+    footer: str = "",
+    brand_logo: Optional[str] = None,
+    app: Optional[FastAPI] = None,
+) -> List[bool]:
+    """
+    batch form of send_invitation_email: the template and brand context are
+    resolved once, each recipient mapping carries to_email, name, invite_url and
+    expires_friendly. all messages go out over one pooled session.
+    """
+    compiled = _invitation_email(org_name, external_url, footer, brand_logo, app)
+    return _send_compiled(compiled, recipients)
 
 
 def send_promotion_email(
@@ -163,9 +412,10 @@ def send_promotion_email(
     footer: str = "",
     brand_logo: Optional[str] = None,
     app: Optional[FastAPI] = None,
+    raise_on_error: bool = False,
 ) -> bool:
     """
-    render and send the promotion email (templates/promotion_email.html)
+    render and send the promotion email (templates/promotion_email.html + .txt)
 
     inputs:
       - to_email, name
@@ -175,23 +425,33 @@ def send_promotion_email(
       - footer (optional)
       - brand_logo (optional; falls back to brand)
       - app (optional fastapi app to reuse warmed brand data)
+      - raise_on_error (re-raise smtp errors instead of returning False)
     """
-    b = _brand_defaults(app)
-    portal = portal_url or b["portal_url"] or str(authentik_url)
-    org = org_name or b["org_name"] or portal or "our service"
-    ext = external_url or getattr(settings, "EXTERNAL_BASE_URL", None)
-    logo = brand_logo or b["brand_logo"]
-
-    html = _render_html(
-        "promotion_email.html",
-        {
-            "name": name or "",
-            "portal_url": portal,
-            "org_name": org,
-            "external_url": ext,
-            "footer": footer,
-            "brand_logo": logo,
-        },
+    compiled = _promotion_email(
+        portal_url, authentik_url, org_name, external_url, footer, brand_logo, app
     )
-    subject = settings.EMAIL_SUBJECT_PROMOTION or f"You've been promoted on {org}!"
-    return _send_html(to_email, subject, html)
+    values = _fields("promotion", {"name": name})
+    return _send_message(
+        to_email, lambda from_addr: compiled.render(from_addr, to_email, values), raise_on_error
+    )
+
+
+def send_promotion_emails(
+    recipients: Iterable[Mapping[str, Any]],
+    *,
+    portal_url: str | AnyHttpUrl | None = None,
+    authentik_url: str | AnyHttpUrl,
+    org_name: Optional[str] = None,
+    external_url: str | AnyHttpUrl | None = None,
+    footer: str = "",
+    brand_logo: Optional[str] = None,
+    app: Optional[FastAPI] = None,
+) -> List[bool]:
+    """
+    batch form of send_promotion_email: each recipient mapping carries to_email
+    and name; template and brand context are resolved once for the whole batch.
+    """
+    compiled = _promotion_email(
+        portal_url, authentik_url, org_name, external_url, footer, brand_logo, app
+    )
+    return _send_compiled(compiled, recipients)
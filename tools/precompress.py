@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# tools/precompress.py  build-time static asset compression
+# Writes app.css.gz (and .br / .zst when brotli / zstandard are installed) next to each
+# compressible file so the server can send them without compressing per request.
+# Usage: python -m tools.precompress [web/static]
+
+from __future__ import annotations
+
+import argparse
+import mimetypes
+import os
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+from core.compression import EXTENSIONS, compress_file_bytes, compressible, precompressed_variants
+
+# not worth a variant below this; the compression framing eats most of the gain
+MIN_SIZE = 256
+# keep a variant only when it saves at least this fraction
+MIN_SAVING = 0.1
+
+mimetypes.add_type("application/manifest+json", ".webmanifest")
+
+
+def _is_variant(path: Path) -> bool:
+    return path.suffix in EXTENSIONS.values()
+
+
+def precompress(root: Path, min_size: int = MIN_SIZE) -> List[Dict[str, object]]:
+    """compress every eligible file under root; returns one row per file written"""
+    written: List[Dict[str, object]] = []
+    variants = precompressed_variants()
+    for path in sorted(p for p in root.rglob("*") if p.is_file() and not _is_variant(p)):
+        ctype, _ = mimetypes.guess_type(path.name)
+        data = path.read_bytes()
+        eligible = compressible(ctype or "") and len(data) >= min_size
+        for coding, ext in variants:
+            target = path.with_name(path.name + ext)
+            blob = compress_file_bytes(coding, data) if eligible else b""
+            if not blob or len(blob) > len(data) * (1 - MIN_SAVING):
+                # a stale variant from an earlier build would otherwise keep being served
+                target.unlink(missing_ok=True)
+                continue
+            target.write_bytes(blob)
+            # same mtime as the source so the server knows the variant is current
+            st = path.stat()
+            os.utime(target, ns=(st.st_atime_ns, st.st_mtime_ns))
+            written.append(
+                {"file": str(path.relative_to(root)), "coding": coding, "size": len(blob)}
+            )
+    return written
+
+
+def main(argv: list[str] | None = None) -> None:
+    p = argparse.ArgumentParser(description="Precompress static assets")
+    p.add_argument("root", nargs="?", default="web/static", help="directory to walk")
+    args = p.parse_args(argv)
+    root = Path(args.root)
+    if not root.is_dir():
+        sys.stderr.write(f"error: {root} is not a directory\n")
+        sys.exit(2)
+    rows = precompress(root)
+    for r in rows:
+        sys.stdout.write(f"{r['coding']:>5} {r['size']:>8}  {r['file']}\n")
+    sys.stdout.write(f"{len(rows)} variant(s) written\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -17,6 +17,57 @@ class Settings(BaseSettings):
     AK_BRAND_UUID: str | None = None
     AK_INVITE_FLOW_SLUG: str | None = None  # allow unset
     AK_INVITE_EXPIRES_DAYS: int = 7
+    # "paged" walks /core/users/?groups_by_pk=...; "include_users" is the old one-shot dump
+    AK_GROUP_LISTING: Literal["paged", "include_users"] = "paged"
+    AK_GROUP_PAGE_SIZE: PositiveInt = 500
+    AK_LOOKUP_CONCURRENCY: PositiveInt = 10  # parallel single-user lookups
+    AK_MEMBERSHIP_CACHE_TTL: float = 30.0  # seconds a group listing is served from memory; 0 = off
+    AK_MEMBERSHIP_LOG_SIZE: PositiveInt = 10000  # membership changes kept for ?since= deltas
+    AK_MEMBERSHIP_RECONCILE: float = 300.0  # seconds between background group reloads; 0 = off
+    AK_USER_CACHE_SIZE: int = 5000  # user records kept by pk (lru); 0 = off
+    AK_USER_CACHE_TTL: float = 300.0
+    AK_USER_CACHE_NEGATIVE_TTL: float = 30.0  # how long a 404 is remembered
+    AK_SEARCH_CACHE_SIZE: int = 256  # upstream search results kept by query; 0 = off
+    AK_SEARCH_CACHE_TTL: float = 30.0
+    AK_USER_INDEX: bool = True  # local typeahead index fed by a background directory sync
+    AK_USER_INDEX_REFRESH: float = 60.0  # seconds between incremental syncs
+    AK_USER_INDEX_FULL_SYNC: float = 3600.0  # full resync (also drops deleted users)
+
+    # authentik http transport
+    AK_HTTP_MAX_CONNECTIONS: PositiveInt = 20
+    AK_HTTP_MAX_KEEPALIVE: PositiveInt = 10
+    AK_HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    AK_HTTP2: bool = False  # needs the optional `h2` package
+    AK_HTTP_CONNECT_TIMEOUT: float = 5.0
+    AK_HTTP_LIST_TIMEOUT: float = 60.0  # group dumps
+    AK_HTTP_MUTATION_TIMEOUT: float = 15.0  # add/remove user, invitations
+    AK_HTTP_SEARCH_TIMEOUT: float = 10.0  # search and single-record lookups
+    AK_HTTP_WARMUP_CONNECTIONS: int = 2  # opened during app startup; 0 disables
+
+    # authentik retries / circuit breaker
+    AK_RETRY_ATTEMPTS: int = 3  # retries after the first try; 0 disables
+    AK_RETRY_BACKOFF_BASE: float = 0.25
+    AK_RETRY_BACKOFF_MAX: float = 5.0  # also the longest Retry-After we will wait for
+    AK_BREAKER_FAILURE_THRESHOLD: PositiveInt = 5
+    AK_BREAKER_RESET_SECONDS: float = 30.0
+
+    # bulk routes
+    BULK_CONCURRENCY: PositiveInt = 8  # pks or invite rows worked on at once per bulk request
+    INVITES_BULK_MAX_ROWS: PositiveInt = 2000  # rows accepted by one /invites/bulk request
+    JOBS_MAX_ITEMS: PositiveInt = 10000  # pks accepted by one /jobs submission
+    JOBS_HISTORY: PositiveInt = 100  # finished jobs kept for status, streaming and retry
+
+    # live updates (/events)
+    EVENTS_HEARTBEAT: float = 15.0  # seconds between keep-alive comments on idle streams
+    EVENTS_BUFFER: PositiveInt = 1000  # recent events kept for Last-Event-ID resume
+    EVENTS_QUEUE_SIZE: PositiveInt = 256  # undelivered events per client before it is cut off
+
+    # response compression
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_SIZE: int = 1024  # bytes; smaller bodies go out as-is
+    COMPRESSION_GZIP_LEVEL: int = 5
+    COMPRESSION_BROTLI_QUALITY: int = 4  # needs the optional `brotli` package
+    COMPRESSION_ZSTD_LEVEL: int = 3  # needs the optional `zstandard` package
 
     # smtp
     SMTP_HOST: str | None = None
@@ -24,6 +75,17 @@ class Settings(BaseSettings):
     SMTP_USERNAME: str | None = None
     SMTP_PASSWORD: SecretStr | None = None
     SMTP_FROM: str | None = None
+    SMTP_POOL_SIZE: PositiveInt = 4  # idle sessions kept open for reuse
+    SMTP_SESSION_MAX_MESSAGES: PositiveInt = 100  # reconnect after this many sends
+    SMTP_SESSION_MAX_IDLE: float = 60.0  # seconds before an idle session is dropped
+
+    # background mail delivery
+    MAIL_WORKERS: PositiveInt = 2
+    MAIL_RETRY_ATTEMPTS: int = 3  # retries after the first try; 0 disables
+    MAIL_RETRY_BACKOFF: float = 2.0
+    MAIL_RETRY_BACKOFF_MAX: float = 60.0
+    MAIL_HISTORY: PositiveInt = 1000  # finished message states kept for status lookups
+    MAIL_DRAIN_TIMEOUT: float = 30.0  # seconds shutdown waits for queued mail
 
     # email templates
     PORTAL_URL: AnyHttpUrl | None = None
@@ -1,8 +1,9 @@
 # web/app_factory.py
 from __future__ import annotations
 
+import asyncio
 import mimetypes
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
 from importlib.metadata import PackageNotFoundError, version as pkg_version
 from importlib.resources import files
 from typing import Any, Dict
@@ -10,17 +11,25 @@ from urllib.parse import urlsplit
 
 from fastapi import FastAPI
 from fastapi.responses import FileResponse
-from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.sessions import SessionMiddleware
 from starlette.middleware.trustedhost import TrustedHostMiddleware
 from pydantic import SecretStr
 
+from core.compression import CompressionMiddleware, available_codecs
 from core.middleware import get_request_id, request_log_middleware
-from routers import invites, membership, pages, public, users
+from routers import events, invites, mail, membership, pages, public, users
+from services.authentik import aak, ak
 from services.brand import brand_ctx, refresh_brand_defaults
+from services.jobs import job_scheduler
+from services.membership_log import run_reconcile
+from services.user_index import run_sync
 from tools.logging_config import setup_logging
+from tools.mail_queue import mail_queue
+from tools.mailer import smtp_pool
 from tools.settings import settings
 from web.error_handlers import register as register_error_handlers
+from web.static_files import PrecompressedStaticFiles
 from services.build import build_ctx
 
 
@@ -62,12 +71,40 @@ def create_app(title: str = "Authentik Helper") -> FastAPI:
     async def lifespan(app: FastAPI):
         app.state.brand = refresh_brand_defaults()
         app.state.build = build_ctx(app)
+        await aak.warm_up()
+        background = []
+        if settings.AK_USER_INDEX:
+            background.append(asyncio.create_task(run_sync(aak)))
+        if settings.AK_MEMBERSHIP_RECONCILE > 0:
+            groups = [settings.AK_GUESTS_GROUP_UUID, settings.AK_MEMBERS_GROUP_UUID]
+            background.append(asyncio.create_task(run_reconcile(aak, groups)))
         yield
+        for task in background:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+        await job_scheduler.shutdown()
+        await aak.aclose()
+        # let queued mail go out before the process exits
+        await run_in_threadpool(mail_queue.drain)
+        # the mail workers look promotion recipients up through the blocking client
+        await run_in_threadpool(ak.close)
+        await run_in_threadpool(smtp_pool.close_all)
 
     app = FastAPI(title=title, version=_app_version(), lifespan=lifespan)
 
     # middleware
     app.middleware("http")(request_log_middleware())
+    if settings.COMPRESSION_ENABLED:
+        app.add_middleware(
+            CompressionMiddleware,
+            minimum_size=settings.COMPRESSION_MIN_SIZE,
+            codecs=available_codecs(
+                gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+                brotli_quality=settings.COMPRESSION_BROTLI_QUALITY,
+                zstd_level=settings.COMPRESSION_ZSTD_LEVEL,
+            ),
+        )
     app.add_middleware(TrustedHostMiddleware, allowed_hosts=_trusted_hosts())
 
     ext = str(settings.EXTERNAL_BASE_URL or "")
@@ -93,9 +130,9 @@ def create_app(title: str = "Authentik Helper") -> FastAPI:
 
     app.state.common_ctx = common_ctx
 
-    # static + assets
+    # static + assets (.gz/.br/.zst siblings from tools.precompress are preferred)
     _STATIC_DIR = files("web").joinpath("static")
-    app.mount("/static", StaticFiles(directory=str(_STATIC_DIR)), name="static")
+    app.mount("/static", PrecompressedStaticFiles(directory=str(_STATIC_DIR)), name="static")
 
     mimetypes.add_type("application/manifest+json", ".webmanifest")
 
@@ -120,6 +157,8 @@ def create_app(title: str = "Authentik Helper") -> FastAPI:
     app.include_router(users.router)
     app.include_router(membership.router)
     app.include_router(invites.router)
+    app.include_router(mail.router)
+    app.include_router(events.router)
 
     # errors
     register_error_handlers(app)
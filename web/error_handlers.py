@@ -8,15 +8,23 @@ import httpx
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 
+from services.authentik import SwitchError
+from services.resilience import CircuitOpenError
+
 logger = logging.getLogger("authentik_helper.app")
 
 
-def _problem(status: int, detail: str, extra: Dict[str, Any] | None = None) -> JSONResponse:
+def _problem(
+    status: int,
+    detail: str,
+    extra: Dict[str, Any] | None = None,
+    headers: Dict[str, str] | None = None,
+) -> JSONResponse:
     # build a simple json error response
     body: Dict[str, Any] = {"detail": detail}
     if extra:
         body.update(extra)
-    return JSONResponse(status_code=status, content=body)
+    return JSONResponse(status_code=status, content=body, headers=headers)
 
 
 def register(app: FastAPI) -> None:
@@ -33,6 +41,35 @@ def register(app: FastAPI) -> None:
         )
         return _problem(500, "backend unavailable")
 
+    # a group move that did not complete; say what state the user was left in
+    @app.exception_handler(SwitchError)
+    async def _switch_error_handler(request: Request, exc: SwitchError) -> JSONResponse:
+        logger.error(
+            "switch_error",
+            extra={
+                "method": request.method,
+                "path": request.url.path,
+                "outcome": exc.outcome,
+                "error": str(exc),
+            },
+        )
+        return _problem(500, "backend unavailable", extra={"outcome": exc.outcome})
+
+    # fail fast while authentik's circuit is open (503 + Retry-After)
+    @app.exception_handler(CircuitOpenError)
+    async def _circuit_open_handler(request: Request, exc: CircuitOpenError) -> JSONResponse:
+        logger.warning(
+            "circuit_open",
+            extra={
+                "method": request.method,
+                "path": request.url.path,
+                "host": exc.host,
+                "retry_in": round(exc.retry_in, 1),
+            },
+        )
+        retry_after = str(max(1, int(exc.retry_in + 0.999)))
+        return _problem(503, "backend unavailable", headers={"Retry-After": retry_after})
+
     # handle transport errors from requests as bad gateway (502)
     @app.exception_handler(httpx.RequestError)
     async def _requests_error_handler(request: Request, exc: httpx.RequestError) -> JSONResponse:
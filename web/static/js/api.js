@@ -26,3 +26,36 @@ export async function apiFetch(path, options = {}) {
   }
   return body;
 }
+
+// POST/GET an ndjson endpoint and call onLine with each parsed line as it arrives
+export async function apiStream(path, options = {}, onLine = () => {}) {
+  const res = await fetch(path, { credentials: 'same-origin', ...options });
+  const ct = res.headers.get('content-type') || '';
+  if (!res.ok || !ct.includes('application/x-ndjson')) {
+    // errors come back as plain json; let apiFetch's checks explain them
+    if (ct.includes('application/json')) {
+      const body = await res.json().catch(() => null);
+      const detail = body && (body.detail || body.error || body.message);
+      const err = new Error(detail ? String(detail) : `http ${res.status}`);
+      err.status = res.status;
+      throw err;
+    }
+    throw new Error(`unexpected response ${res.status}`);
+  }
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buf = '';
+  for (;;) {
+    const { value, done } = await reader.read();
+    buf += decoder.decode(value || new Uint8Array(), { stream: !done });
+    let nl;
+    while ((nl = buf.indexOf('\n')) >= 0) {
+      const line = buf.slice(0, nl).trim();
+      buf = buf.slice(nl + 1);
+      if (line) onLine(JSON.parse(line));
+    }
+    if (done) break;
+  }
+  if (buf.trim()) onLine(JSON.parse(buf));
+}
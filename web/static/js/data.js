@@ -2,50 +2,156 @@
 
 import { apiFetch } from './api.js';
 import {
-  setGuestData, setMemberData, guestSelected, memberSelected, setGuestPage, setMembersPage
+  setGuestData, setMemberData, setGuestPage, setMembersPage, setGuestMeta, setMembersMeta,
+  guestPage, membersPage, guestPageSize, membersPageSize, guestSort, membersSort,
+  guestMeta, membersMeta
 } from './state.js';
 import { refreshTable } from './ui.js';
 
-export async function loadGuestUsers() {
-  const statusEl = document.getElementById('guest-status');
-  const titleEl  = document.getElementById('guest-title');
-  statusEl.textContent = 'loading…';
+// the server filters, sorts and pages; only the visible page is downloaded
+const LISTS = {
+  guest: {
+    path: '/guest-users', fallbackTitle: 'Guests', action: 'promote',
+    page: () => guestPage, size: () => guestPageSize, sort: () => guestSort, meta: () => guestMeta,
+    setData: setGuestData, setPage: setGuestPage, setMeta: setGuestMeta,
+  },
+  members: {
+    path: '/members-users', fallbackTitle: 'Members', action: 'demote',
+    page: () => membersPage, size: () => membersPageSize, sort: () => membersSort, meta: () => membersMeta,
+    setData: setMemberData, setPage: setMembersPage, setMeta: setMembersMeta,
+  },
+};
+
+// typing fires several loads; only the newest one may render
+const latest = { guest: 0, members: 0 };
 
-  const data = await apiFetch('/guest-users');
+// membership version of the rows on screen; lets a refresh skip rows that did not change
+const versions = { guest: null, members: null };
+const held = { guest: new Map(), members: new Map() };
 
-  titleEl.textContent = data.group_name || 'Guests';
-  const list = (Array.isArray(data.users) ? data.users : []).map(u => ({...u, __action: 'promote'}));
-  setGuestData(list);
+async function loadUsers(kind, refresh = false) {
+  const cfg = LISTS[kind];
+  const statusEl = document.getElementById(`${kind}-status`);
+  const titleEl  = document.getElementById(`${kind}-title`);
+  const q = (document.getElementById(`${kind}-filter`)?.value || '').trim();
+  const seq = ++latest[kind];
+  statusEl.textContent = 'loading…';
 
-  const existing = new Set(list.map(u => Number(u.pk)));
-  for (const pk of Array.from(guestSelected)) {
-    if (!existing.has(pk)) guestSelected.delete(pk);
+  const params = new URLSearchParams({
+    page: String(cfg.page()), page_size: String(cfg.size()), sort: cfg.sort(),
+  });
+  if (q) params.set('q', q);
+  if (refresh && versions[kind] && held[kind].size) {
+    // unchanged rows we already hold come back as { pk } only
+    params.set('since', versions[kind]);
+    params.set('have', Array.from(held[kind].keys()).join(','));
   }
+  const data = await apiFetch(`${cfg.path}?${params}`);
+  if (seq !== latest[kind]) return;
 
-  setGuestPage(1);
-  refreshTable('guest');
+  titleEl.textContent = data.group_name || cfg.fallbackTitle;
+  const rows = (Array.isArray(data.users) ? data.users : [])
+    .map(u => (Object.keys(u).length === 1 && held[kind].has(u.pk)) ? held[kind].get(u.pk) : u);
+  versions[kind] = data.version || null;
+  show(kind, rows, {
+    total: data.total ?? rows.length,
+    matched: data.matched ?? rows.length,
+    pages: data.pages ?? 1,
+  });
+  cfg.setPage(data.page || 1);
+  refreshTable(kind);
+  showCounts(kind, q);
+}
 
-  statusEl.textContent = list.length ? `loaded ${list.length} users.` : 'no users found.';
+function show(kind, rows, meta) {
+  const cfg = LISTS[kind];
+  held[kind] = new Map(rows.map(u => [u.pk, u]));
+  cfg.setData(rows.map(u => ({...u, __action: cfg.action})));
+  cfg.setMeta(meta);
 }
 
-export async function loadMemberUsers() {
-  const statusEl = document.getElementById('members-status');
-  const titleEl  = document.getElementById('members-title');
-  statusEl.textContent = 'loading…';
+function showCounts(kind, q) {
+  const { total, matched } = LISTS[kind].meta();
+  const statusEl = document.getElementById(`${kind}-status`);
+  if (!total) statusEl.textContent = 'no users found.';
+  else if (q) statusEl.textContent = `${matched} of ${total} users match.`;
+  else statusEl.textContent = `loaded ${total} users.`;
+}
 
-  const data = await apiFetch('/members-users');
+// the server's filter and sort, for rows that arrive as live events
+function matches(u, q) {
+  const needle = q.toLowerCase();
+  return !needle || [u.pk, u.username, u.email]
+    .some(v => v != null && String(v).toLowerCase().includes(needle));
+}
 
-  titleEl.textContent = data.group_name || 'Members';
-  const list = (Array.isArray(data.users) ? data.users : []).map(u => ({...u, __action: 'demote'}));
-  setMemberData(list);
+function compareRows(a, b, sort) {
+  const field = sort.replace(/^-/, '');
+  const key = (u) => field === 'pk' ? Number(u.pk) : String(u[field] ?? '').toLowerCase();
+  const ka = key(a), kb = key(b);
+  const c = ka < kb ? -1 : ka > kb ? 1 : Number(a.pk) - Number(b.pk);
+  return sort.startsWith('-') ? -c : c;
+}
+
+// a burst of events (a bulk run) becomes one small since/have refresh
+const refreshTimers = { guest: 0, members: 0 };
+function refreshSoon(kind) {
+  clearTimeout(refreshTimers[kind]);
+  refreshTimers[kind] = setTimeout(() => loadUsers(kind, true).catch(() => {}), 250);
+}
 
-  const existing = new Set(list.map(u => Number(u.pk)));
-  for (const pk of Array.from(memberSelected)) {
-    if (!existing.has(pk)) memberSelected.delete(pk);
+// apply a membership event ({ version, added, removed, changed } or { reset }) to the
+// visible page. only a single-page list can be patched exactly; anything that would
+// shift rows between pages is left to a refresh
+export function applyMembership(kind, ev) {
+  const cfg = LISTS[kind];
+  const current = versions[kind];
+  if (!current) return;  // the first load is still running and will include this
+  const [epoch, seq] = String(ev.version || '').split('.');
+  const [ourEpoch, ourSeq] = current.split('.');
+  if (epoch === ourEpoch && Number(seq) <= Number(ourSeq)) return;  // already on screen
+  const meta = cfg.meta();
+  if (ev.reset || epoch !== ourEpoch || meta.pages > 1) return refreshSoon(kind);
+
+  const q = (document.getElementById(`${kind}-filter`)?.value || '').trim();
+  const sort = cfg.sort();
+  const field = sort.replace(/^-/, '');
+  const rows = new Map(held[kind]);
+  let { total, matched } = meta;
+  let unsure = false;
+
+  for (const pk of ev.removed || []) {
+    if (rows.delete(pk)) { total -= 1; matched -= 1; }
+    else if (q) unsure = true;  // filtered out, or already gone: can't tell
+  }
+  for (const u of ev.added || []) {
+    if (rows.has(u.pk)) rows.set(u.pk, u);  // the load already had it
+    else if (matches(u, q)) { rows.set(u.pk, u); total += 1; matched += 1; }
+    else unsure = true;
   }
+  for (const u of ev.changed || []) {
+    const old = rows.get(u.pk);
+    if (old && matches(u, q) && String(old[field] ?? '') === String(u[field] ?? '')) rows.set(u.pk, u);
+    else if (old || matches(u, q)) unsure = true;
+  }
+  if (unsure || rows.size > cfg.size()) return refreshSoon(kind);
 
-  setMembersPage(1);
-  refreshTable('members');
+  show(kind, Array.from(rows.values()).sort((a, b) => compareRows(a, b, sort)), {
+    total, matched, pages: 1,
+  });
+  refreshTable(kind);
+  showCounts(kind, q);
+}
+
+export function loadGuestUsers() {
+  return loadUsers('guest');
+}
+
+export function loadMemberUsers() {
+  return loadUsers('members');
+}
 
-  statusEl.textContent = list.length ? `loaded ${list.length} users.` : 'no users found.';
+// after a promote or demote: same pages again, downloading only the rows that changed
+export function refreshUsers() {
+  return Promise.all([loadUsers('guest', true), loadUsers('members', true)]);
 }
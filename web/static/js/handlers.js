@@ -1,14 +1,15 @@
 // event wiring
 
-import { apiFetch } from './api.js';
+import { apiFetch, apiStream } from './api.js';
 import {
-  guestSelected, memberSelected,
+  guestSelected, memberSelected, bulkRunning,
   setGuestPage, setMembersPage,
   setGuestPageSize, setMembersPageSize,
+  guestSort, membersSort, setGuestSort, setMembersSort,
   PS_KEY_GUEST, PS_KEY_MEMBER, saveSize
 } from './state.js';
-import { debounce, getVisible, refreshTable, renderInviteResult } from './ui.js';
-import { loadGuestUsers, loadMemberUsers } from './data.js';
+import { debounce, getVisible, nextSort, refreshTable, renderInviteResult } from './ui.js';
+import { loadGuestUsers, loadMemberUsers, refreshUsers } from './data.js';
 
 const $ = (id) => document.getElementById(id);
 const str = (v) => String(v ?? '');
@@ -30,6 +31,68 @@ async function demoteOne(pk) {
   });
 }
 
+// the server takes at most this many pks per bulk request; bigger selections go in chunks
+const BULK_CHUNK = 200;
+
+// stream each chunk through the bulk endpoint; results collects one entry per user
+async function runBulk(action, pks, extra, results, onProgress) {
+  bulkRunning[action] += 1;
+  try {
+    for (let i = 0; i < pks.length; i += BULK_CHUNK) {
+      const chunk = pks.slice(i, i + BULK_CHUNK).map(Number);
+      await apiStream(`/${action}/bulk?format=ndjson`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ pks: chunk, ...extra }),
+      }, (line) => {
+        if (line.error) throw new Error(line.error);
+        if (line.done) return;
+        results.push(line);
+        onProgress();
+      });
+    }
+  } finally {
+    bulkRunning[action] -= 1;
+  }
+}
+
+const failureText = (r) => typeof r.detail === 'string' ? r.detail : JSON.stringify(r.detail);
+
+// promote or demote the selection, with running counts; failed users stay selected
+async function bulkAction(action, kind, selected, extra = {}) {
+  const pks = Array.from(selected);
+  const stem = action === 'promote' ? 'promot' : 'demot';
+  const status = `${kind}-status`;
+  const results = [];
+  setText(status, `${stem}ing ${pks.length}…`);
+
+  let error = null;
+  try {
+    await runBulk(action, pks, extra, results, () => {
+      const failed = results.filter(r => !r.ok).length;
+      setText(status, `${stem}ing… ${results.length}/${pks.length}${failed ? ` (${failed} failed)` : ''}`);
+    });
+  } catch (err) {
+    error = err;
+  }
+
+  const ok = results.filter(r => r.ok);
+  const failed = results.filter(r => !r.ok);
+  ok.forEach(r => selected.delete(str(r.pk)));
+  await refreshUsers().catch(() => {});
+
+  let msg = `${stem}ed ${ok.length} user${ok.length === 1 ? '' : 's'}`;
+  if (failed.length) msg += `, ${failed.length} failed and still selected (${failureText(failed[0])})`;
+  if (error) msg += `; stopped: ${String((error && error.message) || error)}`;
+  setText(status, msg);
+}
+
+// fetch the current page again (filter, sort or page changed)
+function reload(kind) {
+  const load = kind === 'guest' ? loadGuestUsers : loadMemberUsers;
+  return load().catch(err => setText(`${kind}-status`, `error: ${String((err && err.message) || err)}`));
+}
+
 export function wireHandlers() {
   // initial loads (run in parallel)
   window.addEventListener('load', () => {
@@ -39,13 +102,13 @@ export function wireHandlers() {
   // filters
   $('guest-filter')?.addEventListener('input', debounce(() => {
     setGuestPage(1);
-    refreshTable('guest');
-  }, 150));
+    reload('guest');
+  }, 250));
 
   $('members-filter')?.addEventListener('input', debounce(() => {
     setMembersPage(1);
-    refreshTable('members');
-  }, 150));
+    reload('members');
+  }, 250));
 
   // header select all (visible rows)
   $('guest-select-all')?.addEventListener('change', () => {
@@ -98,21 +161,11 @@ export function wireHandlers() {
   // bulk actions
   $('guest-promote-selected')?.addEventListener('click', async (e) => {
     e.preventDefault();
-    const pks = Array.from(guestSelected);
-    if (pks.length === 0) return;
-
-    const sendMail = !!$('promo-mail')?.checked;
+    if (guestSelected.size === 0) return;
     const btn = $('guest-promote-selected');
     btn.disabled = true;
-    setText('guest-status', `promoting ${pks.length}…`);
-
     try {
-      await Promise.all(pks.map(pk => promoteOne(pk, sendMail)));
-      guestSelected.clear();
-      await Promise.all([loadGuestUsers(), loadMemberUsers()]);
-      setText('guest-status', `promoted ${pks.length} user${pks.length === 1 ? '' : 's'}`);
-    } catch (err) {
-      setText('guest-status', `error: ${String((err && err.message) || err)}`);
+      await bulkAction('promote', 'guest', guestSelected, { send_mail: !!$('promo-mail')?.checked });
     } finally {
       btn.disabled = false;
       refreshTable('guest');
@@ -122,20 +175,11 @@ export function wireHandlers() {
 
   $('members-demote-selected')?.addEventListener('click', async (e) => {
     e.preventDefault();
-    const pks = Array.from(memberSelected);
-    if (pks.length === 0) return;
-
+    if (memberSelected.size === 0) return;
     const btn = $('members-demote-selected');
     btn.disabled = true;
-    setText('members-status', `demoting ${pks.length}…`);
-
     try {
-      await Promise.all(pks.map(pk => demoteOne(pk)));
-      memberSelected.clear();
-      await Promise.all([loadGuestUsers(), loadMemberUsers()]);
-      setText('members-status', `demoted ${pks.length} user${pks.length === 1 ? '' : 's'}`);
-    } catch (err) {
-      setText('members-status', `error: ${String((err && err.message) || err)}`);
+      await bulkAction('demote', 'members', memberSelected);
     } finally {
       btn.disabled = false;
       refreshTable('guest');
@@ -154,7 +198,23 @@ export function wireHandlers() {
       const kind = pagerBtn.getAttribute('data-kind');
       const page = Number(pagerBtn.getAttribute('data-page'));
       if (kind === 'guest') setGuestPage(page); else setMembersPage(page);
-      refreshTable(kind);
+      reload(kind);
+      return;
+    }
+
+    // sortable column headers
+    const th = target.closest('th[data-sort]');
+    if (th) {
+      const isGuestTable = th.closest('table')?.id === 'guest-users';
+      const field = th.getAttribute('data-sort');
+      if (isGuestTable) {
+        setGuestSort(nextSort(guestSort, field));
+        setGuestPage(1);
+      } else {
+        setMembersSort(nextSort(membersSort, field));
+        setMembersPage(1);
+      }
+      reload(isGuestTable ? 'guest' : 'members');
       return;
     }
 
@@ -185,8 +245,10 @@ export function wireHandlers() {
         else await demoteOne(pk);
 
         btn.textContent = (action === 'promote' ? 'Promoted' : 'Demoted') + ' ✓';
+        // the user left this list; a stale selection would fail the next bulk action
+        (action === 'promote' ? guestSelected : memberSelected).delete(pk);
 
-        await Promise.all([loadGuestUsers(), loadMemberUsers()]);
+        await refreshUsers();
 
         const targetStatus = action === 'promote' ? 'guest-status' : 'members-status';
         setText(targetStatus, action === 'promote' ? 'promoted 1 user' : 'demoted 1 user');
@@ -211,12 +273,12 @@ export function wireHandlers() {
       setGuestPageSize(val);
       saveSize(PS_KEY_GUEST, val);
       setGuestPage(1);
-      refreshTable('guest');
+      reload('guest');
     } else {
       setMembersPageSize(val);
       saveSize(PS_KEY_MEMBER, val);
       setMembersPage(1);
-      refreshTable('members');
+      reload('members');
     }
   });
 }
@@ -0,0 +1,51 @@
+// live updates from /events (server-sent events)
+
+import { applyMembership, refreshUsers } from './data.js';
+import { bulkRunning } from './state.js';
+
+const setText = (id, text) => { const el = document.getElementById(id); if (el) el.textContent = text; };
+
+// group uuid -> table kind, sent by the server in its hello
+let kinds = {};
+let connected = false;
+
+function onHello(data) {
+  kinds = Object.fromEntries(Object.entries(data.groups || {}).map(([kind, uuid]) => [uuid, kind]));
+  // a reconnect that could not resume may have missed changes; fetch only what differs
+  if (connected && !data.resumed) refreshUsers().catch(() => {});
+  connected = true;
+}
+
+function onMembership(data) {
+  // our own bulk run refreshes both lists when it ends
+  if (bulkRunning.promote || bulkRunning.demote) return;
+  const kind = kinds[data.group];
+  if (kind) applyMembership(kind, data);
+}
+
+function onBulk(data) {
+  if (bulkRunning[data.action]) return;  // ours; the page already shows its progress
+  const id = { promote: 'guest-status', demote: 'members-status', invite: 'invite-activity' }[data.action];
+  const verb = { promote: 'promoting', demote: 'demoting', invite: 'inviting' }[data.action];
+  if (!id) return;
+  if (data.state === 'running') setText(id, `${verb}… ${data.done}/${data.total}`);
+}
+
+function onInvite(data) {
+  const who = data.name || data.username || 'someone';
+  const when = data.expires_friendly ? `, valid until ${data.expires_friendly}` : '';
+  setText('invite-activity', `invitation created for ${who}${when}`);
+}
+
+const HANDLERS = { hello: onHello, membership: onMembership, bulk: onBulk, invite: onInvite };
+
+export function startLive() {
+  if (!('EventSource' in window)) return;
+  // EventSource reconnects by itself and sends Last-Event-ID so the server can replay
+  const source = new EventSource('/events');
+  for (const [name, fn] of Object.entries(HANDLERS)) {
+    source.addEventListener(name, (e) => {
+      try { fn(JSON.parse(e.data)); } catch (err) { console.error(err); }
+    });
+  }
+}
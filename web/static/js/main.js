@@ -1,5 +1,7 @@
 // entry point
 
 import { wireHandlers } from './handlers.js';
+import { startLive } from './live.js';
 
 wireHandlers();
+startLive();
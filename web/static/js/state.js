@@ -7,9 +7,19 @@ export const PS_KEY_MEMBER = 'pager:member:size';
 export const SIMPLE_NAV_MAX = 2;  // only prev and next when pages ≤ 2
 export const MAX_FULL_PAGES = 7;  // full numbers when pages ≤ 7, else truncate
 
-export let GUEST_DATA = [];
+export let GUEST_DATA = [];    // rows of the visible page only
 export let MEMBER_DATA = [];
 
+// server counts for the current filter: { total, matched, pages }
+export let guestMeta = { total: 0, matched: 0, pages: 1 };
+export let membersMeta = { total: 0, matched: 0, pages: 1 };
+
+export let guestSort = 'pk';    // column name, '-' prefix for descending
+export let membersSort = 'pk';
+
+// bulk runs started from this page; their live progress events are not shown twice
+export const bulkRunning = { promote: 0, demote: 0 };
+
 export const guestSelected = new Set();   // pk number
 export const memberSelected = new Set();
 
@@ -43,3 +53,7 @@ export function setGuestPage(n)           { guestPage = n; }
 export function setMembersPage(n)         { membersPage = n; }
 export function setGuestPageSize(n)       { guestPageSize = n; }
 export function setMembersPageSize(n)     { membersPageSize = n; }
+export function setGuestMeta(m)           { guestMeta = m; }
+export function setMembersMeta(m)         { membersMeta = m; }
+export function setGuestSort(s)           { guestSort = s; }
+export function setMembersSort(s)         { membersSort = s; }
@@ -1,4 +1,4 @@
-const CACHE = 'ak-helper-v8';
+const CACHE = 'ak-helper-v13';
 const PRECACHE = [
   '/',                 // app shell
   '/manifest.webmanifest',
@@ -45,6 +45,9 @@ self.addEventListener('fetch', (event) => {
   // Only handle same-origin
   if (url.origin !== location.origin) return;
 
+  // the live event stream never ends; leave it to the browser
+  if (url.pathname === '/events') return;
+
   // API must be fresh and bypass HTTP cache
   if (isApiRequest(url)) {
     event.respondWith(fetch(new Request(req, { cache: 'no-store' })));
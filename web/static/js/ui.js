@@ -1,4 +1,4 @@
-// ui logic: filtering, paging, renderers
+// ui logic: paging display, renderers
 
 import {
   PAGE_SIZE_PRESETS, SIMPLE_NAV_MAX, MAX_FULL_PAGES,
@@ -6,7 +6,8 @@ import {
   guestSelected, memberSelected,
   guestPage, membersPage,
   guestPageSize, membersPageSize,
-  setGuestPage, setMembersPage
+  guestMeta, membersMeta,
+  guestSort, membersSort
 } from './state.js';
 
 // debounce
@@ -15,36 +16,24 @@ export function debounce(fn, ms = 200) {
   return (...args) => { clearTimeout(t); t = setTimeout(() => fn(...args), ms); };
 }
 
-// filtering and paging
-export function filterUsers(list, q) {
-  const needle = (q || '').trim().toLowerCase();
-  if (!needle) return list;
-  return list.filter(u =>
-    [u.pk, u.username, u.email].some(v =>
-      String(v ?? '').toLowerCase().includes(needle)
-    )
-  );
+// the loaded page is what is visible; filtering and paging happen on the server
+export function getVisible(kind) {
+  return kind === 'guest' ? GUEST_DATA : MEMBER_DATA;
 }
 
-export function paginate(list, page, pageSize) {
-  const total = list.length;
-  const pages = Math.max(1, Math.ceil(total / pageSize));
-  const safePage = Math.min(Math.max(1, page), pages);
-  const start = (safePage - 1) * pageSize;
-  const end = start + pageSize;
-  const slice = list.slice(start, end);
-  return { slice, total, pages, page: safePage, start, end: Math.min(end, total) };
+// next sort for a header click: same column flips direction, a new one starts ascending
+export function nextSort(current, field) {
+  return current === field ? `-${field}` : field;
 }
 
-export function getVisible(kind) {
-  const isGuest = kind === 'guest';
-  const data = isGuest ? GUEST_DATA : MEMBER_DATA;
-  const q = document.getElementById(isGuest ? 'guest-filter' : 'members-filter')?.value || '';
-  const filtered = filterUsers(data, q);
-  const size = isGuest ? guestPageSize : membersPageSize;
-  const curPage = isGuest ? guestPage : membersPage;
-  const { slice } = paginate(filtered, curPage, size);
-  return slice;
+function renderSortHeaders(kind, sort) {
+  const table = document.getElementById(kind === 'guest' ? 'guest-users' : 'members-users');
+  if (!table) return;
+  const field = sort.replace(/^-/, '');
+  table.querySelectorAll('th[data-sort]').forEach(th => {
+    const active = th.getAttribute('data-sort') === field;
+    th.setAttribute('aria-sort', !active ? 'none' : sort.startsWith('-') ? 'descending' : 'ascending');
+  });
 }
 
 // renderers
@@ -214,19 +203,16 @@ export function renderInviteResult(payload) {
 // main refresh hook that ties it together
 export function refreshTable(kind) {
   const isGuest = kind === 'guest';
-  const data = isGuest ? GUEST_DATA : MEMBER_DATA;
-  const filterInput = document.getElementById(isGuest ? 'guest-filter' : 'members-filter');
+  const slice = getVisible(kind);
   const tbody = document.querySelector(isGuest ? '#guest-users tbody' : '#members-users tbody');
   const size = isGuest ? guestPageSize : membersPageSize;
-  const curPage = isGuest ? guestPage : membersPage;
-
-  const filtered = filterUsers(data, filterInput?.value || '');
-  const { slice, total, pages, page, start, end } = paginate(filtered, curPage, size);
-
-  if (isGuest) setGuestPage(page); else setMembersPage(page);
+  const page = isGuest ? guestPage : membersPage;
+  const { matched, pages } = isGuest ? guestMeta : membersMeta;
+  const start = (page - 1) * size;
 
   renderTable(tbody, slice, { kind });
-  renderPager(kind, total, page, pages, start, end);
+  renderPager(kind, matched, page, pages, start, start + slice.length);
+  renderSortHeaders(kind, isGuest ? guestSort : membersSort);
   updateHeaderSelectAll(kind);
   updateBulkButtons();
 }
@@ -0,0 +1,57 @@
+# web/static_files.py
+from __future__ import annotations
+
+import os
+from typing import Dict
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+from core.compression import EXTENSIONS, PREFERENCE, negotiate
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles that serves app.js.br / .zst / .gz next to app.js when the client
+    accepts that coding; the variants are written at build time by tools.precompress"""
+
+    def _variants(self, full_path: str) -> Dict[str, os.stat_result]:
+        try:
+            mtime = os.stat(full_path).st_mtime
+        except OSError:
+            return {}
+        found = {}
+        for coding in PREFERENCE:
+            try:
+                st = os.stat(full_path + EXTENSIONS[coding])
+            except OSError:
+                continue
+            # an older variant is left over from a previous build; never serve it
+            if st.st_mtime >= mtime:
+                found[coding] = st
+        return found
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        response = await super().get_response(path, scope)
+        if not isinstance(response, FileResponse) or response.status_code != 200:
+            return response
+        request_headers = Headers(scope=scope)
+        full_path = str(response.path)
+        found = await anyio.to_thread.run_sync(self._variants, full_path)
+        if not found:
+            return response
+        response.headers["vary"] = "Accept-Encoding"
+        coding = negotiate(request_headers.get("accept-encoding", ""), tuple(found))
+        if coding is None:
+            return response
+        compressed = FileResponse(
+            full_path + EXTENSIONS[coding],
+            stat_result=found[coding],
+            media_type=response.media_type,
+            headers={"content-encoding": coding, "vary": "Accept-Encoding"},
+        )
+        if self.is_not_modified(compressed.headers, request_headers):
+            return NotModifiedResponse(compressed.headers)
+        return compressed